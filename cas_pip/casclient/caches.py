@@ -0,0 +1,279 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+def getDefaultCacheDirectory():
+    cacheHome = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(cacheHome, "cas_pip")
+
+
+def _openDatabase(path: str):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None, timeout = 30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class HashCache:
+    """SQLite cache of file sha256 keyed by real path and stat metadata (size, mtime, inode, device).
+    Entry is used only when metadata still matches, least recently used entries are evicted over maxEntries.
+    Files modified within racyWindow seconds (like just downloaded packages) are hashed but not cached"""
+    # Files modified so recently can still change without mtime change, they are not cached
+    racyWindow = 2.0
+    evictEvery = 256
+
+    def __init__(self, path: str = None, maxEntries: int = 100000):
+        if(path == None):
+            path = os.path.join(getDefaultCacheDirectory(), "hashes.sqlite")
+        self.path = path
+        self.maxEntries = maxEntries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._connection = _openDatabase(path)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS hashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            device INTEGER NOT NULL,
+            hash TEXT NOT NULL,
+            lastUsed REAL NOT NULL
+        )""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS hashesLastUsed ON hashes(lastUsed)")
+
+    @staticmethod
+    def statKey(stat: os.stat_result):
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev)
+
+    def _key(self, filePath: str):
+        return os.path.realpath(filePath)
+
+    def get(self, filePath: str, stat: os.stat_result = None) -> Optional[Tuple[str, int]]:
+        if(stat == None):
+            stat = os.stat(filePath)
+        key = self._key(filePath)
+        with self._lock:
+            row = self._connection.execute("SELECT size, mtime, inode, device, hash FROM hashes WHERE path = ?", (key, )).fetchone()
+            if(row == None):
+                return None
+            if(row[:4] != self.statKey(stat)):
+                self._connection.execute("DELETE FROM hashes WHERE path = ?", (key, ))
+                return None
+            self._connection.execute("UPDATE hashes SET lastUsed = ? WHERE path = ?", (time.time(), key))
+            return row[4], row[0]
+
+    def put(self, filePath: str, hash: str, stat: os.stat_result):
+        if(time.time() - stat.st_mtime < self.racyWindow):
+            return False
+        key = self._key(filePath)
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO hashes (path, size, mtime, inode, device, hash, lastUsed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, stat.st_size, stat.st_mtime_ns, stat.st_ino, stat.st_dev, hash, time.time()))
+            self._puts = self._puts + 1
+            if(self._puts % self.evictEvery == 0):
+                self._evict()
+        return True
+
+    def _evict(self):
+        count = self._connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        if(count > self.maxEntries):
+            self._connection.execute("DELETE FROM hashes WHERE path IN (SELECT path FROM hashes ORDER BY lastUsed ASC LIMIT ?)", (count - self.maxEntries, ))
+
+    def invalidate(self, filePath: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM hashes WHERE path = ?", (self._key(filePath), ))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM hashes")
+
+    def close(self):
+        with self._lock:
+            if(self._connection != None):
+                self._evict()
+                self._connection.close()
+                self._connection = None
+
+
+class SqliteResultBackend:
+    """Persistent storage of authentication results shared between runs"""
+    purgeEvery = 256
+
+    def __init__(self, path: str = None):
+        if(path == None):
+            path = os.path.join(getDefaultCacheDirectory(), "results.sqlite")
+        self.path = path
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._connection = _openDatabase(path)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS results (
+            signer TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            value TEXT,
+            expires REAL NOT NULL,
+            PRIMARY KEY (signer, hash)
+        )""")
+
+    def get(self, signerId: str, hash: str) -> Optional[Tuple[Optional[str], float]]:
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires FROM results WHERE signer = ? AND hash = ?", (signerId, hash)).fetchone()
+        if(row == None or row[1] < time.time()):
+            return None
+        return row[0], row[1]
+
+    def put(self, signerId: str, hash: str, value: Optional[str], expires: float):
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO results (signer, hash, value, expires) VALUES (?, ?, ?, ?)", (signerId, hash, value, expires))
+            self._puts = self._puts + 1
+            if(self._puts % self.purgeEvery == 0):
+                self._connection.execute("DELETE FROM results WHERE expires < ?", (time.time(), ))
+
+    def invalidate(self, signerId: str, hash: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM results WHERE signer = ? AND hash = ?", (signerId, hash))
+
+    def close(self):
+        with self._lock:
+            if(self._connection != None):
+                self._connection.execute("DELETE FROM results WHERE expires < ?", (time.time(), ))
+                self._connection.close()
+                self._connection = None
+
+
+class ResultCache:
+    """LRU cache of authentication results keyed by (signerId, hash), optionally backed by persistent backend.
+    Values are serialized artifacts, None stands for not notarized hash.
+    Found artifacts are kept for ttl seconds, not notarized hashes for negativeTtl seconds"""
+    def __init__(self, ttl: float = 300, negativeTtl: float = 0, maxEntries: int = 10000, backend: SqliteResultBackend = None):
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.maxEntries = maxEntries
+        self.backend = backend
+        self._entries = OrderedDict()
+
+    def get(self, signerId: str, hash: str) -> Tuple[bool, Optional[str]]:
+        key = (signerId, hash)
+        entry = self._entries.get(key, None)
+        if(entry != None):
+            if(entry[1] >= time.time()):
+                self._entries.move_to_end(key)
+                return True, entry[0]
+            del self._entries[key]
+        if(self.backend):
+            stored = self.backend.get(signerId, hash)
+            if(stored != None):
+                self._remember(key, stored[0], stored[1])
+                return True, stored[0]
+        return False, None
+
+    def put(self, signerId: str, hash: str, value: Optional[str]):
+        ttl = self.ttl if value != None else self.negativeTtl
+        if(ttl <= 0):
+            return
+        expires = time.time() + ttl
+        self._remember((signerId, hash), value, expires)
+        if(self.backend):
+            self.backend.put(signerId, hash, value, expires)
+
+    def _remember(self, key, value: Optional[str], expires: float):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while(len(self._entries) > self.maxEntries):
+            self._entries.popitem(last = False)
+
+    def invalidate(self, signerId: str, hash: str):
+        self._entries.pop((signerId, hash), None)
+        if(self.backend):
+            self.backend.invalidate(signerId, hash)
+
+    def close(self):
+        if(self.backend):
+            self.backend.close()
+
+
+class OfflineIndex:
+    """SQLite index of artifacts notarized by signers, for authentication without access to ledger.
+    Artifacts are kept in table clustered by (signer, hash), so every lookup is single B-tree search.
+    Index of signer is complete up to transaction returned by syncedTx, later syncs add only newer records.
+    Database is memory-mapped up to mmapSize bytes, so lookups read pages without copying them through read calls"""
+    mmapSize = 256 << 20
+
+    def __init__(self, path: str = None):
+        if(path == None):
+            path = os.path.join(getDefaultCacheDirectory(), "index.sqlite")
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = _openDatabase(path)
+        self._connection.execute(f"PRAGMA mmap_size={int(self.mmapSize)}")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS artifacts (
+            signer TEXT NOT NULL,
+            hash TEXT NOT NULL,
+            value BLOB NOT NULL,
+            txId INTEGER NOT NULL,
+            PRIMARY KEY (signer, hash)
+        ) WITHOUT ROWID""")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS syncs (
+            signer TEXT PRIMARY KEY,
+            txId INTEGER NOT NULL,
+            synced REAL NOT NULL,
+            cursorKey BLOB,
+            cursorScore REAL,
+            cursorAtTx INTEGER
+        )""")
+
+    def syncedTx(self, signerId: str) -> int:
+        """Transaction up to which index of signer is complete, 0 when it was never synced"""
+        with self._lock:
+            row = self._connection.execute("SELECT txId FROM syncs WHERE signer = ?", (signerId, )).fetchone()
+        return row[0] if row != None else 0
+
+    def syncCursor(self, signerId: str) -> Optional[Tuple[bytes, float, int]]:
+        """(key, score, atTx) of last read member of signer insertion set, None when it isn't known"""
+        with self._lock:
+            row = self._connection.execute("SELECT cursorKey, cursorScore, cursorAtTx FROM syncs WHERE signer = ?", (signerId, )).fetchone()
+        if(row == None or row[0] == None):
+            return None
+        return row[0], row[1], row[2]
+
+    def put(self, signerId: str, records: List[Tuple[str, bytes, int]]):
+        """Stores (hash, value, txId) records in one transaction, record older than stored one is ignored"""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+            try:
+                connection.executemany("""INSERT INTO artifacts (signer, hash, value, txId) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (signer, hash) DO UPDATE SET value = excluded.value, txId = excluded.txId WHERE excluded.txId > artifacts.txId""",
+                    [(signerId, hash, value, txId) for hash, value, txId in records])
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def finishSync(self, signerId: str, txId: int, cursor: Tuple[bytes, float, int] = None):
+        """Marks index of signer complete up to txId, cursor is kept for next sync when it's newer than stored one"""
+        cursorKey, cursorScore, cursorAtTx = cursor if cursor != None else (None, None, None)
+        with self._lock:
+            self._connection.execute("""INSERT INTO syncs (signer, txId, synced, cursorKey, cursorScore, cursorAtTx) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (signer) DO UPDATE SET synced = excluded.synced,
+                    cursorKey = CASE WHEN excluded.txId >= txId AND excluded.cursorKey IS NOT NULL THEN excluded.cursorKey ELSE cursorKey END,
+                    cursorScore = CASE WHEN excluded.txId >= txId AND excluded.cursorKey IS NOT NULL THEN excluded.cursorScore ELSE cursorScore END,
+                    cursorAtTx = CASE WHEN excluded.txId >= txId AND excluded.cursorKey IS NOT NULL THEN excluded.cursorAtTx ELSE cursorAtTx END,
+                    txId = MAX(txId, excluded.txId)""", (signerId, txId, time.time(), cursorKey, cursorScore, cursorAtTx))
+
+    def get(self, signerId: str, hash: str) -> Optional[bytes]:
+        """Ledger value of artifact, None when it isn't in index"""
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM artifacts WHERE signer = ? AND hash = ?", (signerId, hash)).fetchone()
+        return row[0] if row != None else None
+
+    def close(self):
+        with self._lock:
+            if(self._connection != None):
+                self._connection.close()
+                self._connection = None
@@ -1,18 +1,33 @@
 import logging
-import aiofiles
+import asyncio
 from pip import __version__ as pipVersion
 from pip._internal.cli.main import main as _main
 import hashlib
-from typing import Union, Dict, Optional, List
+from typing import Union, Dict, Optional, List, Tuple, AsyncIterator
 from enum import Enum
 from pydantic import BaseModel, Field
 import datetime
 import grpc
 import pytz
+from google.protobuf import empty_pb2
 import mimetypes
 from cas_pip.models import schema_pb2
 from ..models import lc_pb2_grpc
 import base64
+import os
+from .caches import HashCache, ResultCache, OfflineIndex
+from .hashing import HashingPool, defaultBufferSize
+from .downloader import StreamingDownload, ShardedPipDownload, pipDownloadArgs, runPip
+from .requirements import parseRequirementsFile
+from .wheelhouse import Wheelhouse, WheelhouseDownload
+from .index import IndexFile, SimpleIndexClient, defaultIndexUrl, resolveRequirements, hashUrl
+from .codec import ModelCodec, loads as codecLoads
+from .retry import RetryPolicy, RetryMetrics, asyncCallWithRetry, callWithRetry, noRetryPolicy
+from .hedging import HedgePolicy, hedgedCall
+from .proofs import ProofVerifier, ProofVerificationError, TrustedState
+from .scheduler import TaskScheduler
+
+logger = logging.getLogger("cas_pip.casclient")
 
 class ArtifactType(Enum):
     Direct = 0
@@ -52,6 +67,59 @@ class Artifact(BaseModel):
     PublicKey: Optional[str]
     Verbose: bool = None
 
+artifactCodec = ModelCodec(Artifact)
+# Stays well under default 4 MiB gRPC message limit
+defaultMaxBatchBytes = 3 * 1024 * 1024
+
+
+class VerificationResult:
+    """Compact authentication result with hash, name, status, signer and timestamp of notarized artifact.
+    Keeps ledger value, full Artifact is decoded from it on first access of artifact.
+    txId is ledger transaction of value when it's known"""
+    __slots__ = ("hash", "name", "status", "signer", "timestamp", "txId", "_value", "_artifact")
+
+    def __init__(self, hash: str, name: str, status: ArtifactStatus, signer: Optional[str], timestamp: datetime.datetime, value: Union[bytes, str] = None, artifact: Artifact = None, txId: int = None):
+        self.hash = hash
+        self.name = name
+        self.status = status
+        self.signer = signer
+        self.timestamp = timestamp
+        self.txId = txId
+        self._value = value
+        self._artifact = artifact
+
+    @classmethod
+    def fromArtifact(cls, artifact: Artifact, value: Union[bytes, str] = None, txId: int = None):
+        return cls(artifact.hash, artifact.name, artifact.status, artifact.signer, artifact.timestamp, value, artifact, txId)
+
+    @classmethod
+    def fromValue(cls, value: Union[bytes, str], txId: int = None):
+        """Reads only needed fields of ledger value, values which aren't plain are decoded as whole Artifact"""
+        try:
+            data = codecLoads(value)
+            if(type(data["hash"]) is not str or type(data["name"]) is not str):
+                return cls.fromArtifact(artifactCodec.decode(value), value, txId)
+            return cls(data["hash"], data["name"], ArtifactStatus(data["status"]), data.get("signer", None), datetime.datetime.fromisoformat(data["timestamp"]), value, txId = txId)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return cls.fromArtifact(artifactCodec.decode(value), value, txId)
+
+    @property
+    def value(self) -> Union[bytes, str]:
+        """Ledger value of artifact"""
+        if(self._value == None):
+            return artifactCodec.encode(self._artifact)
+        return self._value
+
+    @property
+    def artifact(self) -> Artifact:
+        if(self._artifact == None):
+            self._artifact = artifactCodec.decode(self._value)
+            self._value = None
+        return self._artifact
+
+    def __repr__(self):
+        return f"VerificationResult(hash={self.hash!r}, name={self.name!r}, status={self.status}, signer={self.signer!r}, timestamp={self.timestamp!r})"
+
 class ArtifactList(BaseModel):
     statuses: Dict[str, Artifact]
 
@@ -69,11 +137,106 @@ class TransactionReturn(BaseModel):
     version: int
 
 
+# Sorted set of signer artifact keys scored by time they were written, maintained by CAS server
+insertionSetPrefix = "_INDEX.ITEM.INSERTION-DATE."
+
+
+class ArtifactListingError(Exception):
+    pass
+
+
+def isNotFoundError(details: str):
+    return details != None and "not found" in details.lower()
+
+
+defaultChannelOptions = [
+    # Each channel of the pool keeps own connection instead of shared global subchannel
+    ("grpc.use_local_subchannel_pool", 1),
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0)
+]
+
 class GRPCClient:
-    def __init__(self, path: str = "cas.codenotary.com", api_key: str = None):
+    def __init__(self, path: str = "cas.codenotary.com", api_key: str = None, poolSize: int = 1, channelOptions: List = None, retryPolicy: RetryPolicy = None, callTimeout: float = None, hedgePolicy: HedgePolicy = None, proofVerifier: ProofVerifier = None, retryWrites: bool = False):
         self.path = path
         self.api_key = api_key
         self.signerId = api_key.split(".")[0]
+        self.poolSize = max(1, poolSize)
+        self.channelOptions = channelOptions if channelOptions != None else defaultChannelOptions
+        self._asyncChannels = []
+        self._asyncStubs = []
+        self._asyncNext = 0
+        self._channel = None
+        self._stub = None
+        self.overloadCount = 0
+        self.retryPolicy = retryPolicy if retryPolicy != None else noRetryPolicy
+        self.retryMetrics = RetryMetrics()
+        # Writes aren't idempotent, attempt which timed out after server committed it would notarize artifacts again
+        self.retryWrites = retryWrites
+        # Deadline of every attempt in seconds, None waits forever
+        self.callTimeout = callTimeout
+        # Hedges reads, None disables hedging
+        self.hedgePolicy = hedgePolicy
+        # Verifies proofs of read entries, None trusts server
+        self.proofVerifier = proofVerifier
+        self._stateRequested = False
+        self._stateLock = None
+
+    def _rpcErrorDetails(self, error: grpc.RpcError):
+        if(error.code() == grpc.StatusCode.RESOURCE_EXHAUSTED):
+            self.overloadCount = self.overloadCount + 1
+        return error.details()
+
+    def getOverloadCount(self):
+        return self.overloadCount
+
+    async def _asyncCall(self, method: str, call, idempotent: bool = False):
+        """Calls call(stub) with next pooled stub, failed attempts of idempotent calls are retried by retry policy on next stubs
+        and hedged by hedge policy. Other calls are retried only when retryWrites is set"""
+        attempt = lambda: call(self._getAsyncStub())
+        if(idempotent and self.hedgePolicy != None):
+            return await asyncCallWithRetry(self.retryPolicy, self.retryMetrics, method, lambda: hedgedCall(self.hedgePolicy, method, attempt))
+        return await asyncCallWithRetry(self._policyFor(idempotent), self.retryMetrics, method, attempt)
+
+    def _call(self, method: str, call, idempotent: bool = False):
+        return callWithRetry(self._policyFor(idempotent), self.retryMetrics, method, lambda: call(self._getStub()))
+
+    def _policyFor(self, idempotent: bool):
+        return self.retryPolicy if idempotent or self.retryWrites else noRetryPolicy
+
+    def _getAsyncStub(self):
+        # Channels are created lazily on first use and reused by next calls (round-robin over pool)
+        if(len(self._asyncStubs) < self.poolSize):
+            channel = grpc.aio.secure_channel(self.path, grpc.ssl_channel_credentials(), options = self.channelOptions)
+            self._asyncChannels.append(channel)
+            self._asyncStubs.append(lc_pb2_grpc.LcServiceStub(channel))
+            return self._asyncStubs[-1]
+        stub = self._asyncStubs[self._asyncNext]
+        self._asyncNext = (self._asyncNext + 1) % len(self._asyncStubs)
+        return stub
+
+    def _getStub(self):
+        if(self._stub == None):
+            self._channel = grpc.secure_channel(self.path, grpc.ssl_channel_credentials(), options = self.channelOptions)
+            self._stub = lc_pb2_grpc.LcServiceStub(self._channel)
+        return self._stub
+
+    async def asyncClose(self):
+        channels = self._asyncChannels
+        self._asyncChannels = []
+        self._asyncStubs = []
+        self._asyncNext = 0
+        for channel in channels:
+            await channel.close()
+        self.close()
+
+    def close(self):
+        if(self._channel != None):
+            self._channel.close()
+        self._channel = None
+        self._stub = None
 
     def _getSigningMetas(self):
         return [
@@ -86,114 +249,206 @@ class GRPCClient:
             ("plugin-type", "vcn")
         ]
 
-    async def asyncNotarizeArtifact(self, *artifactsToSign: List[Artifact]):
-        async with grpc.aio.secure_channel(self.path, grpc.ssl_channel_credentials()) as channel:
-            stub = lc_pb2_grpc.LcServiceStub(channel)
-            artifacts = []
-            for artifact in artifactsToSign:
-                if(artifact.signer == None):
-                    artifact.signer = self.signerId
-                vcndep = lc_pb2_grpc.lc__pb2.VCNDependency(hash=artifact.hash, type=ArtifactType.Direct.value)
-                artifact = lc_pb2_grpc.lc__pb2.VCNArtifact(
-                    dependencies=[vcndep],
-                    artifact=artifact.json().encode("utf-8")
-                )
-                artifacts.append(artifact)
-            req = lc_pb2_grpc.lc__pb2.VCNArtifactsRequest(artifacts=artifacts)
-            try:
-                metas = self._getSigningMetas()
-                response = await stub.VCNSetArtifacts(req, metadata=metas)
-                toRet = TransactionReturn(
-                    id = response.transaction.id,
-                    prevAlh = response.transaction.prevAlh,
-                    ts = response.transaction.ts,
-                    nentries= response.transaction.nentries,
-                    eH = response.transaction.eH,
-                    blTxId = response.transaction.blTxId,
-                    blRoot = response.transaction.blRoot,
-                    version = response.transaction.version
-                )
-                return True, toRet
-            except grpc.RpcError as e:
-                return False, e.details()
+    def _buildArtifactsRequest(self, artifactsToSign: List[Artifact]):
+        artifacts = []
+        for artifact in artifactsToSign:
+            if(artifact.signer == None):
+                artifact.signer = self.signerId
+            vcndep = lc_pb2_grpc.lc__pb2.VCNDependency(hash=artifact.hash, type=ArtifactType.Direct.value)
+            artifact = lc_pb2_grpc.lc__pb2.VCNArtifact(
+                dependencies=[vcndep],
+                artifact=artifactCodec.encode(artifact)
+            )
+            artifacts.append(artifact)
+        return lc_pb2_grpc.lc__pb2.VCNArtifactsRequest(artifacts=artifacts)
 
-    async def asyncAuthorizeArtifact(self, artifact: ArtifactAuthorizationRequest):
+    def _buildTransactionReturn(self, response):
+        return TransactionReturn(
+            id = response.transaction.id,
+            prevAlh = response.transaction.prevAlh,
+            ts = response.transaction.ts,
+            nentries= response.transaction.nentries,
+            eH = response.transaction.eH,
+            blTxId = response.transaction.blTxId,
+            blRoot = response.transaction.blRoot,
+            version = response.transaction.version
+        )
+
+    def _buildVerifiableGet(self, artifact: ArtifactAuthorizationRequest):
         if(artifact.signer == None):
             artifact.signer = self.signerId
-        async with grpc.aio.secure_channel(self.path, grpc.ssl_channel_credentials()) as channel:
-            stub = lc_pb2_grpc.LcServiceStub(channel)
-            keyRequest = schema_pb2.KeyRequest(
-                key = self._getKeyForArtifact(artifact),
-                atTx = 0
-            )
-            verfiableGet = schema_pb2.VerifiableGetRequest(
-                keyRequest = keyRequest
-            )
-            try:
-                metas = self._getReadingMetas()
-                response = await stub.VerifiableGetExt(verfiableGet, metadata=metas)
-                toRet = Artifact.parse_raw(response.item.entry.value)
-                return True, toRet
-            except grpc.RpcError as e:
-                return False, e.details()
+        keyRequest = schema_pb2.KeyRequest(
+            key = self._getKeyForArtifact(artifact),
+            atTx = 0
+        )
+        return schema_pb2.VerifiableGetRequest(
+            keyRequest = keyRequest,
+            proveSinceTx = self.proofVerifier.state.txId if self.proofVerifier else 0
+        )
+
+    async def asyncNotarizeArtifact(self, *artifactsToSign: List[Artifact]):
+        req = self._buildArtifactsRequest(artifactsToSign)
+        try:
+            metas = self._getSigningMetas()
+            response = await self._asyncCall("VCNSetArtifacts", lambda stub: stub.VCNSetArtifacts(req, metadata=metas, timeout=self.callTimeout))
+            return True, self._buildTransactionReturn(response)
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
+
+    async def asyncCurrentState(self):
+        try:
+            metas = self._getReadingMetas()
+            response = await self._asyncCall("CurrentState", lambda stub: stub.CurrentState(empty_pb2.Empty(), metadata=metas, timeout=self.callTimeout), idempotent = True)
+            return True, TrustedState(db = response.db, txId = response.txId, txHash = response.txHash)
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
+
+    async def _ensureTrustedState(self):
+        """Reads current state of server once per client to learn its database and loads state stored for it.
+        Without stored or given state, current state is trusted so that all reads are proven against it"""
+        if(self.proofVerifier == None or self._stateRequested):
+            return
+        if(self._stateLock == None):
+            self._stateLock = asyncio.Lock()
+        async with self._stateLock:
+            if(self._stateRequested):
+                return
+            status, state = await self.asyncCurrentState()
+            if(status):
+                self.proofVerifier.load(self.path, state.db)
+                self.proofVerifier.trust(state)
+            else:
+                self.proofVerifier.load(self.path)
+                if(self.proofVerifier.state.txId == 0):
+                    logger.warning("Can't read current state of ledger, first response will be trusted: " + str(state))
+            self._stateRequested = True
+
+    async def asyncGetArtifactValue(self, artifact: ArtifactAuthorizationRequest):
+        """Returns raw ledger value (JSON encoded Artifact) of artifact"""
+        await self._ensureTrustedState()
+        trustedState = self.proofVerifier.state if self.proofVerifier else None
+        verfiableGet = self._buildVerifiableGet(artifact)
+        try:
+            metas = self._getReadingMetas()
+            response = await self._asyncCall("VerifiableGetExt", lambda stub: stub.VerifiableGetExt(verfiableGet, metadata=metas, timeout=self.callTimeout), idempotent = True)
+            if(self.proofVerifier):
+                self.proofVerifier.verify(response, verfiableGet.keyRequest.key, trustedState)
+            return True, response.item.entry.value
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
+        except ProofVerificationError as e:
+            return False, "Proof verification failed: " + str(e)
+
+    async def asyncAuthorizeArtifact(self, artifact: ArtifactAuthorizationRequest):
+        status, value = await self.asyncGetArtifactValue(artifact)
+        if(status):
+            return True, artifactCodec.decode(value)
+        return False, value
+
+    async def asyncGetArtifactValues(self, *artifacts: List[ArtifactAuthorizationRequest]):
+        """Reads raw ledger values of many artifacts with single VerifiableGetExtMulti call.
+        Returns list with value or None (not notarized) for every requested artifact,
+        fails when server reports other error than not found for any of them"""
+        await self._ensureTrustedState()
+        trustedState = self.proofVerifier.state if self.proofVerifier else None
+        requests = [self._buildVerifiableGet(artifact) for artifact in artifacts]
+        multiRequest = lc_pb2_grpc.lc__pb2.VerifiableGetExtMultiRequest(requests = requests)
+        try:
+            metas = self._getReadingMetas()
+            response = await self._asyncCall("VerifiableGetExtMulti", lambda stub: stub.VerifiableGetExtMulti(multiRequest, metadata=metas, timeout=self.callTimeout), idempotent = True)
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
+        # Errors are reported per request, not found artifact is only one which isn't failure
+        errors = list(response.errors)
+        failed = []
+        for index, error in enumerate(errors):
+            if(not error or isNotFoundError(error)):
+                continue
+            key = requests[index].keyRequest.key.decode("utf-8", errors = "replace") if len(errors) == len(requests) else "?"
+            logger.error(f"Reading of {key} failed: {error}")
+            failed.append(f"{key}: {error}")
+        if(failed):
+            return False, f"Reading of {len(failed)} of {len(requests)} keys failed: " + "; ".join(failed)
+        # Entries are matched to requests and proven against key built from requested signer and hash,
+        # so entry of other key can't be returned as requested artifact
+        requestedKeys = {request.keyRequest.key: request.keyRequest.key for request in requests}
+        found = dict()
+        for item in response.items:
+            if(item.item.entry.value):
+                key = requestedKeys.get(item.item.entry.key, None)
+                if(key == None):
+                    return False, "Ledger returned entry that wasn't requested: " + item.item.entry.key.decode("utf-8", errors = "replace")
+                if(self.proofVerifier):
+                    try:
+                        self.proofVerifier.verify(item, key, trustedState)
+                    except ProofVerificationError as e:
+                        return False, "Proof verification failed: " + str(e)
+                found[key] = item.item.entry.value
+        return True, [found.get(request.keyRequest.key, None) for request in requests]
+
+    async def asyncAuthorizeArtifacts(self, *artifacts: List[ArtifactAuthorizationRequest]):
+        """Authorizes many artifacts with single VerifiableGetExtMulti call.
+        Returns list with Artifact or None (not notarized) for every requested artifact"""
+        status, values = await self.asyncGetArtifactValues(*artifacts)
+        if(not status):
+            return False, values
+        return True, [artifactCodec.decode(value) if value != None else None for value in values]
+
+    async def asyncScanArtifacts(self, keyPrefix: bytes, seekKey: bytes = b"", limit: int = 1000, indexedTx: int = 0):
+        """Returns page of up to limit ledger entries with keys starting with keyPrefix, ordered by key after seekKey.
+        Server answers once its index covers transaction indexedTx"""
+        request = schema_pb2.ScanRequest(seekKey = seekKey, prefix = keyPrefix, desc = False, limit = limit, sinceTx = indexedTx)
+        try:
+            metas = self._getReadingMetas()
+            response = await self._asyncCall("Scan", lambda stub: stub.Scan(request, metadata=metas, timeout=self.callTimeout), idempotent = True)
+            return True, list(response.entries)
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
+
+    async def asyncScanSortedSet(self, setName: bytes, seek: Tuple[bytes, float, int] = None, limit: int = 1000, desc: bool = False, indexedTx: int = 0):
+        """Returns page of up to limit members of sorted set ordered by score, after seek (key, score, atTx) member when given.
+        Server answers once its index covers transaction indexedTx"""
+        request = schema_pb2.ZScanRequest(set = setName, limit = limit, desc = desc, sinceTx = indexedTx)
+        if(seek != None):
+            request.seekKey, request.seekScore, request.seekAtTx = seek
+            request.inclusiveSeek = False
+        try:
+            metas = self._getReadingMetas()
+            response = await self._asyncCall("ZScanExt", lambda stub: stub.ZScanExt(request, metadata=metas, timeout=self.callTimeout), idempotent = True)
+            return True, [item.item for item in response.items]
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
 
     def notarizeArtifact(self, *artifactsToSign: List[Artifact]):
-        with grpc.secure_channel(self.path, grpc.ssl_channel_credentials()) as channel:
-            stub = lc_pb2_grpc.LcServiceStub(channel)
-            artifacts = []
-            for artifact in artifactsToSign:
-                if(artifact.signer == None):
-                    artifact.signer = self.signerId
-                vcndep = lc_pb2_grpc.lc__pb2.VCNDependency(hash=artifact.hash, type=ArtifactType.Direct.value)
-                artifact = lc_pb2_grpc.lc__pb2.VCNArtifact(
-                    dependencies=[vcndep],
-                    artifact=artifact.json().encode("utf-8")
-                )
-                artifacts.append(artifact)
-            req = lc_pb2_grpc.lc__pb2.VCNArtifactsRequest(artifacts=artifacts)
-            try:
-                metas = self._getSigningMetas()
-                response = stub.VCNSetArtifacts(req, metadata=metas)
-                toRet = TransactionReturn(
-                    id = response.transaction.id,
-                    prevAlh = response.transaction.prevAlh,
-                    ts = response.transaction.ts,
-                    nentries= response.transaction.nentries,
-                    eH = response.transaction.eH,
-                    blTxId = response.transaction.blTxId,
-                    blRoot = response.transaction.blRoot,
-                    version = response.transaction.version
-                )
-                return True, toRet
-            except grpc.RpcError as e:
-                return False, e.details()
+        req = self._buildArtifactsRequest(artifactsToSign)
+        try:
+            metas = self._getSigningMetas()
+            response = self._call("VCNSetArtifacts", lambda stub: stub.VCNSetArtifacts(req, metadata=metas, timeout=self.callTimeout))
+            return True, self._buildTransactionReturn(response)
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
 
     def _getKeyForArtifact(self, artifact: ArtifactAuthorizationRequest):
         what = f"vcn.{artifact.signer}.{artifact.hash}"
         return what.encode("utf-8")
 
     def authorizeArtifact(self, artifact: ArtifactAuthorizationRequest):
-        if(artifact.signer == None):
-            artifact.signer = self.signerId
-        with grpc.secure_channel(self.path, grpc.ssl_channel_credentials()) as channel:
-            stub = lc_pb2_grpc.LcServiceStub(channel)
-            keyRequest = schema_pb2.KeyRequest(
-                key = self._getKeyForArtifact(artifact),
-                atTx = 0
-            )
-            verfiableGet = schema_pb2.VerifiableGetRequest(
-                keyRequest = keyRequest
-            )
-            try:
-                metas = self._getReadingMetas()
-                response = stub.VerifiableGetExt(verfiableGet, metadata=metas)
-                toRet = Artifact.parse_raw(response.item.entry.value)
-                return True, toRet
-            except grpc.RpcError as e:
-                return False, e.details()
+        trustedState = self.proofVerifier.state if self.proofVerifier else None
+        verfiableGet = self._buildVerifiableGet(artifact)
+        try:
+            metas = self._getReadingMetas()
+            response = self._call("VerifiableGetExt", lambda stub: stub.VerifiableGetExt(verfiableGet, metadata=metas, timeout=self.callTimeout), idempotent = True)
+            if(self.proofVerifier):
+                self.proofVerifier.verify(response, verfiableGet.keyRequest.key, trustedState)
+            toRet = artifactCodec.decode(response.item.entry.value)
+            return True, toRet
+        except grpc.RpcError as e:
+            return False, self._rpcErrorDetails(e)
+        except ProofVerificationError as e:
+            return False, "Proof verification failed: " + str(e)
 
 class CASClient:
-    def __init__(self, signerId: str = None, apiKey: str = None, publicKey: str = None, casUrl: str = "cas.codenotary.com"):
+    def __init__(self, signerId: str = None, apiKey: str = None, publicKey: str = None, casUrl: str = "cas.codenotary.com", channelPoolSize: int = 1, hashCache: HashCache = None, resultCache: ResultCache = None, hashBufferSize: int = defaultBufferSize, hashWorkers: int = None, hashProcesses: bool = False, retryPolicy: RetryPolicy = None, callTimeout: float = None, hedgePolicy: HedgePolicy = None, proofVerifier: ProofVerifier = None, offlineIndex: OfflineIndex = None):
         self.apiKey = apiKey
         self.signerId = signerId
         self.logger = logging.getLogger("caspip")
@@ -208,7 +463,37 @@ class CASClient:
                 apiKeyOrSigner = base64.b64encode(apiKeyOrSigner.encode("utf-8")).decode("utf-8")
 
         self.publicKey = publicKey
-        self.grpcClient = GRPCClient(casUrl, apiKeyOrSigner)
+        self.hashCache = hashCache
+        self.resultCache = resultCache
+        # Authenticates from local index of synced artifacts instead of ledger
+        self.offlineIndex = offlineIndex
+        self.hashBufferSize = hashBufferSize
+        self.hashingPool = HashingPool(hashWorkers, hashProcesses)
+        self.grpcClient = GRPCClient(casUrl, apiKeyOrSigner, poolSize = channelPoolSize, retryPolicy = retryPolicy, callTimeout = callTimeout, hedgePolicy = hedgePolicy, proofVerifier = proofVerifier)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+
+    async def close(self):
+        retries = self.grpcClient.retryMetrics.snapshot()
+        if(retries["retries"]):
+            self.logger.info(f"Retried {retries['retries']} CAS requests, {retries['exhausted']} failed after last attempt, {retries['throttled']} weren't retried because of retry budget")
+        hedging = self.grpcClient.hedgePolicy
+        if(hedging != None and hedging.hedges):
+            self.logger.info(f"Hedged {hedging.hedges} of {hedging.calls} CAS reads, {hedging.hedgeWins} hedges answered first")
+        await self.grpcClient.asyncClose()
+        self.hashingPool.close()
+        if(self.hashCache):
+            self.hashCache.close()
+        if(self.resultCache):
+            self.resultCache.close()
+        if(self.grpcClient.proofVerifier):
+            self.grpcClient.proofVerifier.close()
+        if(self.offlineIndex):
+            self.offlineIndex.close()
 
     def getSha256(self, fromWhat: Union[str, bytes], strEncoding = "utf-8"):
         hashed = hashlib.sha256()
@@ -219,18 +504,37 @@ class CASClient:
         return hashed.hexdigest()
     
     async def generateHashFromFile(self, filePath: str) -> str:
-        hashed = hashlib.sha256()
-        size = 0
-        async with aiofiles.open(filePath, mode="rb") as file:
-            readed = await file.read(4096)
-            while readed:
-                size = size + len(readed)
-                hashed.update(readed)
-                readed = await file.read(4096)
-        return hashed.hexdigest(), size
+        if(self.hashCache):
+            stat = os.stat(filePath)
+            cached = self.hashCache.get(filePath, stat)
+            if(cached):
+                return cached
+        digest, size = await self.hashingPool.hash(filePath, self.hashBufferSize)
+        if(self.hashCache):
+            # File changed while hashing, result can't be trusted for next runs
+            if(HashCache.statKey(os.stat(filePath)) == HashCache.statKey(stat) and size == stat.st_size):
+                self.hashCache.put(filePath, digest, stat)
+        return digest, size
 
-    async def notarizeHashWithStatus(self, hash, packageName, kind: str, contentType: str, size: int, artifactStatus: ArtifactStatus, metadata: Dict = dict()):
-        artifact = Artifact(
+    async def _hashNamedFile(self, packageName, absolutePath):
+        hash, fileSize = await self.generateHashFromFile(absolutePath)
+        return packageName, absolutePath, hash, fileSize
+
+    async def hashFiles(self, files: List[Tuple[str, str]]) -> AsyncIterator[Tuple[str, str, str, int]]:
+        """Hashes (packageName, absolutePath) files concurrently on hashing pool.
+        Yields (packageName, absolutePath, hash, size) as soon as each file is hashed.
+        Hashing not yet finished is cancelled when iteration stops early"""
+        pending = [asyncio.ensure_future(self._hashNamedFile(packageName, absolutePath)) for packageName, absolutePath in files]
+        try:
+            for completed in asyncio.as_completed(pending):
+                yield await completed
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions = True)
+
+    def buildArtifact(self, hash, packageName, kind: str, contentType: str, size: int, artifactStatus: ArtifactStatus, metadata: Dict = dict()) -> Artifact:
+        return Artifact(
                 signer = None,
                 hash = hash, 
                 type = ArtifactType.Direct,
@@ -242,11 +546,93 @@ class CASClient:
                 status = artifactStatus,
                 PublicKey=self.publicKey
             )
+
+    def buildHashArtifactAs(self, hash, packageName, status: ArtifactStatus) -> Artifact:
+        return self.buildArtifact(hash, packageName, "hash", "hash", 0, status)
+
+    def buildHashedFileArtifactAs(self, absolutePath, packageName, hash, fileSize, status: ArtifactStatus) -> Artifact:
+        mimetype = mimetypes.guess_type(absolutePath)
+        contentType = "application/octet-stream"
+        if(mimetype and mimetype[0]):
+            contentType = mimetype[0]
+        return self.buildArtifact(hash, packageName, "file", contentType, fileSize, status)
+
+    async def buildFileArtifactAs(self, absolutePath, packageName, status: ArtifactStatus) -> Artifact:
+        hash, fileSize = await self.generateHashFromFile(absolutePath)
+        return self.buildHashedFileArtifactAs(absolutePath, packageName, hash, fileSize, status)
+
+    async def notarizeArtifact(self, artifact: Artifact):
         status, transaction = await self.grpcClient.asyncNotarizeArtifact(artifact)
         if(status):
-            return packageName, artifact
+            self._forgetResult(artifact.hash)
+            return artifact.name, artifact
         else:
-            return packageName, None
+            return artifact.name, None
+
+    async def notarizeHashWithStatus(self, hash, packageName, kind: str, contentType: str, size: int, artifactStatus: ArtifactStatus, metadata: Dict = dict()):
+        artifact = self.buildArtifact(hash, packageName, kind, contentType, size, artifactStatus, metadata)
+        return await self.notarizeArtifact(artifact)
+
+    def _artifactBytes(self, artifact: Artifact):
+        if(artifact.signer == None):
+            artifact.signer = self.grpcClient.signerId
+        # Serialized artifact plus its dependency hash and some protobuf framing
+        return len(artifactCodec.encode(artifact)) + len(artifact.hash) + 16
+
+    def _splitIntoBatches(self, artifacts: List[Artifact], maxBatchSize: int, maxBatchBytes: int):
+        batches = []
+        current = []
+        currentBytes = 0
+        for artifact in artifacts:
+            artifactBytes = self._artifactBytes(artifact)
+            if(current and (len(current) >= maxBatchSize or currentBytes + artifactBytes > maxBatchBytes)):
+                batches.append(current)
+                current = []
+                currentBytes = 0
+            current.append(artifact)
+            currentBytes = currentBytes + artifactBytes
+        if(current):
+            batches.append(current)
+        return batches
+
+    async def batchArtifacts(self, artifacts: AsyncIterator[Artifact], maxBatchSize: int = 100, maxBatchBytes: int = defaultMaxBatchBytes) -> AsyncIterator[List[Artifact]]:
+        """Packs async iterable of artifacts into batches for notarizeBatch the way notarizeMany does,
+        every batch is yielded as soon as it is full"""
+        maxBatchSize = max(1, maxBatchSize)
+        current = []
+        currentBytes = 0
+        async for artifact in artifacts:
+            artifactBytes = self._artifactBytes(artifact)
+            if(current and (len(current) >= maxBatchSize or currentBytes + artifactBytes > maxBatchBytes)):
+                yield current
+                current = []
+                currentBytes = 0
+            current.append(artifact)
+            currentBytes = currentBytes + artifactBytes
+        if(current):
+            yield current
+
+    async def notarizeBatch(self, batch: List[Artifact]):
+        """Notarizes artifacts in single VCNSetArtifacts request.
+        Returns list of (name, artifact or None, transaction or None) in batch order"""
+        status, transaction = await self.grpcClient.asyncNotarizeArtifact(*batch)
+        notarized = []
+        for artifact in batch:
+            if(status):
+                self._forgetResult(artifact.hash)
+                notarized.append((artifact.name, artifact, transaction))
+            else:
+                self.logger.error(f"Notarization of {artifact.name} failed: {transaction}")
+                notarized.append((artifact.name, None, None))
+        return notarized
+
+    async def notarizeMany(self, artifacts: List[Artifact], maxBatchSize: int = 100, maxBatchBytes: int = defaultMaxBatchBytes, concurrency: int = 1):
+        """Notarizes artifacts packed into as few VCNSetArtifacts requests as possible, up to concurrency requests in flight.
+        Returns list of (name, artifact or None, transaction or None) in input order,
+        every artifact of one batch shares the same transaction."""
+        batches = self._splitIntoBatches(artifacts, max(1, maxBatchSize), maxBatchBytes)
+        notarized = await TaskScheduler(concurrency).run(self.notarizeBatch(batch) for batch in batches)
+        return [item for batch in notarized for item in batch]
 
     async def notarizeHashAs(self, hash, packageName, status: ArtifactStatus):
         return await self.notarizeHashWithStatus(hash, packageName, "hash", "hash", 0, status)
@@ -255,12 +641,12 @@ class CASClient:
         return await self.notarizeHashAs(hash, packageName, ArtifactStatus.TRUSTED)
     
     async def notarizeFileAs(self, absolutePath, packageName, status: ArtifactStatus):
-        hash, fileSize = await self.generateHashFromFile(absolutePath)
-        mimetype = mimetypes.guess_type(absolutePath)
-        contentType = "application/octet-stream"
-        if(mimetype and mimetype[0]):
-            contentType = mimetype[0]
-        return await self.notarizeHashWithStatus(hash, packageName, "file", contentType, fileSize, status)
+        artifact = await self.buildFileArtifactAs(absolutePath, packageName, status)
+        return await self.notarizeHashWithStatus(artifact.hash, packageName, artifact.kind, artifact.contentType, artifact.size, status)
+
+    async def notarizeHashedFileAs(self, absolutePath, packageName, hash, fileSize, status: ArtifactStatus):
+        artifact = self.buildHashedFileArtifactAs(absolutePath, packageName, hash, fileSize, status)
+        return await self.notarizeHashWithStatus(hash, packageName, artifact.kind, artifact.contentType, fileSize, status)
 
     async def notarizeFile(self, absolutePath, packageName):
         return await self.notarizeFileAs(absolutePath, packageName, ArtifactStatus.TRUSTED)
@@ -277,35 +663,257 @@ class CASClient:
     async def untrustHash(self, hash, packageName):
         return await self.notarizeHashAs(hash, packageName, ArtifactStatus.UNTRUSTED)
 
-    async def authenticateHash(self, hash, packageName):
+    def _getCachedValue(self, hash):
+        if(not self.resultCache):
+            return False, None
+        return self.resultCache.get(self.grpcClient.signerId, hash)
+
+    def _forgetResult(self, hash):
+        if(self.resultCache):
+            self.resultCache.invalidate(self.grpcClient.signerId, hash)
+
+    def _cacheValue(self, hash, value: Optional[bytes]):
+        if(self.resultCache):
+            self.resultCache.put(self.grpcClient.signerId, hash, value.decode("utf-8") if value != None else None)
+
+    async def _authenticateValue(self, hash):
+        """Returns ledger value of artifact with hash, None when it is not notarized or authentication failed"""
+        if(self.offlineIndex):
+            return self.offlineIndex.get(self.grpcClient.signerId, hash)
+        found, cached = self._getCachedValue(hash)
+        if(found):
+            return cached
         req = ArtifactAuthorizationRequest(hash = hash)
-        authorized, status = await self.grpcClient.asyncAuthorizeArtifact(req)
+        authorized, value = await self.grpcClient.asyncGetArtifactValue(req)
         if(authorized):
-            return packageName, status
-        else:
-            return packageName, None
+            self._cacheValue(hash, value)
+            return value
+        if(isNotFoundError(value)):
+            self._cacheValue(hash, None)
+        return None
+
+    async def _authenticateValues(self, hashes: List[str], chunkSize: int = 100) -> Dict[str, Optional[Union[bytes, str]]]:
+        if(self.offlineIndex):
+            return {hash: self.offlineIndex.get(self.grpcClient.signerId, hash) for hash in dict.fromkeys(hashes)}
+        authenticated = dict()
+        toRequest = []
+        for hash in dict.fromkeys(hashes):
+            found, cached = self._getCachedValue(hash)
+            if(found):
+                authenticated[hash] = cached
+            else:
+                toRequest.append(hash)
+        chunkSize = max(1, chunkSize)
+        for index in range(0, len(toRequest), chunkSize):
+            chunk = toRequest[index:index + chunkSize]
+            requests = [ArtifactAuthorizationRequest(hash = hash) for hash in chunk]
+            status, returned = await self.grpcClient.asyncGetArtifactValues(*requests)
+            if(not status):
+                # Failed reads are never cached, hashes are authenticated again by next run
+                self.logger.error(f"Authentication of {len(chunk)} hashes failed: {returned}")
+                for hash in chunk:
+                    authenticated[hash] = None
+                continue
+            # Successful read returns None only for hashes server confirmed as not found, like _authenticateValue caches them
+            for hash, value in zip(chunk, returned):
+                self._cacheValue(hash, value)
+                authenticated[hash] = value
+        return authenticated
+
+    async def authenticateHash(self, hash, packageName):
+        value = await self._authenticateValue(hash)
+        return packageName, artifactCodec.decode(value) if value != None else None
+
+    async def authenticateMany(self, hashes: List[str], chunkSize: int = 100) -> Dict[str, Optional[Artifact]]:
+        """Authenticates hashes in chunks of chunkSize keys per VerifiableGetExtMulti request"""
+        values = await self._authenticateValues(hashes, chunkSize)
+        return {hash: artifactCodec.decode(value) if value != None else None for hash, value in values.items()}
+
+    async def verifyHash(self, hash, packageName):
+        """Same as authenticateHash, returns VerificationResult instead of Artifact"""
+        value = await self._authenticateValue(hash)
+        return packageName, VerificationResult.fromValue(value) if value != None else None
+
+    async def verifyMany(self, hashes: List[str], chunkSize: int = 100) -> Dict[str, Optional[VerificationResult]]:
+        """Same as authenticateMany, returns VerificationResult instead of Artifact for every notarized hash"""
+        values = await self._authenticateValues(hashes, chunkSize)
+        return {hash: VerificationResult.fromValue(value) if value != None else None for hash, value in values.items()}
+
+    async def _iterPages(self, fetch, nextSeek, seek):
+        """Yields non-empty pages returned by fetch(seek) until empty one, seeking after last item of previous page.
+        Next page is requested while current one is consumed. Raises ArtifactListingError when page can't be read"""
+        page = asyncio.ensure_future(fetch(seek))
+        try:
+            while page != None:
+                status, items = await page
+                page = None
+                if(not status):
+                    raise ArtifactListingError(items)
+                # Server may return less than limit items, listing ends with empty page
+                if(items):
+                    page = asyncio.ensure_future(fetch(nextSeek(items[-1])))
+                    yield items
+        finally:
+            if(page != None):
+                page.cancel()
+
+    def _resultFromEntry(self, entry) -> Optional[VerificationResult]:
+        if(not entry.value):
+            return None
+        try:
+            return VerificationResult.fromValue(entry.value, txId = entry.tx)
+        except ValueError as e:
+            self.logger.warning(f"Skipping {entry.key.decode('utf-8', errors = 'replace')}, it isn't artifact: {e}")
+            return None
+
+    async def iterArtifacts(self, signer: str = None, prefix: str = "", since: int = 0, pageSize: int = 1000, indexedTx: int = 0) -> AsyncIterator[VerificationResult]:
+        """Yields VerificationResult of every artifact notarized by signer (own by default) with hash starting with prefix,
+        in hash order. since skips artifacts last written in transaction since or older,
+        indexedTx makes listing include every artifact written up to that transaction.
+        Server is read page by page, next page is requested while current one is consumed.
+        Raises ArtifactListingError when page can't be read"""
+        if(signer == None):
+            signer = self.grpcClient.signerId
+        keyPrefix = f"vcn.{signer}.{prefix}".encode("utf-8")
+
+        async def fetch(seekKey):
+            status, entries = await self.grpcClient.asyncScanArtifacts(keyPrefix, seekKey, pageSize, indexedTx)
+            if(status):
+                entries = [entry for entry in entries if entry.key != seekKey]
+            return status, entries
+
+        async for entries in self._iterPages(fetch, lambda entry: entry.key, b""):
+            for entry in entries:
+                if(entry.tx <= since):
+                    continue
+                result = self._resultFromEntry(entry)
+                if(result != None):
+                    yield result
+
+    async def iterArtifactUpdates(self, signer: str = None, after: Tuple[bytes, float, int] = None, pageSize: int = 1000, indexedTx: int = 0) -> AsyncIterator[Tuple[List[VerificationResult], Tuple[bytes, float, int]]]:
+        """Yields (results, cursor) pages of artifacts notarized by signer (own by default) in order they were written,
+        read from insertion set of signer after (key, score, atTx) member after. cursor is last member read so far,
+        so only artifacts written since are transferred. Raises ArtifactListingError when page can't be read"""
+        if(signer == None):
+            signer = self.grpcClient.signerId
+        setName = f"{insertionSetPrefix}{signer}".encode("utf-8")
+
+        def fetch(seek):
+            return self.grpcClient.asyncScanSortedSet(setName, seek, pageSize, indexedTx = indexedTx)
+
+        async for members in self._iterPages(fetch, lambda member: (member.key, member.score, member.atTx), after):
+            results = [self._resultFromEntry(member.entry) for member in members]
+            last = members[-1]
+            yield [result for result in results if result != None], (last.key, last.score, last.atTx)
+
+    async def syncIndex(self, index: OfflineIndex, signer: str = None, pageSize: int = 1000):
+        """Adds artifacts of signer (own by default) written since last sync to index.
+        First sync lists all artifacts of signer and remembers newest member of its insertion set,
+        later syncs read insertion set only after remembered member, so unchanged ledger transfers no artifacts.
+        Index is marked complete up to current state of ledger only when whole listing was read,
+        so interrupted sync is repeated from the same point.
+        Returns (status, number of stored artifacts or error details)"""
+        if(signer == None):
+            signer = self.grpcClient.signerId
+        status, state = await self.grpcClient.asyncCurrentState()
+        if(not status):
+            return False, state
+        since = index.syncedTx(signer)
+        cursor = index.syncCursor(signer)
+        stored = 0
+        try:
+            if(cursor == None):
+                # Members inserted after this one are read by next sync, even when listing below includes them too
+                status, newest = await self.grpcClient.asyncScanSortedSet(f"{insertionSetPrefix}{signer}".encode("utf-8"), limit = 1, desc = True, indexedTx = state.txId)
+                if(not status):
+                    return False, newest
+                batch = []
+                async for result in self.iterArtifacts(signer, since = since, pageSize = pageSize, indexedTx = state.txId):
+                    batch.append((result.hash, result.value, result.txId))
+                    if(len(batch) >= pageSize):
+                        index.put(signer, batch)
+                        stored = stored + len(batch)
+                        batch = []
+                index.put(signer, batch)
+                stored = stored + len(batch)
+                if(newest):
+                    cursor = (newest[0].key, newest[0].score, newest[0].atTx)
+            else:
+                async for results, cursor in self.iterArtifactUpdates(signer, cursor, pageSize, state.txId):
+                    batch = [(result.hash, result.value, result.txId) for result in results if result.txId > since]
+                    index.put(signer, batch)
+                    stored = stored + len(batch)
+        except ArtifactListingError as e:
+            return False, str(e)
+        index.finishSync(signer, state.txId, cursor)
+        return True, stored
 
     async def authenticateFile(self, absolutePath, packageName):
         hash, fileSize = await self.generateHashFromFile(absolutePath)
-        req = ArtifactAuthorizationRequest(hash = hash)
-        authorized, returned = await self.grpcClient.asyncAuthorizeArtifact(req)
-        if(authorized):
-            return packageName, returned
-        else:
-            return packageName, None
+        return await self.authenticateHash(hash, packageName)
 
     def downloadPipFiles(self, tmpDirectoryName, quiet = True, noCache = True, reqFile = "requirements.txt", additionalPipArgs = []):
-        args = ["download", "-d", tmpDirectoryName]
-        if(noCache):
-            args.append("--no-cache-dir")
-        if(quiet):
-            args.append("-q")
-        if(reqFile):
-            args.append("-r")
-            args.append(reqFile)
-        args.extend(additionalPipArgs)
-        what = _main(args)
+        """Runs pip download in this process, blocking. asyncDownloadPipFiles runs it in subprocess instead"""
+        what = _main(pipDownloadArgs(tmpDirectoryName, reqFile, quiet, noCache, additionalPipArgs))
         return what == 0
 
+    async def asyncDownloadPipFiles(self, tmpDirectoryName, quiet = True, noCache = True, reqFile = "requirements.txt", additionalPipArgs = []):
+        return await runPip(pipDownloadArgs(tmpDirectoryName, reqFile, quiet, noCache, additionalPipArgs))
+
+    def streamPipFiles(self, tmpDirectoryName, quiet = True, noCache = True, reqFile = "requirements.txt", additionalPipArgs = []) -> StreamingDownload:
+        """Pipelined variant of asyncDownloadPipFiles followed by hashFiles.
+        Files are hashed as soon as pip finishes writing them"""
+        async def download():
+            return await self.asyncDownloadPipFiles(tmpDirectoryName, quiet, noCache, reqFile, additionalPipArgs)
+        return StreamingDownload(tmpDirectoryName, download, self.generateHashFromFile)
+
+    def shardPipFiles(self, tmpDirectoryName, quiet = True, noCache = True, reqFile = "requirements.txt", additionalPipArgs = [], jobs = 4) -> ShardedPipDownload:
+        """Downloads every requirement of fully pinned requirements file by its own pip process, up to jobs at once.
+        Requirements are downloaded without dependencies, so ValueError is raised when any of them isn't pinned by == and --hash"""
+        options = []
+        requirements = parseRequirementsFile(reqFile, options = options)
+        unpinned = [requirement.specifier for requirement in requirements if not requirement.isFullyPinned()]
+        if(unpinned):
+            raise ValueError("Requirements have to be pinned by == and --hash to be downloaded separately: " + ", ".join(unpinned))
+        return ShardedPipDownload(tmpDirectoryName, [requirement.line for requirement in requirements], options, self.generateHashFromFile, jobs = jobs, quiet = quiet, noCache = noCache, additionalPipArgs = additionalPipArgs)
+
+    def wheelhousePipFiles(self, wheelhouse: Wheelhouse, tmpDirectoryName, quiet = True, noCache = True, reqFile = "requirements.txt", additionalPipArgs = []) -> WheelhouseDownload:
+        """Variant of streamPipFiles which takes packages stored in wheelhouse and downloads only missing ones into tmpDirectoryName"""
+        return WheelhouseDownload(wheelhouse, tmpDirectoryName, reqFile, self.generateHashFromFile, quiet = quiet, noCache = noCache, additionalPipArgs = additionalPipArgs)
+
+    async def resolveIndexFiles(self, reqFile = "requirements.txt", quiet = True, noCache = True, indexUrl = None, additionalPipArgs = []) -> Optional[List[IndexFile]]:
+        """Resolves requirements into files which pip download would fetch, with sha256 published by index where available"""
+        return await resolveRequirements(reqFile, quiet = quiet, noCache = noCache, indexUrl = indexUrl, additionalPipArgs = additionalPipArgs)
+
+    def _hashIndexFile(self, indexFile: IndexFile, indexClient: SimpleIndexClient):
+        hash = indexClient.getFileHash(indexFile.project, indexFile.name)
+        if(hash != None):
+            return hash, indexFile.size
+        self.logger.warning("Index doesn't publish hash of " + indexFile.name + ", downloading it")
+        return hashUrl(indexFile.url, self.hashBufferSize)
+
+    async def _hashNamedIndexFile(self, indexFile: IndexFile, indexClient: SimpleIndexClient):
+        loop = asyncio.get_event_loop()
+        hash, fileSize = await loop.run_in_executor(None, self._hashIndexFile, indexFile, indexClient)
+        return indexFile.name, indexFile.url, hash, fileSize
+
+    async def hashIndexFiles(self, files: List[IndexFile], indexUrl = None) -> AsyncIterator[Tuple[str, str, str, Optional[int]]]:
+        """Yields (packageName, url, hash, size) of resolved files like hashFiles does for downloaded ones.
+        Files without hash in resolution are looked up in simple API of index and only then downloaded and hashed"""
+        indexClient = SimpleIndexClient(indexUrl if indexUrl else os.environ.get("PIP_INDEX_URL", defaultIndexUrl))
+        missing = []
+        for indexFile in files:
+            if(indexFile.hash != None):
+                yield indexFile.name, indexFile.url, indexFile.hash, indexFile.size
+            else:
+                missing.append(asyncio.ensure_future(self._hashNamedIndexFile(indexFile, indexClient)))
+        try:
+            for completed in asyncio.as_completed(missing):
+                yield await completed
+        finally:
+            for task in missing:
+                task.cancel()
+            await asyncio.gather(*missing, return_exceptions = True)
+
     def getPipVersion(self):
         return pipVersion
\ No newline at end of file
@@ -0,0 +1,135 @@
+import datetime
+import json
+from enum import Enum
+from inspect import isclass
+from typing import Any, Type, Union
+from pydantic import BaseModel, Extra
+from pydantic.fields import SHAPE_DICT, SHAPE_MAPPING, SHAPE_SINGLETON
+from pydantic.json import pydantic_encoder
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+
+class _Slow(Exception):
+    """Value doesn't fit fast conversion, model is validated by pydantic instead"""
+
+
+def _parseDatetime(value):
+    if(not isinstance(value, str) or not hasattr(datetime.datetime, "fromisoformat")):
+        raise _Slow()
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise _Slow()
+
+
+def _exact(type_):
+    def decode(value):
+        if(type(value) is not type_):
+            raise _Slow()
+        return value
+    return decode
+
+
+def _enum(type_):
+    def decode(value):
+        try:
+            return type_(value)
+        except ValueError:
+            raise _Slow()
+    return decode
+
+
+def _validated(field):
+    def decode(value):
+        validated, errors = field.validate(value, {}, loc = field.name)
+        if(errors):
+            raise _Slow()
+        return validated
+    return decode
+
+
+def _acceptsStr(type_):
+    # Union members are tried in order, str first means str values are kept as they are
+    return type_ is str or (getattr(type_, "__origin__", None) is Union and type_.__args__[0] is str)
+
+
+def _strMapping(field):
+    validated = _validated(field)
+    def decode(value):
+        if(isinstance(value, dict) and all(type(item) is str for item in value.values())):
+            return value
+        return validated(value)
+    return decode
+
+
+def _fieldDecoder(field):
+    type_ = field.outer_type_
+    if(field.shape in (SHAPE_DICT, SHAPE_MAPPING) and _acceptsStr(field.type_)):
+        return _strMapping(field)
+    if(field.shape != SHAPE_SINGLETON):
+        return _validated(field)
+    if(isclass(type_) and issubclass(type_, Enum)):
+        return _enum(type_)
+    if(type_ is datetime.datetime):
+        return _parseDatetime
+    if(type_ in (str, int, bool)):
+        return _exact(type_)
+    return _validated(field)
+
+
+def _fieldEncoder(field):
+    type_ = field.outer_type_
+    if(field.shape == SHAPE_SINGLETON and isclass(type_) and issubclass(type_, Enum)):
+        return lambda value: value.value if isinstance(value, Enum) else value
+    if(field.shape == SHAPE_SINGLETON and type_ is datetime.datetime):
+        return lambda value: value.isoformat() if isinstance(value, datetime.datetime) else value
+    return None
+
+
+class ModelCodec:
+    """Encodes and decodes flat pydantic models with converters precompiled from model fields.
+    encode() gives the same bytes as model.json().encode("utf-8"), decode() the same model as parse_raw().
+    Values which don't fit fast converters are validated by pydantic as usual.
+    Decoding uses orjson when installed"""
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.fields = [(name, field, _fieldEncoder(field), _fieldDecoder(field)) for name, field in model.__fields__.items()]
+        self.fast = model.__config__.extra == Extra.ignore and all(field.alias == name for name, field, encoder, decoder in self.fields)
+
+    def encode(self, instance: BaseModel) -> bytes:
+        values = dict()
+        for name, field, encoder, decoder in self.fields:
+            value = getattr(instance, name)
+            values[name] = encoder(value) if encoder and value != None else value
+        return json.dumps(values, default = pydantic_encoder).encode("utf-8")
+
+    def _construct(self, data: Any):
+        if(not self.fast or not isinstance(data, dict)):
+            raise _Slow()
+        values = dict()
+        for name, field, encoder, decoder in self.fields:
+            if(name not in data):
+                if(field.required):
+                    raise _Slow()
+                continue
+            value = data[name]
+            if(value == None):
+                if(not field.allow_none):
+                    raise _Slow()
+                values[name] = None
+            else:
+                values[name] = decoder(value)
+        return self.model.construct(_fields_set = set(values), **values)
+
+    def decode(self, raw: Any) -> BaseModel:
+        data = loads(raw)
+        try:
+            return self._construct(data)
+        except _Slow:
+            return self.model.parse_obj(data)
@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import sys
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+from .scheduler import ConcurrencyLimit
+
+logger = logging.getLogger("cas_pip.downloader")
+
+
+def pipDownloadArgs(directory: str, reqFile: str = None, quiet: bool = True, noCache: bool = True, additionalPipArgs: List[str] = []) -> List[str]:
+    args = ["download", "-d", directory]
+    if(noCache):
+        args.append("--no-cache-dir")
+    if(quiet):
+        args.append("-q")
+    if(reqFile):
+        args.append("-r")
+        args.append(reqFile)
+    args.extend(additionalPipArgs)
+    return args
+
+
+async def runPip(args: List[str]) -> bool:
+    """Runs pip of current interpreter as subprocess, so event loop and pip global state of this process are left alone.
+    Process is killed when awaiting task is cancelled"""
+    process = await asyncio.create_subprocess_exec(sys.executable, "-m", "pip", *args, stdin = asyncio.subprocess.DEVNULL)
+    try:
+        return await process.wait() == 0
+    finally:
+        if(process.returncode == None):
+            process.kill()
+            await process.wait()
+
+
+class DirectoryWatcher:
+    """Polls directory and yields (name, path) of files which are complete.
+    pip writes downloaded files into directory one after another, so every file except the most recently
+    modified one is complete. After stop() (download has ended) all remaining files are yielded.
+    Every path is yielded once, paths of files which changed after being yielded are collected in changed"""
+    def __init__(self, directory: str, pollInterval: float = 0.2):
+        self.directory = directory
+        self.pollInterval = pollInterval
+        self.changed = []
+        self._stopped = asyncio.Event()
+        self._emitted = dict()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _scan(self):
+        found = []
+        for file in os.walk(self.directory):
+            for name in file[2]:
+                path = os.path.join(file[0], name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found.append((name, path, (stat.st_size, stat.st_mtime_ns, stat.st_ino)))
+        return found
+
+    async def watch(self) -> AsyncIterator[Tuple[str, str]]:
+        while True:
+            stopped = self._stopped.is_set()
+            pending = []
+            for name, path, key in self._scan():
+                if(path in self._emitted):
+                    if(stopped and self._emitted[path] != key):
+                        logger.error(path + " changed after it was hashed")
+                        self.changed.append(path)
+                    continue
+                pending.append((name, path, key))
+            if(not stopped and pending):
+                # File being written is the newest one, with equal mtimes none of them is known to be complete
+                newest = max(key[1] for name, path, key in pending)
+                pending = [item for item in pending if item[2][1] < newest]
+            for name, path, key in sorted(pending, key = lambda item: item[2][1]):
+                self._emitted[path] = key
+                yield name, path
+            if(stopped):
+                return
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.pollInterval)
+            except asyncio.TimeoutError:
+                pass
+
+
+class StreamingDownload:
+    """Runs download into directory and hashes every file as soon as it is complete,
+    so downloading, hashing and ledger requests of consumer overlap.
+    succeeded holds result of download once files() is exhausted, it's False also when file changed after it was hashed"""
+    def __init__(self, directory: str, download: Callable[[], Awaitable[bool]], hashFile: Callable[[str], Awaitable[Tuple[str, int]]], pollInterval: float = 0.2):
+        self.directory = directory
+        self.download = download
+        self.hashFile = hashFile
+        self.pollInterval = pollInterval
+        self.succeeded = None
+
+    async def files(self) -> AsyncIterator[Tuple[str, str, str, int]]:
+        """Yields (packageName, absolutePath, hash, size)"""
+        watcher = DirectoryWatcher(self.directory, self.pollInterval)
+        results = asyncio.Queue()
+        finished = object()
+
+        async def hashOne(name, path):
+            hash, size = await self.hashFile(path)
+            await results.put((name, path, hash, size))
+
+        def failed(downloading):
+            return downloading.done() and not downloading.cancelled() and downloading.exception() == None and not downloading.result()
+
+        async def produce():
+            downloading = asyncio.ensure_future(self.download())
+            downloading.add_done_callback(lambda future: watcher.stop())
+            hashing = []
+            try:
+                async for name, path in watcher.watch():
+                    if(failed(downloading)):
+                        break
+                    hashing.append(asyncio.ensure_future(hashOne(name, path)))
+                self.succeeded = await downloading and not watcher.changed
+                await asyncio.gather(*hashing)
+            finally:
+                if(not downloading.done()):
+                    downloading.cancel()
+                for task in hashing:
+                    task.cancel()
+                await results.put(finished)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await results.get()
+                if(item is finished):
+                    break
+                yield item
+            await producer
+        finally:
+            if(not producer.done()):
+                producer.cancel()
+
+
+class ShardedPipDownload:
+    """Downloads every requirement by separate pip process (with --no-deps, so requirements are expected
+    to be fully pinned e.g. by pip-compile), at most jobs processes at once.
+    Files of requirement are hashed as soon as its process ends, succeeded holds result once files() is exhausted"""
+    def __init__(self, directory: str, requirements: List[str], options: List[str], hashFile: Callable[[str], Awaitable[Tuple[str, int]]], jobs: int = 4, quiet: bool = True, noCache: bool = True, additionalPipArgs: List[str] = []):
+        self.directory = directory
+        self.requirements = requirements
+        self.options = options
+        self.hashFile = hashFile
+        self.limit = ConcurrencyLimit(max(1, jobs))
+        self.quiet = quiet
+        self.noCache = noCache
+        self.additionalPipArgs = additionalPipArgs
+        self.succeeded = None
+
+    async def _downloadShard(self, number: int, requirement: str):
+        shardDirectory = os.path.join(self.directory, "shard-" + str(number))
+        os.makedirs(shardDirectory, exist_ok = True)
+        shardFile = os.path.join(self.directory, "shard-" + str(number) + ".txt")
+        with open(shardFile, "w") as toWrite:
+            toWrite.write("\n".join(self.options + [requirement]) + "\n")
+        await self.limit.acquire()
+        try:
+            succeeded = await runPip(pipDownloadArgs(shardDirectory, shardFile, self.quiet, self.noCache, ["--no-deps"] + self.additionalPipArgs))
+        finally:
+            await self.limit.release()
+        files = []
+        for name in sorted(os.listdir(shardDirectory)):
+            files.append((name, os.path.join(shardDirectory, name)))
+        return requirement, succeeded, files
+
+    async def events(self) -> AsyncIterator[Tuple[str, bool, List[Tuple[str, str]]]]:
+        """Yields (requirement, succeeded, [(packageName, absolutePath)]) as pip processes end.
+        Processes still running are killed when iteration stops early"""
+        shards = [asyncio.ensure_future(self._downloadShard(number, requirement)) for number, requirement in enumerate(self.requirements)]
+        try:
+            for completed in asyncio.as_completed(shards):
+                yield await completed
+        finally:
+            for shard in shards:
+                shard.cancel()
+            await asyncio.gather(*shards, return_exceptions = True)
+
+    async def files(self) -> AsyncIterator[Tuple[str, str, str, int]]:
+        """Yields (packageName, absolutePath, hash, size), files of requirements downloaded after first failure are not hashed"""
+        results = asyncio.Queue()
+        finished = object()
+
+        async def hashOne(name, path):
+            hash, size = await self.hashFile(path)
+            await results.put((name, path, hash, size))
+
+        async def produce():
+            hashing = []
+            self.succeeded = True
+            try:
+                async for requirement, succeeded, files in self.events():
+                    if(not succeeded):
+                        logger.error("Downloading of " + requirement + " failed")
+                        self.succeeded = False
+                        break
+                    for name, path in files:
+                        hashing.append(asyncio.ensure_future(hashOne(name, path)))
+                await asyncio.gather(*hashing)
+            finally:
+                for task in hashing:
+                    task.cancel()
+                await results.put(finished)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await results.get()
+                if(item is finished):
+                    break
+                yield item
+            await producer
+        finally:
+            if(not producer.done()):
+                producer.cancel()
@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Tuple
+
+defaultBufferSize = 1024 * 1024
+defaultMmapThreshold = 64 * 1024 * 1024
+
+
+def _hashMapped(file, hashed) -> int:
+    with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        # hashlib releases GIL while hashing big buffers
+        hashed.update(mapped)
+        return len(mapped)
+
+
+def _hashBuffered(file, hashed, bufferSize: int) -> int:
+    buffer = bytearray(bufferSize)
+    view = memoryview(buffer)
+    size = 0
+    readed = file.readinto(buffer)
+    while readed:
+        size = size + readed
+        hashed.update(view[:readed])
+        readed = file.readinto(buffer)
+    return size
+
+
+def hashFile(filePath: str, bufferSize: int = defaultBufferSize, mmapThreshold: int = defaultMmapThreshold) -> Tuple[str, int]:
+    """Returns sha256 hexdigest and size of file, blocking - meant to be run in worker thread.
+    Files up to bufferSize are read at once, files from mmapThreshold are hashed from mmap in single pass
+    and everything between is read into one reused buffer of bufferSize"""
+    hashed = hashlib.sha256()
+    with open(filePath, "rb", buffering = 0) as file:
+        expectedSize = os.fstat(file.fileno()).st_size
+        if(expectedSize <= bufferSize):
+            # Reads until EOF, so file growing in meantime is hashed whole
+            readed = file.read()
+            hashed.update(readed)
+            return hashed.hexdigest(), len(readed)
+        if(mmapThreshold and expectedSize >= mmapThreshold):
+            try:
+                size = _hashMapped(file, hashed)
+                return hashed.hexdigest(), size
+            except (OSError, ValueError, OverflowError):
+                # mmap not possible (special files, address space), falling back to buffered read
+                hashed = hashlib.sha256()
+                file.seek(0)
+        size = _hashBuffered(file, hashed, bufferSize)
+        return hashed.hexdigest(), size
+
+
+def getDefaultHashWorkers():
+    # Hashing is both cpu and disk bound, some oversubscription keeps disk queue busy
+    return min(32, (os.cpu_count() or 1) * 2)
+
+
+class HashingPool:
+    """Hashes files concurrently on thread pool (hashlib releases GIL) or optionally on process pool"""
+    def __init__(self, workers: int = None, useProcesses: bool = False):
+        self.workers = workers if workers else getDefaultHashWorkers()
+        self.useProcesses = useProcesses
+        if(useProcesses):
+            self.executor = ProcessPoolExecutor(max_workers = self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = "cas_pip_hash")
+
+    async def hash(self, filePath: str, bufferSize: int = defaultBufferSize) -> Tuple[str, int]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, hashFile, filePath, bufferSize)
+
+    def close(self):
+        self.executor.shutdown(wait = True)
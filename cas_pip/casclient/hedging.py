@@ -0,0 +1,92 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class LatencyTracker:
+    """Latencies of last window successful calls"""
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen = window)
+
+    def add(self, latency: float):
+        self.samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if(not self.samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgePolicy:
+    """Sends duplicate of idempotent call when it doesn't complete in delay, first response wins.
+    Without fixed delay, quantile of observed latencies of method is used once minSamples are known.
+    Duplicates are limited to maxExtraLoad of calls"""
+    def __init__(self, delay: float = None, quantile: float = 0.95, minDelay: float = 0.005, maxExtraLoad: float = 0.1, minSamples: int = 20, window: int = 200):
+        self.delay = delay
+        self.quantile = quantile
+        self.minDelay = minDelay
+        self.maxExtraLoad = maxExtraLoad
+        self.minSamples = minSamples
+        self.window = window
+        self.trackers: Dict[str, LatencyTracker] = dict()
+        self.calls = 0
+        self.hedges = 0
+        self.hedgeWins = 0
+
+    def tracker(self, method: str) -> LatencyTracker:
+        if(method not in self.trackers):
+            self.trackers[method] = LatencyTracker(self.window)
+        return self.trackers[method]
+
+    def hedgeDelay(self, method: str) -> Optional[float]:
+        """Seconds after which call should be hedged, None when it shouldn't be"""
+        if(self.delay != None):
+            return self.delay
+        tracker = self.tracker(method)
+        if(len(tracker.samples) < self.minSamples):
+            return None
+        return max(self.minDelay, tracker.quantile(self.quantile))
+
+    def allowHedge(self) -> bool:
+        return self.hedges + 1 <= self.maxExtraLoad * self.calls
+
+
+async def _timed(call: Callable[[], Awaitable]):
+    started = time.monotonic()
+    response = await call()
+    return response, time.monotonic() - started
+
+
+async def hedgedCall(policy: HedgePolicy, method: str, call: Callable[[], Awaitable]):
+    """Awaits call(), starting second call() when first is slower than hedge delay.
+    Returns first successful response, raises error of last failed call when both fail"""
+    policy.calls = policy.calls + 1
+    tracker = policy.tracker(method)
+    delay = policy.hedgeDelay(method)
+    primary = asyncio.ensure_future(_timed(call))
+    pending = {primary}
+    try:
+        if(delay != None):
+            done, pending = await asyncio.wait(pending, timeout = delay)
+            if(not done and policy.allowHedge()):
+                policy.hedges = policy.hedges + 1
+                pending.add(asyncio.ensure_future(_timed(call)))
+        else:
+            done = set()
+        while True:
+            for task in done:
+                if(task.exception() == None):
+                    response, latency = task.result()
+                    tracker.add(latency)
+                    if(task is not primary):
+                        policy.hedgeWins = policy.hedgeWins + 1
+                    return response
+            if(not pending):
+                # Every call failed
+                return done.pop().result()
+            done, pending = await asyncio.wait(pending, return_when = asyncio.FIRST_COMPLETED)
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from pip import __version__ as pipVersion
+
+from .hashing import defaultBufferSize
+from .downloader import runPip
+from .requirements import PinnedRequirement
+
+defaultIndexUrl = "https://pypi.org/simple"
+# pip install --report appeared in pip 22.2
+minimalReportPipVersion = (22, 2)
+_simpleAccept = "application/vnd.pypi.simple.v1+json, application/vnd.pypi.simple.v1+html;q=0.2, text/html;q=0.1"
+
+logger = logging.getLogger("cas_pip.index")
+
+
+class IndexFile(BaseModel):
+    name: str
+    project: str
+    url: str
+    hash: Optional[str] = None
+    size: Optional[int] = None
+
+
+def normalizeProjectName(name: str):
+    """PEP 503 normalized project name"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def _fileName(url: str):
+    return urllib.parse.unquote(os.path.basename(urllib.parse.urlsplit(url).path))
+
+
+def _fragmentHash(url: str) -> Optional[str]:
+    fragment = urllib.parse.urlsplit(url).fragment
+    algorithm, _, digest = fragment.partition("=")
+    if(algorithm == "sha256" and digest):
+        return digest.lower()
+    return None
+
+
+class _AnchorParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if(tag == "a"):
+            href = dict(attrs).get("href", None)
+            if(href):
+                self.hrefs.append(href)
+
+
+def _pipSupportsReport():
+    try:
+        version = tuple(int(part) for part in pipVersion.split(".")[:2])
+    except ValueError:
+        return True
+    return version >= minimalReportPipVersion
+
+
+def readInstallReport(path: str) -> Optional[List[IndexFile]]:
+    """Reads files chosen by resolver from pip installation report.
+    Returns None when some requirement is not an archive (VCS checkout, local directory), such can't be resolved without download"""
+    with open(path, "r") as file:
+        report = json.load(file)
+    files = []
+    for item in report.get("install", []):
+        downloadInfo = item.get("download_info", {})
+        archiveInfo = downloadInfo.get("archive_info", None)
+        if(archiveInfo == None):
+            logger.warning("Requirement " + downloadInfo.get("url", "?") + " is not archive, can't be resolved from index")
+            return None
+        url = downloadInfo["url"]
+        hash = archiveInfo.get("hashes", {}).get("sha256", None)
+        if(hash == None and archiveInfo.get("hash", "").startswith("sha256=")):
+            hash = archiveInfo["hash"][len("sha256="):]
+        files.append(IndexFile(
+            name = _fileName(url),
+            project = normalizeProjectName(item.get("metadata", {}).get("name", _fileName(url))),
+            url = url,
+            hash = hash.lower() if hash else None
+        ))
+    return files
+
+
+def installReportArgs(reportPath: str, reqFile: str, quiet: bool = True, noCache: bool = True, indexUrl: str = None, additionalPipArgs: List[str] = []) -> List[str]:
+    args = ["install", "--dry-run", "--ignore-installed", "--report", reportPath, "-r", reqFile]
+    if(noCache):
+        args.append("--no-cache-dir")
+    if(quiet):
+        args.append("-q")
+    if(indexUrl):
+        args.extend(["--index-url", indexUrl])
+    args.extend(additionalPipArgs)
+    return args
+
+
+async def resolveRequirements(reqFile: str, quiet: bool = True, noCache: bool = True, indexUrl: str = None, additionalPipArgs: List[str] = []) -> Optional[List[IndexFile]]:
+    """Resolves requirements the way pip download does, without downloading files which index publishes metadata for.
+    Returns None when resolution failed or pip is too old to report it"""
+    if(not _pipSupportsReport()):
+        logger.error("Resolving from index requires pip >= " + ".".join(str(part) for part in minimalReportPipVersion))
+        return None
+    with tempfile.TemporaryDirectory() as tmpDirectoryName:
+        reportPath = os.path.join(tmpDirectoryName, "report.json")
+        if(not await runPip(installReportArgs(reportPath, reqFile, quiet, noCache, indexUrl, additionalPipArgs))):
+            return None
+        return readInstallReport(reportPath)
+
+
+async def missingDependencies(requirements: List[PinnedRequirement], options: List[str] = [], quiet: bool = True, noCache: bool = True, additionalPipArgs: List[str] = []) -> Optional[List[str]]:
+    """Resolves dependencies of requirements the way pip download without --no-deps does and returns sorted names
+    of resolved projects not listed in requirements. Hashes are left out, so missing dependency is reported by name
+    instead of pip failing in --require-hashes mode. Returns None when resolution failed"""
+    if(not _pipSupportsReport()):
+        logger.error("Resolving dependencies requires pip >= " + ".".join(str(part) for part in minimalReportPipVersion))
+        return None
+    with tempfile.TemporaryDirectory() as tmpDirectoryName:
+        reqFile = os.path.join(tmpDirectoryName, "requirements.txt")
+        lines = [option for option in options if option.strip() != "--require-hashes"] + [requirement.withoutHashes() for requirement in requirements]
+        with open(reqFile, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        reportPath = os.path.join(tmpDirectoryName, "report.json")
+        if(not await runPip(installReportArgs(reportPath, reqFile, quiet, noCache, additionalPipArgs = additionalPipArgs))):
+            return None
+        with open(reportPath, "r") as file:
+            report = json.load(file)
+    listed = set(normalizeProjectName(requirement.name) for requirement in requirements)
+    resolved = set(normalizeProjectName(item.get("metadata", {}).get("name", "")) for item in report.get("install", []))
+    return sorted(name for name in resolved if name and name not in listed)
+
+
+class SimpleIndexClient:
+    """Reads project file listings from simple repository API, both PEP 691 JSON and PEP 503 HTML.
+    Local directories (file:// urls) are supported, their project pages are read from index.html"""
+    def __init__(self, indexUrl: str = defaultIndexUrl, timeout: float = 30):
+        self.indexUrl = indexUrl.rstrip("/") + "/"
+        self.timeout = timeout
+        self._projects = dict()
+
+    def _fetch(self, url: str) -> Tuple[str, bytes]:
+        parsed = urllib.parse.urlsplit(url)
+        if(parsed.scheme == "file"):
+            path = urllib.request.url2pathname(parsed.path)
+            if(os.path.isdir(path)):
+                path = os.path.join(path, "index.html")
+            with open(path, "rb") as file:
+                return "text/html", file.read()
+        request = urllib.request.Request(url, headers = {"Accept": _simpleAccept})
+        with urllib.request.urlopen(request, timeout = self.timeout) as response:
+            return response.headers.get_content_type(), response.read()
+
+    def _parseJson(self, content: bytes) -> Dict[str, IndexFile]:
+        files = dict()
+        for file in json.loads(content).get("files", []):
+            hash = file.get("hashes", {}).get("sha256", None)
+            files[file["filename"]] = IndexFile(name = file["filename"], project = "", url = file["url"], hash = hash.lower() if hash else None, size = file.get("size", None))
+        return files
+
+    def _parseHtml(self, pageUrl: str, content: bytes) -> Dict[str, IndexFile]:
+        parser = _AnchorParser()
+        parser.feed(content.decode("utf-8", errors = "replace"))
+        files = dict()
+        for href in parser.hrefs:
+            url = urllib.parse.urljoin(pageUrl, href)
+            name = _fileName(url)
+            files[name] = IndexFile(name = name, project = "", url = url, hash = _fragmentHash(url))
+        return files
+
+    def getProjectFiles(self, project: str) -> Dict[str, IndexFile]:
+        """Returns files of project keyed by filename"""
+        project = normalizeProjectName(project)
+        if(project not in self._projects):
+            pageUrl = self.indexUrl + project + "/"
+            contentType, content = self._fetch(pageUrl)
+            if(contentType.endswith("json")):
+                files = self._parseJson(content)
+            else:
+                files = self._parseHtml(pageUrl, content)
+            for file in files.values():
+                file.project = project
+            self._projects[project] = files
+        return self._projects[project]
+
+    def getFileHash(self, project: str, fileName: str) -> Optional[str]:
+        try:
+            file = self.getProjectFiles(project).get(fileName, None)
+        except (OSError, ValueError) as e:
+            logger.warning("Can't read index page of " + project + ": " + str(e))
+            return None
+        return file.hash if file else None
+
+
+def hashUrl(url: str, bufferSize: int = defaultBufferSize, timeout: float = 60) -> Tuple[str, int]:
+    """Downloads url and returns its sha256 hexdigest and size, content is hashed while streaming and never stored"""
+    hashed = hashlib.sha256()
+    size = 0
+    with urllib.request.urlopen(urllib.parse.urldefrag(url)[0], timeout = timeout) as response:
+        chunk = response.read(bufferSize)
+        while chunk:
+            size = size + len(chunk)
+            hashed.update(chunk)
+            chunk = response.read(bufferSize)
+    return hashed.hexdigest(), size
@@ -0,0 +1,392 @@
+import hashlib
+import logging
+import os
+import struct
+import threading
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from cas_pip.models import schema_pb2
+from .caches import getDefaultCacheDirectory, _openDatabase
+
+logger = logging.getLogger("cas_pip.proofs")
+
+leafPrefix = b"\x00"
+nodePrefix = b"\x01"
+# Prefixes immudb adds to keys and values of entries
+setKeyPrefix = b"\x00"
+plainValuePrefix = b"\x00"
+referenceValuePrefix = b"\x01"
+
+_sha256 = hashlib.sha256
+_uint64 = struct.Struct(">Q")
+# ts, version, nentries (version 0) or length of metadata (version 1)
+_headerStart = struct.Struct(">QHH")
+_uint32 = struct.Struct(">I")
+_uint16 = struct.Struct(">H")
+
+
+class ProofVerificationError(Exception):
+    pass
+
+
+class TrustedState(BaseModel):
+    """Last verified state of ledger, every next response has to be provably consistent with it"""
+    db: str = ""
+    txId: int = 0
+    txHash: bytes = b""
+
+
+class TrustedStateStore:
+    """SQLite store of last verified ledger state per server and database (db of its CurrentState).
+    SQLite file locking makes it safe to share between concurrent processes,
+    stored state is only ever replaced by state of newer transaction"""
+    def __init__(self, path: str = None):
+        if(path == None):
+            path = os.path.join(getDefaultCacheDirectory(), "state.sqlite")
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = _openDatabase(path)
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS ledgerStates (
+            server TEXT NOT NULL,
+            db TEXT NOT NULL,
+            txId INTEGER NOT NULL,
+            txHash BLOB NOT NULL,
+            PRIMARY KEY (server, db)
+        )""")
+
+    def load(self, server: str, db: str) -> Optional[TrustedState]:
+        with self._lock:
+            row = self._connection.execute("SELECT txId, txHash FROM ledgerStates WHERE server = ? AND db = ?", (server, db)).fetchone()
+        if(row == None):
+            return None
+        return TrustedState(db = db, txId = row[0], txHash = bytes(row[1]))
+
+    def save(self, server: str, state: TrustedState) -> bool:
+        """Stores state unless newer one is stored already, returns if it was stored"""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT txId FROM ledgerStates WHERE server = ? AND db = ?", (server, state.db)).fetchone()
+                stored = row == None or row[0] < state.txId
+                if(stored):
+                    connection.execute("INSERT OR REPLACE INTO ledgerStates (server, db, txId, txHash) VALUES (?, ?, ?, ?)", (server, state.db, state.txId, state.txHash))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return stored
+
+    def close(self):
+        with self._lock:
+            if(self._connection != None):
+                self._connection.close()
+                self._connection = None
+
+
+class _NodeHasher:
+    """Hashes inner tree nodes in one reusable buffer, nodePrefix + left + right"""
+    __slots__ = ("buffer", )
+
+    def __init__(self):
+        self.buffer = bytearray(nodePrefix + bytes(64))
+
+    def hash(self, left: bytes, right: bytes) -> bytes:
+        if(len(left) != 32 or len(right) != 32):
+            raise ProofVerificationError("Proof term isn't sha256 digest")
+        buffer = self.buffer
+        buffer[1:33] = left
+        buffer[33:65] = right
+        return _sha256(buffer).digest()
+
+
+_leafHasher = _sha256(leafPrefix)
+
+
+def leafFor(digest: bytes) -> bytes:
+    hashed = _leafHasher.copy()
+    hashed.update(digest)
+    return hashed.digest()
+
+
+def kvMetadataBytes(metadata: Optional[schema_pb2.KVMetadata]) -> bytes:
+    """Serialized KVMetadata as included in entry digest, attributes ordered by code"""
+    if(metadata == None):
+        return b""
+    serialized = b""
+    if(metadata.deleted):
+        serialized = serialized + b"\x00"
+    if(metadata.HasField("expiration")):
+        serialized = serialized + b"\x01" + _uint64.pack(metadata.expiration.expiresAt)
+    if(metadata.nonIndexable):
+        serialized = serialized + b"\x02"
+    return serialized
+
+
+def entryDigest(version: int, key: bytes, value: bytes, metadata: Optional[schema_pb2.KVMetadata] = None) -> bytes:
+    """Digest of prefixed key and value of entry included in transaction of given header version"""
+    hashedValue = _sha256(value).digest()
+    if(version == 0):
+        if(metadata != None and kvMetadataBytes(metadata)):
+            raise ProofVerificationError("Metadata isn't supported by transaction version 0")
+        return _sha256(key + hashedValue).digest()
+    if(version == 1):
+        serializedMetadata = kvMetadataBytes(metadata)
+        return _sha256(_uint16.pack(len(serializedMetadata)) + serializedMetadata + _uint16.pack(len(key)) + key + hashedValue).digest()
+    raise ProofVerificationError(f"Unsupported transaction version {version}")
+
+
+def txInnerHash(header: schema_pb2.TxHeader) -> bytes:
+    if(header.version == 0):
+        start = _headerStart.pack(header.ts & 0xFFFFFFFFFFFFFFFF, 0, header.nentries)
+    elif(header.version == 1):
+        # Transaction metadata has no attributes yet, it's serialized empty
+        start = _headerStart.pack(header.ts & 0xFFFFFFFFFFFFFFFF, 1, 0) + _uint32.pack(header.nentries)
+    else:
+        raise ProofVerificationError(f"Unsupported transaction version {header.version}")
+    return _sha256(start + header.eH + _uint64.pack(header.blTxId) + header.blRoot).digest()
+
+
+def txAlh(header: schema_pb2.TxHeader) -> bytes:
+    """Accumulative linear hash of transaction, sha256(id + prevAlh + innerHash)"""
+    return _sha256(_uint64.pack(header.id) + header.prevAlh + txInnerHash(header)).digest()
+
+
+def verifyInclusion(proof: schema_pb2.InclusionProof, digest: bytes, root: bytes, hasher: _NodeHasher = None) -> bool:
+    """Inclusion of entry digest in transaction entries tree with root eH"""
+    hasher = hasher or _NodeHasher()
+    calculated = leafFor(digest)
+    i = proof.leaf
+    r = proof.width - 1
+    for term in proof.terms:
+        if(i % 2 == 0 and i != r):
+            calculated = hasher.hash(calculated, term)
+        else:
+            calculated = hasher.hash(term, calculated)
+        i = i // 2
+        r = r // 2
+    return i == r and calculated == root
+
+
+def verifyInclusionAHT(proof: List[bytes], i: int, j: int, iLeaf: bytes, jRoot: bytes, hasher: _NodeHasher = None) -> bool:
+    """Inclusion of leaf i in append-only hash tree of j leaves with root jRoot"""
+    if(i > j or i == 0 or (i < j and len(proof) == 0)):
+        return False
+    hasher = hasher or _NodeHasher()
+    i1 = i - 1
+    j1 = j - 1
+    calculated = iLeaf
+    for term in proof:
+        if(i1 % 2 == 0 and i1 != j1):
+            calculated = hasher.hash(calculated, term)
+        else:
+            calculated = hasher.hash(term, calculated)
+        i1 = i1 >> 1
+        j1 = j1 >> 1
+    return calculated == jRoot
+
+
+def verifyLastInclusion(proof: List[bytes], i: int, leaf: bytes, root: bytes, hasher: _NodeHasher = None) -> bool:
+    if(i == 0):
+        return False
+    hasher = hasher or _NodeHasher()
+    calculated = leaf
+    for term in proof:
+        calculated = hasher.hash(term, calculated)
+    return calculated == root
+
+
+def verifyConsistency(proof: List[bytes], i: int, j: int, iRoot: bytes, jRoot: bytes, hasher: _NodeHasher = None) -> bool:
+    """Append-only hash tree of i leaves with root iRoot is prefix of tree of j leaves with root jRoot"""
+    if(i > j or i == 0 or (i < j and len(proof) == 0)):
+        return False
+    if(i == j and len(proof) == 0):
+        return iRoot == jRoot
+    hasher = hasher or _NodeHasher()
+    fn = i - 1
+    sn = j - 1
+    while(fn % 2 == 1):
+        fn = fn >> 1
+        sn = sn >> 1
+    ciRoot = proof[0]
+    cjRoot = proof[0]
+    for term in proof[1:]:
+        if(fn % 2 == 1 or fn == sn):
+            ciRoot = hasher.hash(term, ciRoot)
+            cjRoot = hasher.hash(term, cjRoot)
+            while(fn % 2 == 0 and fn != 0):
+                fn = fn >> 1
+                sn = sn >> 1
+        else:
+            cjRoot = hasher.hash(cjRoot, term)
+        fn = fn >> 1
+        sn = sn >> 1
+    return ciRoot == iRoot and cjRoot == jRoot
+
+
+def verifyLinearProof(proof: schema_pb2.LinearProof, sourceTxId: int, targetTxId: int, sourceAlh: bytes, targetAlh: bytes, knownAlhs: Dict[int, bytes] = None) -> bool:
+    """Target Alh is reached from source Alh by chaining inner hashes of transactions between them.
+    When proof holds, Alhs of all chained transactions are added to knownAlhs"""
+    if(proof.sourceTxId != sourceTxId or proof.TargetTxId != targetTxId):
+        return False
+    if(sourceTxId == 0 or sourceTxId > targetTxId or len(proof.terms) == 0 or proof.terms[0] != sourceAlh):
+        return False
+    if(len(proof.terms) != targetTxId - sourceTxId + 1):
+        return False
+    buffer = bytearray(72)
+    calculated = proof.terms[0]
+    chained = [calculated]
+    for index in range(1, len(proof.terms)):
+        if(len(proof.terms[index]) != 32):
+            return False
+        _uint64.pack_into(buffer, 0, sourceTxId + index)
+        buffer[8:40] = calculated
+        buffer[40:72] = proof.terms[index]
+        calculated = _sha256(buffer).digest()
+        chained.append(calculated)
+    if(calculated != targetAlh):
+        return False
+    if(knownAlhs != None):
+        for index, alh in enumerate(chained):
+            knownAlhs[sourceTxId + index] = alh
+    return True
+
+
+def verifyDualProof(proof: schema_pb2.DualProof, sourceTxId: int, targetTxId: int, sourceAlh: bytes, targetAlh: bytes, hasher: _NodeHasher = None, knownAlhs: Dict[int, bytes] = None) -> bool:
+    """Transaction targetTxId is consistent with sourceTxId (sourceTxId <= targetTxId).
+    When proof holds, Alhs of both transactions and of transactions chained by linear proof are added to knownAlhs"""
+    source = proof.sourceTxHeader
+    target = proof.targetTxHeader
+    if(source.id != sourceTxId or target.id != targetTxId):
+        return False
+    if(source.id == 0 or source.id > target.id):
+        return False
+    if(txAlh(source) != sourceAlh or txAlh(target) != targetAlh):
+        return False
+    hasher = hasher or _NodeHasher()
+    if(sourceTxId < target.blTxId):
+        if(not verifyInclusionAHT(list(proof.inclusionProof), sourceTxId, target.blTxId, leafFor(sourceAlh), target.blRoot, hasher)):
+            return False
+    if(source.blTxId > 0):
+        if(not verifyConsistency(list(proof.consistencyProof), source.blTxId, target.blTxId, source.blRoot, target.blRoot, hasher)):
+            return False
+    if(target.blTxId > 0):
+        if(not verifyLastInclusion(list(proof.lastInclusionProof), target.blTxId, leafFor(proof.targetBlTxAlh), target.blRoot, hasher)):
+            return False
+    if(sourceTxId < target.blTxId):
+        if(not verifyLinearProof(proof.linearProof, target.blTxId, targetTxId, proof.targetBlTxAlh, targetAlh, knownAlhs)):
+            return False
+    elif(not verifyLinearProof(proof.linearProof, sourceTxId, targetTxId, sourceAlh, targetAlh, knownAlhs)):
+        return False
+    if(knownAlhs != None):
+        knownAlhs[sourceTxId] = sourceAlh
+    return True
+
+
+def verifyEntry(verifiableEntry: schema_pb2.VerifiableEntry, key: bytes, state: TrustedState, knownAlhs: Dict[int, bytes] = None) -> TrustedState:
+    """Verifies that entry of key is included in its transaction and that transaction is consistent with state.
+    knownAlhs are Alhs of transactions already proven consistent with state, dual proof of such transaction
+    isn't verified again. Returns state of newer of both transactions, raises ProofVerificationError"""
+    entry = verifiableEntry.entry
+    dualProof = verifiableEntry.verifiableTx.dualProof
+    version = verifiableEntry.verifiableTx.tx.header.version
+    metadata = entry.metadata if entry.HasField("metadata") else None
+    if(entry.HasField("referencedBy") and entry.referencedBy.key):
+        reference = entry.referencedBy
+        entryTx = reference.tx
+        digest = entryDigest(version, setKeyPrefix + reference.key, referenceValuePrefix + _uint64.pack(reference.atTx) + setKeyPrefix + entry.key, reference.metadata if reference.HasField("metadata") else None)
+        if(reference.key != key):
+            raise ProofVerificationError("Response is for other key")
+    else:
+        entryTx = entry.tx
+        if(entry.key != key):
+            raise ProofVerificationError("Response is for other key")
+        digest = entryDigest(version, setKeyPrefix + key, plainValuePrefix + entry.value, metadata)
+    if(state.txId <= entryTx):
+        entryHeader = dualProof.targetTxHeader
+        entryAlh = txAlh(entryHeader)
+        sourceId, sourceAlh = state.txId, state.txHash
+        targetId, targetAlh = entryTx, entryAlh
+    else:
+        entryHeader = dualProof.sourceTxHeader
+        entryAlh = txAlh(entryHeader)
+        sourceId, sourceAlh = entryTx, entryAlh
+        targetId, targetAlh = state.txId, state.txHash
+    hasher = _NodeHasher()
+    if(entryHeader.id != entryTx):
+        raise ProofVerificationError(f"Proof is for transaction {entryHeader.id} instead of {entryTx}")
+    if(not verifyInclusion(verifiableEntry.inclusionProof, digest, entryHeader.eH, hasher)):
+        raise ProofVerificationError(f"Entry isn't included in transaction {entryTx}")
+    if(state.txId > 0 and (knownAlhs == None or knownAlhs.get(entryTx) != entryAlh)):
+        if(not verifyDualProof(dualProof, sourceId, targetId, sourceAlh, targetAlh, hasher, knownAlhs)):
+            raise ProofVerificationError(f"Transaction {entryTx} isn't consistent with trusted transaction {state.txId}")
+    elif(knownAlhs != None):
+        knownAlhs[entryTx] = entryAlh
+    return TrustedState.construct(db = state.db, txId = targetId, txHash = targetAlh)
+
+
+class ProofVerifier:
+    """Verifies VerifiableGetExt responses against trusted state and moves state forward with every verified response.
+    With store, state of server is loaded from it and newest verified state is saved to it on flush or close.
+    Without any state, current state of server or first response is trusted (trust on first use).
+    Alhs of transactions proven during run are remembered, so responses from the same or already chained
+    transactions are verified only by inclusion of their entry"""
+    maxKnownAlhs = 1 << 16
+
+    def __init__(self, state: TrustedState = None, store: TrustedStateStore = None):
+        self.state = state if state != None else TrustedState()
+        self.store = store
+        self.server = None
+        self.verified = 0
+        self.knownAlhs: Dict[int, bytes] = dict()
+        self._unsaved = False
+        self._remember(self.state)
+
+    def _remember(self, state: TrustedState):
+        if(state.txId > 0):
+            self.knownAlhs[state.txId] = state.txHash
+
+    def load(self, server: str, db: str = ""):
+        """Uses state stored for database db of server when it's newer, db is empty when it isn't known"""
+        self.server = server
+        if(self.store and (self.state.txId == 0 or self.state.db == db)):
+            stored = self.store.load(server, db)
+            if(stored != None and stored.txId > self.state.txId):
+                self.state = stored
+                self._remember(stored)
+
+    def _advance(self, state: TrustedState):
+        # Responses to concurrent requests may arrive out of order, state only moves forward
+        if(state.txId > self.state.txId):
+            self.state = state
+            self._unsaved = True
+            self._remember(state)
+
+    def trust(self, state: TrustedState):
+        """Trusts unverified state (e.g. CurrentState of server) when there's no trusted state yet"""
+        if(self.state.txId == 0):
+            self._advance(state)
+
+    def flush(self):
+        if(self.store and self.server != None and self._unsaved):
+            self.store.save(self.server, self.state)
+        self._unsaved = False
+
+    def close(self):
+        self.flush()
+        if(self.store):
+            self.store.close()
+
+    def verify(self, item, key: bytes, state: TrustedState) -> TrustedState:
+        """Verifies VerifiableItemExt requested with proveSinceTx of given state"""
+        if(len(self.knownAlhs) > self.maxKnownAlhs):
+            self.knownAlhs = dict()
+            self._remember(self.state)
+        try:
+            newState = verifyEntry(item.item, key, state, self.knownAlhs)
+        except ProofVerificationError as e:
+            logger.error(f"Verification of {key.decode('utf-8', errors = 'replace')} failed: {e}")
+            raise
+        self.verified = self.verified + 1
+        self._advance(newState)
+        return newState
@@ -0,0 +1,86 @@
+import os
+import re
+from typing import List
+from pydantic import BaseModel
+
+_hashOption = re.compile(r"--hash[=\s]+sha256:([0-9a-fA-F]{64})")
+_comment = re.compile(r"(^|\s+)#.*$")
+_name = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)")
+_findLinks = re.compile(r"^(-f|--find-links)([=\s]+)(\S+)$")
+
+
+class PinnedRequirement(BaseModel):
+    name: str
+    specifier: str
+    hashes: List[str]
+    line: str = ""
+
+    def artifactName(self, hash: str):
+        return f"{self.specifier}#sha256={hash}"
+
+    def isFullyPinned(self):
+        """Pinned to exact version and with --hash, as pip-compile --generate-hashes writes it"""
+        return "==" in self.specifier and bool(self.hashes)
+
+    def withoutHashes(self):
+        """Requirement line without --hash options"""
+        return _hashOption.sub("", self.line).strip()
+
+
+def _logicalLines(content: str):
+    # Joins lines continued with backslash, the way pip does it
+    current = ""
+    for line in content.splitlines():
+        if(line.endswith("\\")):
+            current = current + line[:-1] + " "
+            continue
+        yield current + line
+        current = ""
+    if(current):
+        yield current
+
+
+def _resolveOption(line: str, directory: str):
+    # Relative --find-links are relative to requirements file, option can be used from other directory
+    findLinks = _findLinks.match(line)
+    if(findLinks and "://" not in findLinks.group(3) and not os.path.isabs(findLinks.group(3))):
+        return findLinks.group(1) + findLinks.group(2) + os.path.abspath(os.path.join(directory, findLinks.group(3)))
+    return line
+
+
+def parseRequirementsFile(path: str, _seen = None, options: List[str] = None) -> List[PinnedRequirement]:
+    """Parses requirements file (including nested -r files) into requirements with pinned sha256 hashes.
+    Requirements without --hash are returned with empty hashes, global option lines are appended to options when given,
+    with relative --find-links paths made absolute"""
+    seen = _seen if _seen != None else set()
+    realPath = os.path.realpath(path)
+    if(realPath in seen):
+        return []
+    seen.add(realPath)
+    with open(path, "r") as file:
+        content = file.read()
+    requirements = []
+    for line in _logicalLines(content):
+        line = _comment.sub("", line).strip()
+        if(not line):
+            continue
+        nested = re.match(r"^(-r|--requirement)[=\s]*(\S+)$", line)
+        if(nested):
+            nestedPath = os.path.join(os.path.dirname(path), nested.group(2))
+            requirements.extend(parseRequirementsFile(nestedPath, seen, options))
+            continue
+        if(line.startswith("-")):
+            # Global options, constraints and editables carry no pinned artifacts
+            if(options != None and not re.match(r"^(-c|--constraint|-e|--editable)\b", line)):
+                options.append(_resolveOption(line, os.path.dirname(path)))
+            continue
+        hashes = [hash.lower() for hash in _hashOption.findall(line)]
+        specifier = re.split(r"\s+--|\s*;", line, maxsplit = 1)[0].replace(" ", "")
+        name = _name.match(specifier)
+        requirements.append(PinnedRequirement(
+            name = name.group(1) if name else specifier,
+            specifier = specifier,
+            hashes = list(dict.fromkeys(hashes)),
+            line = line
+        ))
+    return requirements
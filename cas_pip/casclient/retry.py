@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import grpc
+
+logger = logging.getLogger("cas_pip.retry")
+
+defaultRetryableCodes = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+
+
+class RetryBudget:
+    """Token bucket limiting retries the way gRPC retry throttling does.
+    Every retryable failure takes one token, every success returns tokenRatio tokens,
+    retries are allowed only while more than half of maxTokens is left"""
+    def __init__(self, maxTokens: float = 10, tokenRatio: float = 0.1):
+        self.maxTokens = maxTokens
+        self.tokenRatio = tokenRatio
+        self.tokens = maxTokens
+        self._lock = threading.Lock()
+
+    def succeeded(self):
+        with self._lock:
+            self.tokens = min(self.maxTokens, self.tokens + self.tokenRatio)
+
+    def failed(self) -> bool:
+        """Records retryable failure, returns if retry is allowed"""
+        with self._lock:
+            self.tokens = max(0, self.tokens - 1)
+            return self.tokens > self.maxTokens / 2
+
+
+class RetryMetrics:
+    """Counts attempts of calls by method and result status code"""
+    def __init__(self):
+        self.attempts = dict()
+        self.retries = 0
+        self.exhausted = 0
+        self.throttled = 0
+        self.attemptTime = 0.0
+        self._lock = threading.Lock()
+
+    def attempt(self, method: str, code: grpc.StatusCode, elapsed: float, attempt: int):
+        with self._lock:
+            key = (method, code.name)
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            self.attemptTime = self.attemptTime + elapsed
+        logger.debug(f"{method} attempt {attempt} finished with {code.name} in {elapsed:.3f}s")
+
+    def retried(self):
+        with self._lock:
+            self.retries = self.retries + 1
+
+    def gaveUp(self, throttled: bool):
+        with self._lock:
+            if(throttled):
+                self.throttled = self.throttled + 1
+            else:
+                self.exhausted = self.exhausted + 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "attempts": {method + " " + code: count for (method, code), count in self.attempts.items()},
+                "retries": self.retries,
+                "exhausted": self.exhausted,
+                "throttled": self.throttled,
+                "attemptTime": self.attemptTime
+            }
+
+
+class RetryPolicy:
+    """Retries calls failed with one of retryableCodes up to maxAttempts attempts in total.
+    Waits exponentially growing backoff with full jitter between attempts, retries are limited by budget"""
+    def __init__(self, maxAttempts: int = 3, initialBackoff: float = 0.2, maxBackoff: float = 5.0, multiplier: float = 2.0, retryableCodes: Iterable[grpc.StatusCode] = defaultRetryableCodes, budget: RetryBudget = None):
+        self.maxAttempts = max(1, maxAttempts)
+        self.initialBackoff = initialBackoff
+        self.maxBackoff = maxBackoff
+        self.multiplier = multiplier
+        self.retryableCodes = frozenset(retryableCodes)
+        self.budget = budget if budget != None else RetryBudget()
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before attempt + 1"""
+        return random.uniform(0, min(self.maxBackoff, self.initialBackoff * self.multiplier ** (attempt - 1)))
+
+    def nextDelay(self, attempt: int, code: grpc.StatusCode) -> Tuple[Optional[float], bool]:
+        """Returns (delay before next attempt or None when call shouldn't be retried, throttled by budget)"""
+        if(code not in self.retryableCodes):
+            return None, False
+        allowed = self.budget.failed()
+        if(attempt >= self.maxAttempts):
+            return None, False
+        if(not allowed):
+            return None, True
+        return self.backoff(attempt), False
+
+
+noRetryPolicy = RetryPolicy(maxAttempts = 1)
+
+
+async def asyncCallWithRetry(policy: RetryPolicy, metrics: RetryMetrics, method: str, call: Callable[[], Awaitable]):
+    """Awaits call() until it succeeds or policy gives up, then raises last grpc.RpcError"""
+    attempt = 1
+    while True:
+        started = time.monotonic()
+        try:
+            response = await call()
+        except grpc.RpcError as e:
+            metrics.attempt(method, e.code(), time.monotonic() - started, attempt)
+            delay, throttled = policy.nextDelay(attempt, e.code())
+            if(delay == None):
+                if(e.code() in policy.retryableCodes):
+                    metrics.gaveUp(throttled)
+                raise
+            metrics.retried()
+            await asyncio.sleep(delay)
+            attempt = attempt + 1
+            continue
+        metrics.attempt(method, grpc.StatusCode.OK, time.monotonic() - started, attempt)
+        policy.budget.succeeded()
+        return response
+
+
+def callWithRetry(policy: RetryPolicy, metrics: RetryMetrics, method: str, call: Callable):
+    """Blocking version of asyncCallWithRetry"""
+    attempt = 1
+    while True:
+        started = time.monotonic()
+        try:
+            response = call()
+        except grpc.RpcError as e:
+            metrics.attempt(method, e.code(), time.monotonic() - started, attempt)
+            delay, throttled = policy.nextDelay(attempt, e.code())
+            if(delay == None):
+                if(e.code() in policy.retryableCodes):
+                    metrics.gaveUp(throttled)
+                raise
+            metrics.retried()
+            time.sleep(delay)
+            attempt = attempt + 1
+            continue
+        metrics.attempt(method, grpc.StatusCode.OK, time.monotonic() - started, attempt)
+        policy.budget.succeeded()
+        return response
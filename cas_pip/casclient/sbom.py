@@ -0,0 +1,61 @@
+import json
+from typing import Any, TextIO
+from pydantic.json import pydantic_encoder
+
+
+class SbomWriter:
+    """Writes {key: {name: value, ...}} record by record as results arrive instead of serializing whole model at the end.
+    Output of json format is byte-identical with json() of pydantic model holding such dict
+    (ArtifactList(...).json(indent = 4), ArtifactStatusList(...).json()) when names are unique.
+    ndjson format writes one compact line {"name": name, ndjsonField: value} per record.
+    finish() closes json document, stream of failed run has to be discarded by its owner instead of being published"""
+    def __init__(self, stream: TextIO, key: str = "statuses", indent: int = None, format: str = "json", ndjsonField: str = "value", flush: bool = True):
+        if(format not in ("json", "ndjson")):
+            raise ValueError("Unknown format " + format)
+        self.stream = stream
+        self.key = key
+        self.indent = indent
+        self.format = format
+        self.ndjsonField = ndjsonField
+        self.flush = flush
+        self.count = 0
+        self.finished = False
+
+    def _emit(self, text: str):
+        self.stream.write(text)
+        if(self.flush):
+            self.stream.flush()
+
+    def _header(self):
+        if(self.indent == None):
+            return "{" + json.dumps(self.key) + ": {"
+        return "{\n" + " " * self.indent + json.dumps(self.key) + ": {"
+
+    def _record(self, name: str, value: Any):
+        if(self.indent == None):
+            separator = ", " if self.count else ""
+            return separator + json.dumps(name) + ": " + json.dumps(value, default = pydantic_encoder)
+        prefix = "\n" + " " * (self.indent * 2)
+        encoded = json.dumps(value, default = pydantic_encoder, indent = self.indent).replace("\n", prefix)
+        return ("," if self.count else "") + prefix + json.dumps(name) + ": " + encoded
+
+    def write(self, name: str, value: Any):
+        if(self.format == "ndjson"):
+            self._emit(json.dumps({"name": name, self.ndjsonField: value}, default = pydantic_encoder) + "\n")
+        else:
+            self._emit((self._header() if self.count == 0 else "") + self._record(name, value))
+        self.count = self.count + 1
+
+    def finish(self):
+        if(self.finished):
+            return
+        self.finished = True
+        if(self.format == "ndjson"):
+            return
+        if(self.count == 0):
+            self._emit(self._header())
+        if(self.indent == None or self.count == 0):
+            closing = "}}" if self.indent == None else "}\n}"
+        else:
+            closing = "\n" + " " * self.indent + "}\n}"
+        self._emit(closing)
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Union, AsyncIterable
+
+
+_finished = object()
+
+
+class ConcurrencyLimit:
+    """Counting limit of tasks in flight which can be changed while tasks are running"""
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.inFlight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            while self.inFlight >= self.limit:
+                await self._condition.wait()
+            self.inFlight = self.inFlight + 1
+
+    async def release(self):
+        async with self._condition:
+            self.inFlight = self.inFlight - 1
+            self._condition.notify_all()
+
+    async def setLimit(self, limit: int):
+        async with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+
+class AdaptiveConcurrency:
+    """AIMD controller of concurrency.
+    Grows by one after a full window of healthy completions, shrinks by one when latency
+    degrades over tolerance * best observed latency and halves on overload (RESOURCE_EXHAUSTED)"""
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64, latencyTolerance: float = 2.0, smoothing: float = 0.2):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.current = min(max(initial, self.minimum), self.maximum)
+        self.latencyTolerance = latencyTolerance
+        self.smoothing = smoothing
+        self.bestLatency = None
+        self.smoothedLatency = None
+        self._healthy = 0
+
+    def onCompleted(self, latency: float, overloaded: bool = False) -> int:
+        if(overloaded):
+            self.current = max(self.minimum, self.current // 2)
+            self._healthy = 0
+            return self.current
+        if(self.smoothedLatency == None):
+            self.smoothedLatency = latency
+        else:
+            self.smoothedLatency = self.smoothing * latency + (1 - self.smoothing) * self.smoothedLatency
+        if(self.bestLatency == None or latency < self.bestLatency):
+            self.bestLatency = latency
+        if(self.smoothedLatency > self.bestLatency * self.latencyTolerance):
+            self.current = max(self.minimum, self.current - 1)
+            self._healthy = 0
+        else:
+            self._healthy = self._healthy + 1
+            if(self._healthy >= self.current):
+                self.current = min(self.maximum, self.current + 1)
+                self._healthy = 0
+        return self.current
+
+
+class TaskScheduler:
+    """Keeps up to concurrency awaitables in flight until source is exhausted.
+    Source can be iterable or async iterable of awaitables, results are returned in source order.
+    onDone is called with result of every completed awaitable, onOrdered with results in source order
+    as soon as all earlier awaitables completed.
+    overloadProbe returns counter of overload errors, used by adaptive mode to back off.
+    When run() is cancelled or any awaitable fails, awaitables in flight are cancelled and source is closed"""
+    def __init__(self, concurrency: int, adaptive: bool = False, maxConcurrency: int = 64, overloadProbe: Callable[[], int] = None, onDone: Callable[[Any], None] = None, onOrdered: Callable[[Any], None] = None):
+        self.concurrency = max(1, concurrency)
+        self.adaptive = adaptive
+        self.maxConcurrency = max(self.concurrency, maxConcurrency) if adaptive else self.concurrency
+        self.overloadProbe = overloadProbe
+        self.onDone = onDone
+        self.onOrdered = onOrdered
+        self.controller = AdaptiveConcurrency(self.concurrency, maximum = self.maxConcurrency) if adaptive else None
+
+    async def run(self, source: Union[Iterable[Awaitable], AsyncIterable[Awaitable]]) -> List[Any]:
+        if(hasattr(source, "__aiter__")):
+            iterator = source.__aiter__()
+            isAsync = True
+        else:
+            iterator = iter(source)
+            isAsync = False
+        sourceLock = asyncio.Lock()
+        limit = ConcurrencyLimit(self.concurrency)
+        results = dict()
+        counter = [0]
+        ordered = [0]
+        lastOverloads = [self.overloadProbe() if self.overloadProbe else 0]
+
+        async def nextItem():
+            async with sourceLock:
+                try:
+                    if(isAsync):
+                        item = await iterator.__anext__()
+                    else:
+                        item = next(iterator)
+                except (StopIteration, StopAsyncIteration):
+                    return None, _finished
+                index = counter[0]
+                counter[0] = index + 1
+                return index, item
+
+        async def worker():
+            while True:
+                await limit.acquire()
+                try:
+                    index, item = await nextItem()
+                    if(item is _finished):
+                        return
+                    started = time.monotonic()
+                    results[index] = await item
+                    latency = time.monotonic() - started
+                finally:
+                    await limit.release()
+                if(self.controller):
+                    overloads = self.overloadProbe() if self.overloadProbe else 0
+                    overloaded = overloads > lastOverloads[0]
+                    lastOverloads[0] = overloads
+                    newLimit = self.controller.onCompleted(latency, overloaded)
+                    if(newLimit != limit.limit):
+                        await limit.setLimit(newLimit)
+                if(self.onDone):
+                    self.onDone(results[index])
+                if(self.onOrdered):
+                    while(ordered[0] in results):
+                        self.onOrdered(results[ordered[0]])
+                        ordered[0] = ordered[0] + 1
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.maxConcurrency)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions = True)
+            if(not isAsync):
+                # Coroutines never scheduled would warn that they were never awaited
+                for item in iterator:
+                    if(hasattr(item, "close")):
+                        item.close()
+            elif(hasattr(iterator, "aclose")):
+                # Cancellation reaches also source, e.g. downloads and hashing feeding it
+                await iterator.aclose()
+            raise
+        return [results[index] for index in range(counter[0])]
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from .downloader import pipDownloadArgs, runPip
+from .index import resolveRequirements
+
+logger = logging.getLogger("cas_pip.wheelhouse")
+
+
+def _linkOrCopy(source: str, destination: str):
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Other filesystem or no hardlinks support
+        shutil.copy2(source, destination)
+
+
+class Wheelhouse:
+    """Persistent content addressed store of downloaded packages shared between runs and commands.
+    Files are kept as objects/<hash[:2]>/<hash>/<filename>, modification time of hash directory marks last use"""
+    # Leftovers of killed runs in tmp/ are removed by collect() after this many seconds
+    staleTemporaryAge = 24 * 3600
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self.objectsDirectory = os.path.join(self.directory, "objects")
+        self.temporaryRoot = os.path.join(self.directory, "tmp")
+        os.makedirs(self.objectsDirectory, exist_ok = True)
+        os.makedirs(self.temporaryRoot, exist_ok = True)
+
+    def temporaryDirectory(self):
+        """Download directory on the same filesystem as store, so files are added by hardlinking"""
+        return tempfile.TemporaryDirectory(dir = self.temporaryRoot)
+
+    def _objectDirectory(self, hash: str):
+        return os.path.join(self.objectsDirectory, hash[:2], hash)
+
+    def get(self, hash: str) -> Optional[str]:
+        """Returns path of stored file with given sha256 and marks it as recently used, None when not stored"""
+        objectDirectory = self._objectDirectory(hash)
+        try:
+            names = os.listdir(objectDirectory)
+        except FileNotFoundError:
+            return None
+        if(not names):
+            return None
+        os.utime(objectDirectory)
+        return os.path.join(objectDirectory, names[0])
+
+    def add(self, filePath: str, hash: str, fileName: str = None) -> str:
+        """Stores file under its sha256, marks it as recently used and returns stored path"""
+        if(fileName == None):
+            fileName = os.path.basename(filePath)
+        objectDirectory = self._objectDirectory(hash)
+        target = os.path.join(objectDirectory, fileName)
+        os.makedirs(objectDirectory, exist_ok = True)
+        if(not os.path.exists(target)):
+            partial = os.path.join(self.temporaryRoot, hash + "." + str(os.getpid()))
+            _linkOrCopy(filePath, partial)
+            os.replace(partial, target)
+        os.utime(objectDirectory)
+        return target
+
+    def _objects(self):
+        for prefix in os.listdir(self.objectsDirectory):
+            prefixDirectory = os.path.join(self.objectsDirectory, prefix)
+            for hash in os.listdir(prefixDirectory):
+                objectDirectory = os.path.join(prefixDirectory, hash)
+                size = sum(os.path.getsize(os.path.join(objectDirectory, name)) for name in os.listdir(objectDirectory))
+                yield os.stat(objectDirectory).st_mtime, size, objectDirectory
+
+    def size(self) -> int:
+        return sum(entry[1] for entry in self._objects())
+
+    def collect(self, maxAge: float = None, maxSize: int = None) -> int:
+        """Removes files unused for maxAge seconds, then least recently used files until store fits into maxSize bytes.
+        Returns number of removed files"""
+        now = time.time()
+        entries = sorted(self._objects())
+        total = sum(entry[1] for entry in entries)
+        removed = 0
+        for used, size, objectDirectory in entries:
+            if((maxAge != None and now - used > maxAge) or (maxSize != None and total > maxSize)):
+                shutil.rmtree(objectDirectory, ignore_errors = True)
+                total = total - size
+                removed = removed + 1
+        for name in os.listdir(self.temporaryRoot):
+            path = os.path.join(self.temporaryRoot, name)
+            if(now - os.stat(path).st_mtime > self.staleTemporaryAge):
+                if(os.path.isdir(path)):
+                    shutil.rmtree(path, ignore_errors = True)
+                else:
+                    os.unlink(path)
+        return removed
+
+
+class WheelhouseDownload:
+    """Resolves requirements without downloading packages, takes already stored packages from wheelhouse
+    and downloads only missing ones, which are then added to wheelhouse.
+    When requirements can't be resolved that way (VCS or local directories) whole requirements file is downloaded.
+    succeeded holds result once files() is exhausted"""
+    def __init__(self, wheelhouse: Wheelhouse, directory: str, reqFile: str, hashFile: Callable[[str], Awaitable[Tuple[str, int]]], quiet: bool = True, noCache: bool = True, additionalPipArgs: List[str] = []):
+        self.wheelhouse = wheelhouse
+        self.directory = directory
+        self.reqFile = reqFile
+        self.hashFile = hashFile
+        self.quiet = quiet
+        self.noCache = noCache
+        self.additionalPipArgs = additionalPipArgs
+        self.succeeded = None
+        self.reused = 0
+
+    async def _storeOne(self, name: str, path: str):
+        hash, size = await self.hashFile(path)
+        return name, self.wheelhouse.add(path, hash, name), hash, size
+
+    async def files(self) -> AsyncIterator[Tuple[str, str, str, int]]:
+        """Yields (packageName, storedPath, hash, size), storing not yet finished is cancelled when iteration stops early"""
+        resolved = await resolveRequirements(self.reqFile, self.quiet, self.noCache, additionalPipArgs = self.additionalPipArgs)
+        if(resolved == None):
+            logger.warning("Requirements can't be resolved without download, downloading all of them")
+            self.succeeded = await runPip(pipDownloadArgs(self.directory, self.reqFile, self.quiet, self.noCache, self.additionalPipArgs))
+        else:
+            missing = []
+            for indexFile in resolved:
+                stored = self.wheelhouse.get(indexFile.hash) if indexFile.hash else None
+                if(stored == None):
+                    # Fragment makes pip verify that it downloads file resolution has chosen
+                    missing.append(indexFile.url + ("#sha256=" + indexFile.hash if indexFile.hash else ""))
+                    continue
+                self.reused = self.reused + 1
+                yield indexFile.name, stored, indexFile.hash, os.path.getsize(stored)
+            self.succeeded = True
+            if(missing):
+                self.succeeded = await runPip(pipDownloadArgs(self.directory, None, self.quiet, self.noCache, ["--no-deps"] + self.additionalPipArgs + missing))
+        if(not self.succeeded):
+            return
+        pending = []
+        for file in os.walk(self.directory):
+            for name in file[2]:
+                pending.append(asyncio.ensure_future(self._storeOne(name, os.path.join(file[0], name))))
+        try:
+            for completed in asyncio.as_completed(pending):
+                yield await completed
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions = True)
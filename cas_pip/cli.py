@@ -1,11 +1,25 @@
 import logging
+import json
 import click
 import tempfile
+import shutil
 import asyncio
+import io
+from contextlib import contextmanager
 from functools import wraps
 import os
 import sys
-from .casclient.casclient import CASClient, ArtifactStatus, ArtifactList, ArtifactStatusList
+import time
+from .casclient.casclient import CASClient, ArtifactStatus, ArtifactList, ArtifactStatusList, ArtifactListingError, defaultMaxBatchBytes
+from .casclient.scheduler import TaskScheduler
+from .casclient.caches import HashCache, ResultCache, SqliteResultBackend, OfflineIndex
+from .casclient.requirements import parseRequirementsFile
+from .casclient.index import missingDependencies
+from .casclient.wheelhouse import Wheelhouse
+from .casclient.sbom import SbomWriter
+from .casclient.retry import RetryPolicy
+from .casclient.hedging import HedgePolicy
+from .casclient.proofs import ProofVerifier, TrustedStateStore
 
 notarizedReqFilename = "~NOTARIZED_REQ_FILE~"
 notarizedReqPipVersion = "~NOTARIZED_REQ_PIPVERSION~"
@@ -13,16 +27,154 @@ notarizedReqPipVersion = "~NOTARIZED_REQ_PIPVERSION~"
 logger = logging.getLogger("cas_pip_cli")
 
 
-def chunks(lst, n):
-    chunked = []
-    for i in range(0, len(lst), n):
-        chunked.append(lst[i:i + n])
-    return chunked
+def openHashCache(hashcache):
+    if(hashcache):
+        return HashCache()
+    return None
+
+def openResultCache(cacheTtl, negativeCacheTtl):
+    if(cacheTtl > 0 or negativeCacheTtl > 0):
+        return ResultCache(ttl = cacheTtl, negativeTtl = negativeCacheTtl, backend = SqliteResultBackend())
+    return None
+
+def openRetryPolicy(retries, retryBackoff):
+    return RetryPolicy(maxAttempts = retries + 1, initialBackoff = retryBackoff)
+
+def openHedgePolicy(hedge, hedgeDelay, hedgeMaxLoad):
+    if(hedge or hedgeDelay > 0):
+        return HedgePolicy(delay = hedgeDelay if hedgeDelay > 0 else None, maxExtraLoad = hedgeMaxLoad)
+    return None
+
+def openProofVerifier(verifyProofs):
+    if(verifyProofs):
+        return ProofVerifier(store = TrustedStateStore())
+    return None
+
+def openOfflineIndex(offlineIndex):
+    if(offlineIndex):
+        if(not os.path.exists(offlineIndex)):
+            logger.error("Offline index " + offlineIndex + " doesn't exist, create it by sync command")
+            sys.exit(1)
+        return OfflineIndex(offlineIndex)
+    return None
+
+def openWheelhouse(wheelhouse):
+    if(wheelhouse):
+        return Wheelhouse(wheelhouse)
+    return None
+
+def openDownloadDirectory(wheelhouse: Wheelhouse = None):
+    if(wheelhouse):
+        return wheelhouse.temporaryDirectory()
+    return tempfile.TemporaryDirectory()
+
+def collectWheelhouse(wheelhouse: Wheelhouse, maxAgeDays, maxSizeMb):
+    if(wheelhouse):
+        removed = wheelhouse.collect(maxAge = maxAgeDays * 24 * 3600 if maxAgeDays > 0 else None, maxSize = maxSizeMb * 1024 * 1024 if maxSizeMb > 0 else None)
+        logger.debug("Removed " + str(removed) + " files from wheelhouse")
+
+@contextmanager
+def openOutput(output, progress = False, format = "json"):
+    """Yields stream for --output or None for NONE.
+    Output is published only when block finishes without error, so failed run never leaves incomplete json document:
+    file is written to temporary file renamed on success, json for stdout is spooled until then.
+    ndjson is streamed to stdout line by line, unless progress bar is drawn on terminal, every line is complete record"""
+    if(output == "NONE"):
+        yield None
+    elif(output == "-"):
+        if(format == "json" or (progress and sys.stdout.isatty())):
+            with tempfile.SpooledTemporaryFile(max_size = 16 << 20, mode = "w+") as buffer:
+                yield buffer
+                buffer.seek(0)
+                shutil.copyfileobj(buffer, sys.stdout)
+                sys.stdout.flush()
+        else:
+            yield sys.stdout
+    else:
+        temporary = f"{output}.{os.getpid()}.tmp"
+        try:
+            with open(temporary, "w") as toWrite:
+                yield toWrite
+            os.replace(temporary, output)
+        except BaseException:
+            if(os.path.exists(temporary)):
+                os.unlink(temporary)
+            raise
+
+def finishOutput(writer: SbomWriter, output):
+    if(writer):
+        writer.finish()
+        if(output == "-" and writer.format == "json"):
+            writer.stream.write("\n")
+
+def writeResult(output, format, name, value, field, document):
+    """Writes result of single file command, document is its text in json format"""
+    with openOutput(output, format = format) as stream:
+        if(stream == None):
+            return
+        if(format == "ndjson"):
+            SbomWriter(stream, format = format, ndjsonField = field).write(name, value)
+        else:
+            print(document, file = stream, end = "\n" if output == "-" else "", flush = True)
+
+def writeOrdered(writer: SbomWriter, written):
+    """Scheduler callbacks (onOrdered, onDone) writing results, ndjson records are written in completion order"""
+    if(writer and writer.format == "ndjson"):
+        return None, written
+    return written, None
+
+def artifactStatusOf(loaded):
+    if(loaded):
+        return loaded.status
+    return ArtifactStatus.UNKNOWN
+
+def listDownloadedFiles(directory):
+    files = []
+    for file in os.walk(directory):
+        for package in file[2]:
+            files.append((package, os.path.join(file[0], package)))
+    return files
+
+async def countedTasks(tasks, bar):
+    async for task in tasks:
+        bar.length = bar.length + 1
+        yield task
+
+async def runTasks(casClient: CASClient, tasks, length, taskchunk, adaptive, noprogress, label, onOrdered = None, onDone = None, progressOf = None):
+    """Runs tasks with progress bar, length None means that number of tasks is not known upfront.
+    progressOf returns how many of length items result of task covers, one by default"""
+    scheduler = TaskScheduler(taskchunk, adaptive = adaptive, overloadProbe = casClient.grpcClient.getOverloadCount, onOrdered = onOrdered, onDone = onDone)
+    if(not noprogress):
+        with click.progressbar(length = length if length != None else 0, label = label) as bar:
+            def done(result):
+                bar.update(progressOf(result) if progressOf and length != None else 1)
+                if(onDone):
+                    onDone(result)
+            scheduler.onDone = done
+            if(length == None):
+                tasks = countedTasks(tasks, bar)
+            return await scheduler.run(tasks)
+    return await scheduler.run(tasks)
+
+async def runWithTimeout(coroutine, timeout):
+    if(not timeout):
+        return await coroutine
+    started = time.monotonic()
+    try:
+        return await asyncio.wait_for(coroutine, timeout)
+    except asyncio.TimeoutError:
+        if(time.monotonic() - started < timeout):
+            # Raised by command itself
+            raise
+        logger.error(f"Command didn't finish in {timeout} seconds")
+        sys.exit(1)
 
 def asynchronous(f):
+    """Runs command coroutine, its timeout option cancels it when it runs longer"""
     @wraps(f)
     def wrapper(*args, **kwargs):
-        return asyncio.run(f(*args, **kwargs))
+        timeout = kwargs.pop("timeout", None)
+        return asyncio.run(runWithTimeout(f(*args, **kwargs), timeout))
 
     return wrapper
 
@@ -32,58 +184,233 @@ def cli():
     pass
 
 
-async def markPipBomAs(casClient: CASClient, reqfile, taskchunk, pipnoquiet, nocache, noprogress, notarizepip, status: ArtifactStatus):
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        pipStatus = casClient.downloadPipFiles(tmpdirname, reqFile = reqfile, quiet=pipnoquiet, noCache=nocache)
-        if(not pipStatus):
+async def startDownload(casClient: CASClient, tmpdirname, reqfile, pipnoquiet, nocache, pipeline, pipjobs, pipArgs = [], wheelhouse: Wheelhouse = None):
+    """Starts download of requirements, returns (hashedFiles, filesCount, streaming) or None when download failed.
+    Streamed downloads report their result in streaming.succeeded once hashedFiles are exhausted"""
+    if(wheelhouse):
+        streaming = casClient.wheelhousePipFiles(wheelhouse, tmpdirname, reqFile = reqfile, quiet = pipnoquiet, noCache = nocache, additionalPipArgs = pipArgs)
+        return streaming.files(), None, streaming
+    if(pipjobs > 0):
+        if(not await checkFullyPinned(reqfile, pipnoquiet, nocache, pipArgs)):
             return None
-        filesIncluded = dict()
-        tasks = []
-        for file in os.walk(tmpdirname):
-            for package in file[2]:
-                filesIncluded[package] = os.path.join(file[0], package)
-                tasks.append(casClient.notarizeFileAs(filesIncluded[package], package, status))
-        
-        gathered = []
-        chunked = chunks(tasks, taskchunk)
-        if(not noprogress):
-            with click.progressbar(chunked, label = f"Notarization") as bar:
-                for chunk in bar:    
-                    gatheredChunk = await asyncio.gather(*chunk)
-                    gathered.extend(gatheredChunk)
-        else:
-            for chunk in chunked:    
-                gatheredChunk = await asyncio.gather(*chunk)
-                gathered.extend(gatheredChunk)
+        streaming = casClient.shardPipFiles(tmpdirname, reqFile = reqfile, quiet = pipnoquiet, noCache = nocache, additionalPipArgs = pipArgs, jobs = pipjobs)
+        return streaming.files(), None, streaming
+    if(pipeline):
+        streaming = casClient.streamPipFiles(tmpdirname, reqFile = reqfile, quiet = pipnoquiet, noCache = nocache, additionalPipArgs = pipArgs)
+        return streaming.files(), None, streaming
+    pipStatus = await casClient.asyncDownloadPipFiles(tmpdirname, reqFile = reqfile, quiet = pipnoquiet, noCache = nocache, additionalPipArgs = pipArgs)
+    if(not pipStatus):
+        return None
+    files = listDownloadedFiles(tmpdirname)
+    return casClient.hashFiles(files), len(files), None
 
-        sbom = dict()
-        for item in gathered:
-            try:
-                sbom[item[0]] = item[1]
-            except Exception as ee:
-                casClient.logger.error("Something goes wrong with notarization of " + item[0])
-                casClient.logger.error("Will not continue")
-                return None
-        name, notarization = await casClient.notarizeFileAs(reqfile, notarizedReqFilename, status)
+async def fileHashes(hashedFiles, extraHashes):
+    async for package, path, hash, size in hashedFiles:
+        yield package, hash
+    for packageName, hash in extraHashes:
+        yield packageName, hash
+
+async def pinnedHashes(requirements, extraHashes):
+    for requirement in requirements:
+        for hash in requirement.hashes:
+            yield requirement.artifactName(hash), hash
+    for packageName, hash in extraHashes:
+        yield packageName, hash
+
+def countPinned(requirements):
+    return sum(len(requirement.hashes) for requirement in requirements)
+
+def checkPinned(requirements):
+    unpinned = [requirement.specifier for requirement in requirements if not requirement.hashes]
+    if(unpinned):
+        logger.error("Requirements without --hash can't be used with --from-hashes: " + ", ".join(unpinned))
+        return False
+    return True
+
+async def checkFullyPinned(reqfile, pipnoquiet, nocache, pipArgs = []):
+    """Every requirement is downloaded without its dependencies by --pipjobs,
+    so requirements file has to pin whole dependency closure by == and --hash"""
+    options = []
+    requirements = parseRequirementsFile(reqfile, options = options)
+    unpinned = [requirement.specifier for requirement in requirements if not requirement.isFullyPinned()]
+    if(unpinned):
+        logger.error("--pipjobs requires fully pinned requirements file with == and --hash for every requirement including dependencies (e.g. pip-compile --generate-hashes), not pinned: " + ", ".join(unpinned))
+        return False
+    missing = await missingDependencies(requirements, options, pipnoquiet, nocache, pipArgs)
+    if(missing == None):
+        logger.error("Dependencies of requirements can't be resolved, --pipjobs requires them pinned in requirements file")
+        return False
+    if(missing):
+        logger.error("--pipjobs requires every dependency pinned by == and --hash in requirements file, missing: " + ", ".join(missing))
+        return False
+    return True
+
+def optionalPinned(requirements, authenticated):
+    """Pinned hashes of other platforms are not required to be notarized when any hash of requirement is"""
+    optional = set()
+    for requirement in requirements:
+        names = [requirement.artifactName(hash) for hash in requirement.hashes]
+        if(any(authenticated.get(name, None) for name in names)):
+            optional.update(names)
+    return optional
+
+async def authenticateNamedHashes(casClient: CASClient, namedHashes, length, taskchunk, adaptive, noprogress, multiget, writer: SbomWriter = None):
+    """Authenticates async iterable of (packageName, hash), returns list of (packageName, VerificationResult or None).
+    Statuses are written to writer as soon as they are known"""
+    def written(item):
+        if(writer):
+            writer.write(item[0], artifactStatusOf(item[1]))
+
+    if(multiget > 0):
+        async def authenticateChunk(chunk):
+            authenticated = await casClient.verifyMany([hash for packageName, hash in chunk], chunkSize = multiget)
+            return [(packageName, authenticated[hash]) for packageName, hash in chunk]
+
+        async def chunkAuthentications():
+            # Chunks are scheduled as soon as they are full, so they are read while next files are hashed
+            chunk = []
+            async for item in namedHashes:
+                chunk.append(item)
+                if(len(chunk) >= multiget):
+                    yield authenticateChunk(chunk)
+                    chunk = []
+            if(chunk):
+                yield authenticateChunk(chunk)
+
+        def writtenChunk(chunk):
+            for item in chunk:
+                written(item)
+
+        onOrdered, onDone = writeOrdered(writer, writtenChunk)
+        chunks = await runTasks(casClient, chunkAuthentications(), length, taskchunk, adaptive, noprogress, "Authorization", onOrdered = onOrdered, onDone = onDone, progressOf = len)
+        return [item for chunk in chunks for item in chunk]
+
+    async def authentications():
+        async for packageName, hash in namedHashes:
+            yield casClient.verifyHash(hash, packageName)
+
+    onOrdered, onDone = writeOrdered(writer, written)
+    return await runTasks(casClient, authentications(), length, taskchunk, adaptive, noprogress, "Authorization", onOrdered = onOrdered, onDone = onDone)
+
+async def fileArtifacts(casClient: CASClient, hashedFiles, extraArtifacts, status: ArtifactStatus, streaming = None):
+    async for package, path, hash, size in hashedFiles:
+        yield casClient.buildHashedFileArtifactAs(path, package, hash, size, status)
+    if(streaming and not streaming.succeeded):
+        return
+    for artifact in extraArtifacts:
+        yield artifact
+
+async def pinnedArtifacts(casClient: CASClient, requirements, extraArtifacts, status: ArtifactStatus):
+    for requirement in requirements:
+        for hash in requirement.hashes:
+            yield casClient.buildHashArtifactAs(hash, requirement.artifactName(hash), status)
+    for artifact in extraArtifacts:
+        yield artifact
+
+async def notarizeArtifacts(casClient: CASClient, artifacts, length, taskchunk, adaptive, noprogress, batchsize, writer: SbomWriter = None, batchbytes = 0):
+    """Notarizes async iterable of artifacts, returns ArtifactList or None when any notarization failed.
+    With batchsize over 1 artifacts are packed into batches notarized by single request, batches are scheduled like single artifacts.
+    Notarized artifacts are written to writer as soon as they are known, up to first failure"""
+    failed = [False]
+
+    def written(item):
+        name, notarization = item
+        if(notarization == None):
+            failed[0] = True
+        if(writer and not failed[0]):
+            writer.write(name, notarization)
+
+    if(batchsize > 1):
+        def writtenBatch(batch):
+            for name, notarization, transaction in batch:
+                written((name, notarization))
+
+        async def batchNotarizations():
+            async for batch in casClient.batchArtifacts(artifacts, batchsize, batchbytes if batchbytes > 0 else defaultMaxBatchBytes):
+                yield casClient.notarizeBatch(batch)
+
+        onOrdered, onDone = writeOrdered(writer, writtenBatch)
+        # Progress bar advances by artifacts of every notarized batch, or counts batches when number of artifacts isn't known
+        batches = await runTasks(casClient, batchNotarizations(), length, taskchunk, adaptive, noprogress, "Notarization", onOrdered = onOrdered, onDone = onDone, progressOf = len)
+        gathered = [(name, notarization) for batch in batches for name, notarization, transaction in batch]
+    else:
+        async def notarizations():
+            async for artifact in artifacts:
+                yield casClient.notarizeArtifact(artifact)
+
+        onOrdered, onDone = writeOrdered(writer, written)
+        gathered = await runTasks(casClient, notarizations(), length, taskchunk, adaptive, noprogress, "Notarization", onOrdered = onOrdered, onDone = onDone)
+
+    sbom = dict()
+    for name, notarization in gathered:
+        if(notarization == None):
+            casClient.logger.error("Something goes wrong with notarization of " + name)
+            casClient.logger.error("Will not continue")
+            return None
         sbom[name] = notarization
-        if(notarizepip):
-            name, notarization = await casClient.notarizeHashAs(casClient.getSha256(casClient.getPipVersion()), notarizedReqPipVersion, status)
-            sbom[name] = notarization
-        listOf = ArtifactList(statuses = sbom)
+    return ArtifactList(statuses = sbom)
+
+async def markPipBomAs(casClient: CASClient, reqfile, taskchunk, adaptive, pipnoquiet, nocache, noprogress, notarizepip, status: ArtifactStatus, batchsize: int = 1, pipeline: bool = False, fromHashes: bool = False, pipjobs: int = 0, wheelhouse: Wheelhouse = None, writer: SbomWriter = None, batchbytes: int = 0):
+    extraArtifacts = [await casClient.buildFileArtifactAs(reqfile, notarizedReqFilename, status)]
+    if(notarizepip):
+        extraArtifacts.append(casClient.buildHashArtifactAs(casClient.getSha256(casClient.getPipVersion()), notarizedReqPipVersion, status))
+    if(fromHashes):
+        requirements = parseRequirementsFile(reqfile)
+        if(not checkPinned(requirements)):
+            return None
+        artifacts = pinnedArtifacts(casClient, requirements, extraArtifacts, status)
+        return await notarizeArtifacts(casClient, artifacts, countPinned(requirements) + len(extraArtifacts), taskchunk, adaptive, noprogress, batchsize, writer, batchbytes)
+
+    with openDownloadDirectory(wheelhouse) as tmpdirname:
+        started = await startDownload(casClient, tmpdirname, reqfile, pipnoquiet, nocache, pipeline, pipjobs, wheelhouse = wheelhouse)
+        if(started == None):
+            return None
+        hashedFiles, filesCount, streaming = started
+        artifacts = fileArtifacts(casClient, hashedFiles, extraArtifacts, status, streaming)
+        listOf = await notarizeArtifacts(casClient, artifacts, filesCount + len(extraArtifacts) if filesCount != None else None, taskchunk, adaptive, noprogress, batchsize, writer, batchbytes)
+        if(streaming and not streaming.succeeded):
+            casClient.logger.error("Downloading of requirements failed, files downloaded before failure could be already notarized")
+            return None
         return listOf
 
 @cli.command(name="authenticate", help = "Authenticate pip packages from provided requirements file")
 @click.option('--reqfile', default="requirements.txt", help='Requirements file name')
-@click.option('--taskchunk', default=3, help='Max authorization request per once')
+@click.option('--taskchunk', default=8, show_default = True, help='Max requests in flight')
+@click.option('--adaptive', default=False, is_flag = True, show_default = True, help='Adapts requests in flight to observed latency and server overload, starting from --taskchunk')
+@click.option('--channels', default=1, show_default = True, help='Number of pooled connections to CAS')
+@click.option('--hashworkers', default=0, show_default = True, help='Number of parallel file hashing workers. 0 for automatic')
+@click.option('--hashprocesses', default=False, is_flag = True, show_default = True, help='Hashes files in worker processes instead of threads')
+@click.option('--pipeline', default=False, is_flag = True, show_default = True, help='Hashes and sends files while pip is still downloading')
+@click.option('--pipjobs', default=0, show_default = True, help='Downloads every requirement by separate pip process, this many at once. Requires every requirement including dependencies pinned by == and --hash. 0 for single pip process')
+@click.option('--from-hashes', default=False, is_flag = True, show_default = True, help='Uses --hash pins of requirements file instead of downloading packages')
+@click.option('--from-index', default=False, is_flag = True, show_default = True, help='Uses hashes published by package index instead of downloading packages, downloads only files index has no hashes for')
+@click.option('--index-url', default=None, help='Package index used for resolving and downloading requirements')
 @click.option('--pipnoquiet', default=True, is_flag = True, show_default = True, help='Disables output of pip')
 @click.option('--nocache', default=True, is_flag = True, show_default = True, help='Disables cache of pip')
+@click.option('--wheelhouse', default=None, help='Directory of persistent package store reused between runs instead of downloading packages again. Replaces --pipeline and --pipjobs')
+@click.option('--wheelhouse-max-age', default=30, show_default = True, help='Days after which unused packages are removed from wheelhouse. 0 for no limit')
+@click.option('--wheelhouse-max-size', default=0, show_default = True, help='Size of wheelhouse in MiB over which least recently used packages are removed. 0 for no limit')
+@click.option('--hashcache', default=False, is_flag = True, show_default = True, help='Reuses hashes of unchanged files from local cache. Files modified within last 2 seconds, like packages pip has just downloaded, are hashed every run')
 @click.option('--signerid', help='Signer ID')
 @click.option('--api-key', help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--noprogress',  default=False, is_flag = True, show_default = True, help='Shows progress bar of action')
 @click.option('--notarizepip', default=False, is_flag = True, show_default = True, help='Notarizing also pip version')
+@click.option('--multiget', default=0, show_default = True, help='Authenticates up to this many hashes per single request. 0 for request per file')
+@click.option('--cache-ttl', default=0, show_default = True, help='Seconds to reuse authentication results from local cache. 0 disables cache')
+@click.option('--negative-cache-ttl', default=0, show_default = True, help='Seconds to reuse "not notarized" results from local cache')
+@click.option('--verify-proofs', default=False, is_flag = True, show_default = True, help='Verifies Merkle proofs of every authentication response against trusted ledger state')
+@click.option('--offline-index', default=None, help='Authenticates from local index created by sync command instead of CAS, without any CAS request')
+@click.option('--hedge', default=False, is_flag = True, show_default = True, help='Sends duplicate of authentication request slower than observed p95 latency, first response wins')
+@click.option('--hedge-delay', default=0.0, show_default = True, help='Fixed seconds after which authentication request is duplicated instead of observed p95 latency. Implies --hedge')
+@click.option('--hedge-max-load', default=0.1, show_default = True, help='Max duplicated requests as a fraction of all authentication requests')
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def authenticate(reqfile, taskchunk, pipnoquiet, nocache, signerid, api_key, output, noprogress, notarizepip):
+async def authenticate(reqfile, taskchunk, adaptive, channels, hashworkers, hashprocesses, pipeline, pipjobs, from_hashes, from_index, index_url, pipnoquiet, nocache, wheelhouse, wheelhouse_max_age, wheelhouse_max_size, hashcache, signerid, api_key, output, format, noprogress, notarizepip, multiget, cache_ttl, negative_cache_ttl, verify_proofs, offline_index, hedge, hedge_delay, hedge_max_load, retries, retry_backoff, rpc_timeout):
     "Authenticate pip requirements.txt"
     if(api_key == None and signerid == None):
         api_key = os.environ.get("CAS_API_KEY", None)
@@ -92,84 +419,90 @@ async def authenticate(reqfile, taskchunk, pipnoquiet, nocache, signerid, api_ke
             logger.error("You must provide CAS_API_KEY or SIGNER_ID environment or --apikey argument or --signerid arugment to authorize")
             sys.exit(1)
     statusCodeToRet = 0
-    casClient = CASClient(signerid, api_key)
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        pipStatus = casClient.downloadPipFiles(tmpdirname, reqFile = reqfile, quiet = pipnoquiet, noCache=nocache)
-        if(not pipStatus):
-            sys.exit(1)
-        filesIncluded = dict()
-        tasks = []
-        for file in os.walk(tmpdirname):
-            for package in file[2]:
-                filesIncluded[package] = os.path.join(file[0], package)
-                tasks.append(casClient.authenticateFile(filesIncluded[package], package))
-        gathered = []
-
-        chunked = chunks(tasks, taskchunk)
-        if(not noprogress):
-            with click.progressbar(chunked, label = f"Authorization") as bar:
-                for chunk in bar:    
-                    gatheredChunk = await asyncio.gather(*chunk)
-                    gathered.extend(gatheredChunk)
-        else:
-            for chunk in chunked:    
-                gatheredChunk = await asyncio.gather(*chunk)
-                gathered.extend(gatheredChunk)
+    store = openWheelhouse(wheelhouse)
+    with openOutput(output, not noprogress, format) as stream:
+        writer = SbomWriter(stream, format = format, ndjsonField = "status") if stream else None
+        async with CASClient(signerid, api_key, channelPoolSize = channels, hashWorkers = hashworkers, hashProcesses = hashprocesses, hashCache = openHashCache(hashcache), resultCache = openResultCache(cache_ttl, negative_cache_ttl), retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None, hedgePolicy = openHedgePolicy(hedge, hedge_delay, hedge_max_load), proofVerifier = openProofVerifier(verify_proofs), offlineIndex = openOfflineIndex(offline_index)) as casClient:
+            extraHashes = [(notarizedReqFilename, (await casClient.generateHashFromFile(reqfile))[0])]
+            if(notarizepip):
+                extraHashes.append((notarizedReqPipVersion, casClient.getSha256(casClient.getPipVersion())))
+            optional = set()
+            gathered = None
+            pipArgs = ["--index-url", index_url] if index_url else []
+            if(from_hashes):
+                requirements = parseRequirementsFile(reqfile)
+                if(not checkPinned(requirements)):
+                    sys.exit(1)
+                gathered = await authenticateNamedHashes(casClient, pinnedHashes(requirements, extraHashes), countPinned(requirements) + len(extraHashes), taskchunk, adaptive, noprogress, multiget, writer)
+                optional = optionalPinned(requirements, dict(gathered))
+            elif(from_index):
+                indexFiles = await casClient.resolveIndexFiles(reqfile, quiet = pipnoquiet, noCache = nocache, indexUrl = index_url)
+                if(indexFiles == None):
+                    logger.warning("Can't resolve requirements from index, downloading them instead")
+                else:
+                    gathered = await authenticateNamedHashes(casClient, fileHashes(casClient.hashIndexFiles(indexFiles, index_url), extraHashes), len(indexFiles) + len(extraHashes), taskchunk, adaptive, noprogress, multiget, writer)
+            if(gathered == None):
+                with openDownloadDirectory(store) as tmpdirname:
+                    started = await startDownload(casClient, tmpdirname, reqfile, pipnoquiet, nocache, pipeline, pipjobs, pipArgs, store)
+                    if(started == None):
+                        sys.exit(1)
+                    hashedFiles, filesCount, streaming = started
+                    gathered = await authenticateNamedHashes(casClient, fileHashes(hashedFiles, extraHashes), filesCount + len(extraHashes) if filesCount != None else None, taskchunk, adaptive, noprogress, multiget, writer)
+                    if(streaming and not streaming.succeeded):
+                        sys.exit(1)
+                collectWheelhouse(store, wheelhouse_max_age, wheelhouse_max_size)
 
-        authorizedSbom = dict()
-        gathered.append(await casClient.authenticateFile(reqfile, notarizedReqFilename))
-        if(notarizepip):
-            gathered.append(await casClient.authenticateHash(casClient.getSha256(casClient.getPipVersion()), notarizedReqPipVersion))
-        for item in gathered:
-            packageName, loaded = item
+        for packageName, loaded in gathered:
             if(loaded):
-                status = loaded.status
-                authorizedSbom[packageName] = status
-                if(status.value > 0):
-                    statusCodeToRet = status.value
-            else:
-                status = ArtifactStatus.UNKNOWN
+                if(loaded.status.value > 0):
+                    statusCodeToRet = loaded.status.value
+            elif(packageName not in optional):
                 statusCodeToRet = 1
-                authorizedSbom[packageName] = status
-
-        listOf = ArtifactStatusList(statuses = authorizedSbom).json()
-        if(output == "-"):
-            print(listOf)
-        elif(output == "NONE"):
-            pass
-        else:
-            with open(output, "w") as toWrite:
-                toWrite.write(listOf)
+        finishOutput(writer, output)
     sys.exit(statusCodeToRet)
 
 @cli.command(name="notarize", help = "Notarizes pip packages from provided requirements file")
 @click.option('--reqfile', default="requirements.txt", help='Requirements file name')
-@click.option('--taskchunk', default=3, help='Max authorization request per once')
+@click.option('--taskchunk', default=8, show_default = True, help='Max requests in flight')
+@click.option('--adaptive', default=False, is_flag = True, show_default = True, help='Adapts requests in flight to observed latency and server overload, starting from --taskchunk')
+@click.option('--channels', default=1, show_default = True, help='Number of pooled connections to CAS')
+@click.option('--hashworkers', default=0, show_default = True, help='Number of parallel file hashing workers. 0 for automatic')
+@click.option('--hashprocesses', default=False, is_flag = True, show_default = True, help='Hashes files in worker processes instead of threads')
+@click.option('--pipeline', default=False, is_flag = True, show_default = True, help='Hashes and sends files while pip is still downloading')
+@click.option('--pipjobs', default=0, show_default = True, help='Downloads every requirement by separate pip process, this many at once. Requires every requirement including dependencies pinned by == and --hash. 0 for single pip process')
+@click.option('--from-hashes', default=False, is_flag = True, show_default = True, help='Uses --hash pins of requirements file instead of downloading packages')
 @click.option('--pipnoquiet', default=True, is_flag = True, show_default = True, help='Disables output of pip')
 @click.option('--nocache', default=True, is_flag = True, show_default = True, help='Disables cache of pip')
+@click.option('--wheelhouse', default=None, help='Directory of persistent package store reused between runs instead of downloading packages again. Replaces --pipeline and --pipjobs')
+@click.option('--wheelhouse-max-age', default=30, show_default = True, help='Days after which unused packages are removed from wheelhouse. 0 for no limit')
+@click.option('--wheelhouse-max-size', default=0, show_default = True, help='Size of wheelhouse in MiB over which least recently used packages are removed. 0 for no limit')
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--noprogress',  default=False, is_flag = True, show_default = True, help='Shows progress bar of action')
 @click.option('--notarizepip', default=False, is_flag = True, show_default = True, help='Notarizing also pip version')
+@click.option('--batchsize', default=1, show_default = True, help='Max artifacts notarized in single ledger transaction')
+@click.option('--batchbytes', default=0, show_default = True, help='Max bytes of single notarization request with --batchsize. 0 for 3 MiB, under default gRPC message limit')
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def notarize(reqfile, taskchunk, pipnoquiet, nocache, api_key, output, noprogress, notarizepip):
+async def notarize(reqfile, taskchunk, adaptive, channels, hashworkers, hashprocesses, pipeline, pipjobs, from_hashes, pipnoquiet, nocache, wheelhouse, wheelhouse_max_age, wheelhouse_max_size, api_key, output, format, noprogress, notarizepip, batchsize, batchbytes, retries, retry_backoff, rpc_timeout):
     if(api_key == None):
         api_key = os.environ.get("CAS_API_KEY", None)
         if(api_key == None):
             logger.error("You must provide CAS_API_KEY environment or --api_key argument")
             sys.exit(1)
-    casClient = CASClient(None, api_key)
-    listOf = await markPipBomAs(casClient, reqfile, taskchunk, pipnoquiet, nocache, noprogress, notarizepip, ArtifactStatus.TRUSTED)
-    if(not listOf):
-        sys.exit(1)
-    if(output == "-"):
-        print(listOf.json(indent= 4), flush=True)
-        sys.exit(0)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(listOf.json(indent= 4))
+    store = openWheelhouse(wheelhouse)
+    with openOutput(output, not noprogress, format) as stream:
+        writer = SbomWriter(stream, indent = 4, format = format, ndjsonField = "artifact") if stream else None
+        async with CASClient(None, api_key, channelPoolSize = channels, hashWorkers = hashworkers, hashProcesses = hashprocesses, retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+            listOf = await markPipBomAs(casClient, reqfile, taskchunk, adaptive, pipnoquiet, nocache, noprogress, notarizepip, ArtifactStatus.TRUSTED, batchsize = batchsize, pipeline = pipeline, fromHashes = from_hashes, pipjobs = pipjobs, wheelhouse = store, writer = writer, batchbytes = batchbytes)
+            collectWheelhouse(store, wheelhouse_max_age, wheelhouse_max_size)
+            if(not listOf):
+                sys.exit(1)
+        finishOutput(writer, output)
     sys.exit(0)
 
 
@@ -177,10 +510,16 @@ async def notarize(reqfile, taskchunk, pipnoquiet, nocache, api_key, output, nop
 @cli.command(name="notarizeFile", help = "Notarizes file")
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--asname', default=None, help='Specifies name of resource. Defaults - filename')
+@click.option('--hashcache', default=False, is_flag = True, show_default = True, help='Reuses hashes of unchanged files from local cache')
 @click.argument("filename")
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def notarizeFile(api_key, output, asname, filename):
+async def notarizeFile(api_key, output, format, asname, filename, hashcache, retries, retry_backoff, rpc_timeout):
     if not asname:
         asname = os.path.basename(filename)
     if(api_key == None):
@@ -188,27 +527,26 @@ async def notarizeFile(api_key, output, asname, filename):
         if(api_key == None):
             logger.error("You must provide CAS_API_KEY environment or --api_key argument")
             sys.exit(1)
-    casClient = CASClient(None, api_key)
-    status, artifact = await casClient.notarizeFileAs(filename, asname, ArtifactStatus.TRUSTED)
-    if(not status):
-        sys.exit(1)
-    if(output == "-"):
-        print(artifact.json(indent= 4), flush=True)
+    async with CASClient(None, api_key, hashCache = openHashCache(hashcache), retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+        status, artifact = await casClient.notarizeFileAs(filename, asname, ArtifactStatus.TRUSTED)
+        if(not status):
+            sys.exit(1)
+        writeResult(output, format, asname, artifact, "artifact", artifact.json(indent= 4))
         sys.exit(0)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(artifact.json(indent= 4))
-    sys.exit(0)
 
 @cli.command(name="untrustFile", help = "Untrusts file")
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--asname', default=None, help='Specifies name of resource. Defaults - filename')
+@click.option('--hashcache', default=False, is_flag = True, show_default = True, help='Reuses hashes of unchanged files from local cache')
 @click.argument("filename")
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def untrustFile(api_key, output, asname, filename):
+async def untrustFile(api_key, output, format, asname, filename, hashcache, retries, retry_backoff, rpc_timeout):
     if not asname:
         asname = os.path.basename(filename)
     if(api_key == None):
@@ -216,28 +554,27 @@ async def untrustFile(api_key, output, asname, filename):
         if(api_key == None):
             logger.error("You must provide CAS_API_KEY environment or --api_key argument")
             sys.exit(1)
-    casClient = CASClient(None, api_key)
-    status, artifact = await casClient.notarizeFileAs(filename, asname, ArtifactStatus.UNTRUSTED)
-    if(not status):
-        sys.exit(1)
-    if(output == "-"):
-        print(artifact.json(indent= 4), flush=True)
+    async with CASClient(None, api_key, hashCache = openHashCache(hashcache), retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+        status, artifact = await casClient.notarizeFileAs(filename, asname, ArtifactStatus.UNTRUSTED)
+        if(not status):
+            sys.exit(1)
+        writeResult(output, format, asname, artifact, "artifact", artifact.json(indent= 4))
         sys.exit(0)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(artifact.json(indent= 4))
-    sys.exit(0)
 
 
 @cli.command(name="unsupportFile", help = "Unsupports file")
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--asname', default=None, help='Specifies name of resource. Defaults - filename')
+@click.option('--hashcache', default=False, is_flag = True, show_default = True, help='Reuses hashes of unchanged files from local cache')
 @click.argument("filename")
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def unsupportFile(api_key, output, asname, filename):
+async def unsupportFile(api_key, output, format, asname, filename, hashcache, retries, retry_backoff, rpc_timeout):
     if not asname:
         asname = os.path.basename(filename)
     if(api_key == None):
@@ -245,27 +582,29 @@ async def unsupportFile(api_key, output, asname, filename):
         if(api_key == None):
             logger.error("You must provide CAS_API_KEY environment or --api_key argument")
             sys.exit(1)
-    casClient = CASClient(None, api_key)
-    status, artifact = await casClient.notarizeFileAs(filename, asname, ArtifactStatus.UNSUPPORTED)
-    if(not status):
-        sys.exit(1)
-    if(output == "-"):
-        print(artifact.json(indent= 4), flush=True)
+    async with CASClient(None, api_key, hashCache = openHashCache(hashcache), retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+        status, artifact = await casClient.notarizeFileAs(filename, asname, ArtifactStatus.UNSUPPORTED)
+        if(not status):
+            sys.exit(1)
+        writeResult(output, format, asname, artifact, "artifact", artifact.json(indent= 4))
         sys.exit(0)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(artifact.json(indent= 4))
-    sys.exit(0)
 
 @cli.command(name="authenticateFile", help = "Notarizes file")
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--signerid', help='Signer ID')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
+@click.option('--hashcache', default=False, is_flag = True, show_default = True, help='Reuses hashes of unchanged files from local cache')
+@click.option('--cache-ttl', default=0, show_default = True, help='Seconds to reuse authentication results from local cache. 0 disables cache')
+@click.option('--negative-cache-ttl', default=0, show_default = True, help='Seconds to reuse "not notarized" results from local cache')
+@click.option('--verify-proofs', default=False, is_flag = True, show_default = True, help='Verifies Merkle proofs of every authentication response against trusted ledger state')
 @click.argument("filename")
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def authenticateFile(api_key, signerid, output, filename):
+async def authenticateFile(api_key, signerid, output, format, filename, hashcache, cache_ttl, negative_cache_ttl, verify_proofs, retries, retry_backoff, rpc_timeout):
     if(api_key == None and signerid == None):
         api_key = os.environ.get("CAS_API_KEY", None)
         signerid = os.environ.get("SIGNER_ID", None)
@@ -273,90 +612,169 @@ async def authenticateFile(api_key, signerid, output, filename):
             logger.error("You must provide CAS_API_KEY or SIGNER_ID environment or --apikey argument or --signerid arugment to authorize")
             sys.exit(1)
     statusCodeToRet = 0
-    casClient = CASClient(signerid, api_key)
-    status, artifact = await casClient.authenticateFile(filename, ArtifactStatus.TRUSTED)
-    if(not status):
-        sys.exit(1)
-    authorizedSbom = dict()
-    if(artifact):
-        status = artifact.status
-        authorizedSbom[artifact.name] = status
-        if(status.value > 0):
-            print("X")
-            statusCodeToRet = status.value
-    else:
-        status = ArtifactStatus.UNKNOWN
-        statusCodeToRet = 1
-        authorizedSbom[filename] = status
+    async with CASClient(signerid, api_key, hashCache = openHashCache(hashcache), resultCache = openResultCache(cache_ttl, negative_cache_ttl), retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None, proofVerifier = openProofVerifier(verify_proofs)) as casClient:
+        status, artifact = await casClient.authenticateFile(filename, ArtifactStatus.TRUSTED)
+        if(not status):
+            sys.exit(1)
+        authorizedSbom = dict()
+        if(artifact):
+            status = artifact.status
+            authorizedSbom[artifact.name] = status
+            if(status.value > 0):
+                statusCodeToRet = status.value
+        else:
+            status = ArtifactStatus.UNKNOWN
+            statusCodeToRet = 1
+            authorizedSbom[filename] = status
         
-    listOf = ArtifactStatusList(statuses = authorizedSbom)
-    if(output == "-"):
-        print(listOf.json(indent= 4), flush=True)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(listOf.json(indent= 4))
-    sys.exit(statusCodeToRet)
+        listOf = ArtifactStatusList(statuses = authorizedSbom)
+        name, status = list(authorizedSbom.items())[0]
+        writeResult(output, format, name, status, "status", listOf.json(indent= 4))
+        sys.exit(statusCodeToRet)
+
+@cli.command(name="list", help = "Lists artifacts notarized by signer")
+@click.option('--api-key', default=None, help='API Key')
+@click.option('--signerid', help='Signer ID')
+@click.option('--prefix', default="", help='Lists only artifacts with hash starting with prefix')
+@click.option('--since', default=0, show_default = True, help='Lists only artifacts written after ledger transaction with this id')
+@click.option('--page-size', default=1000, show_default = True, help='Artifacts requested from CAS at once, next page is requested while previous one is written')
+@click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="ndjson", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is read')
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
+@asynchronous
+async def listArtifacts(api_key, signerid, prefix, since, page_size, output, format, retries, retry_backoff, rpc_timeout):
+    if(api_key == None and signerid == None):
+        api_key = os.environ.get("CAS_API_KEY", None)
+        signerid = os.environ.get("SIGNER_ID", None)
+        if(api_key == None and signerid == None):
+            logger.error("You must provide CAS_API_KEY or SIGNER_ID environment or --apikey argument or --signerid arugment to list")
+            sys.exit(1)
+    with openOutput(output, format = format) as stream:
+        writer = SbomWriter(stream, key = "artifacts", format = format, ndjsonField = "artifact") if stream else None
+        async with CASClient(signerid, api_key, retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+            try:
+                async for result in casClient.iterArtifacts(prefix = prefix, since = since, pageSize = page_size):
+                    if(writer):
+                        writer.write(result.hash, {"name": result.name, "status": result.status, "signer": result.signer, "timestamp": result.timestamp, "tx": result.txId})
+            except ArtifactListingError as e:
+                logger.error("Can't list artifacts: " + str(e))
+                sys.exit(1)
+        finishOutput(writer, output)
+
+@cli.command(name="sync", help = "Syncs artifacts notarized by signer into local index used by authenticate --offline-index")
+@click.option('--api-key', default=None, help='API Key')
+@click.option('--signerid', help='Signer ID')
+@click.option('--index', default=None, help='Index file. Defaults to index.sqlite in cache directory of cas_pip')
+@click.option('--page-size', default=1000, show_default = True, help='Artifacts requested from CAS at once, next page is requested while previous one is stored')
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
+@asynchronous
+async def sync(api_key, signerid, index, page_size, retries, retry_backoff, rpc_timeout):
+    if(api_key == None and signerid == None):
+        api_key = os.environ.get("CAS_API_KEY", None)
+        signerid = os.environ.get("SIGNER_ID", None)
+        if(api_key == None and signerid == None):
+            logger.error("You must provide CAS_API_KEY or SIGNER_ID environment or --apikey argument or --signerid arugment to sync")
+            sys.exit(1)
+    offlineIndex = OfflineIndex(index)
+    async with CASClient(signerid, api_key, retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None, offlineIndex = offlineIndex) as casClient:
+        status, synced = await casClient.syncIndex(offlineIndex, pageSize = page_size)
+        if(not status):
+            logger.error("Can't sync artifacts: " + str(synced))
+            sys.exit(1)
+        print(json.dumps({"index": offlineIndex.path, "synced": synced, "txId": offlineIndex.syncedTx(casClient.grpcClient.signerId)}), flush = True)
 
 @cli.command(name="untrust", help = "Untrust pip packages from provided requirements file")
 @click.option('--reqfile', default="requirements.txt", help='Requirements file name')
-@click.option('--taskchunk', default=3, help='Max authorization request per once')
+@click.option('--taskchunk', default=8, show_default = True, help='Max requests in flight')
+@click.option('--adaptive', default=False, is_flag = True, show_default = True, help='Adapts requests in flight to observed latency and server overload, starting from --taskchunk')
+@click.option('--channels', default=1, show_default = True, help='Number of pooled connections to CAS')
+@click.option('--hashworkers', default=0, show_default = True, help='Number of parallel file hashing workers. 0 for automatic')
+@click.option('--hashprocesses', default=False, is_flag = True, show_default = True, help='Hashes files in worker processes instead of threads')
+@click.option('--pipeline', default=False, is_flag = True, show_default = True, help='Hashes and sends files while pip is still downloading')
+@click.option('--pipjobs', default=0, show_default = True, help='Downloads every requirement by separate pip process, this many at once. Requires every requirement including dependencies pinned by == and --hash. 0 for single pip process')
+@click.option('--from-hashes', default=False, is_flag = True, show_default = True, help='Uses --hash pins of requirements file instead of downloading packages')
 @click.option('--pipnoquiet', default=True, is_flag = True, show_default = True, help='Disables output of pip')
 @click.option('--nocache', default=True, is_flag = True, show_default = True, help='Disables cache of pip')
+@click.option('--wheelhouse', default=None, help='Directory of persistent package store reused between runs instead of downloading packages again. Replaces --pipeline and --pipjobs')
+@click.option('--wheelhouse-max-age', default=30, show_default = True, help='Days after which unused packages are removed from wheelhouse. 0 for no limit')
+@click.option('--wheelhouse-max-size', default=0, show_default = True, help='Size of wheelhouse in MiB over which least recently used packages are removed. 0 for no limit')
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--noprogress',  default=False, is_flag = True, show_default = True, help='Shows progress bar of action')
 @click.option('--notarizepip', default=False, is_flag = True, show_default = True, help='Notarizing also pip version')
+@click.option('--batchsize', default=1, show_default = True, help='Max artifacts notarized in single ledger transaction')
+@click.option('--batchbytes', default=0, show_default = True, help='Max bytes of single notarization request with --batchsize. 0 for 3 MiB, under default gRPC message limit')
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def untrust(reqfile, taskchunk, pipnoquiet, nocache, api_key, output, noprogress, notarizepip):
+async def untrust(reqfile, taskchunk, adaptive, channels, hashworkers, hashprocesses, pipeline, pipjobs, from_hashes, pipnoquiet, nocache, wheelhouse, wheelhouse_max_age, wheelhouse_max_size, api_key, output, format, noprogress, notarizepip, batchsize, batchbytes, retries, retry_backoff, rpc_timeout):
     if(api_key == None):
         api_key = os.environ.get("CAS_API_KEY", None)
         if(api_key == None):
             logger.error("You must provide CAS_API_KEY environment or --api_key argument")
             sys.exit(1)
-    casClient = CASClient(None, api_key)
-    listOf = await markPipBomAs(casClient, reqfile, taskchunk, pipnoquiet, nocache, noprogress, notarizepip, ArtifactStatus.UNTRUSTED)
-    if(not listOf):
-        sys.exit(1)
-    if(output == "-"):
-        print(listOf.json(indent= 4), flush=True)
-        sys.exit(0)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(listOf.json(indent= 4))
+    store = openWheelhouse(wheelhouse)
+    with openOutput(output, not noprogress, format) as stream:
+        writer = SbomWriter(stream, indent = 4, format = format, ndjsonField = "artifact") if stream else None
+        async with CASClient(None, api_key, channelPoolSize = channels, hashWorkers = hashworkers, hashProcesses = hashprocesses, retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+            listOf = await markPipBomAs(casClient, reqfile, taskchunk, adaptive, pipnoquiet, nocache, noprogress, notarizepip, ArtifactStatus.UNTRUSTED, batchsize = batchsize, pipeline = pipeline, fromHashes = from_hashes, pipjobs = pipjobs, wheelhouse = store, writer = writer, batchbytes = batchbytes)
+            collectWheelhouse(store, wheelhouse_max_age, wheelhouse_max_size)
+            if(not listOf):
+                sys.exit(1)
+        finishOutput(writer, output)
     sys.exit(0)
 
 @cli.command(name="unsupport", help = "Unsupports pip packages from provided requirements file")
 @click.option('--reqfile', default="requirements.txt", help='Requirements file name')
-@click.option('--taskchunk', default=3, help='Max authorization request per once')
+@click.option('--taskchunk', default=8, show_default = True, help='Max requests in flight')
+@click.option('--adaptive', default=False, is_flag = True, show_default = True, help='Adapts requests in flight to observed latency and server overload, starting from --taskchunk')
+@click.option('--channels', default=1, show_default = True, help='Number of pooled connections to CAS')
+@click.option('--hashworkers', default=0, show_default = True, help='Number of parallel file hashing workers. 0 for automatic')
+@click.option('--hashprocesses', default=False, is_flag = True, show_default = True, help='Hashes files in worker processes instead of threads')
+@click.option('--pipeline', default=False, is_flag = True, show_default = True, help='Hashes and sends files while pip is still downloading')
+@click.option('--pipjobs', default=0, show_default = True, help='Downloads every requirement by separate pip process, this many at once. Requires every requirement including dependencies pinned by == and --hash. 0 for single pip process')
+@click.option('--from-hashes', default=False, is_flag = True, show_default = True, help='Uses --hash pins of requirements file instead of downloading packages')
 @click.option('--pipnoquiet', default=True, is_flag = True, show_default = True, help='Disables output of pip')
 @click.option('--nocache', default=True, is_flag = True, show_default = True, help='Disables cache of pip')
+@click.option('--wheelhouse', default=None, help='Directory of persistent package store reused between runs instead of downloading packages again. Replaces --pipeline and --pipjobs')
+@click.option('--wheelhouse-max-age', default=30, show_default = True, help='Days after which unused packages are removed from wheelhouse. 0 for no limit')
+@click.option('--wheelhouse-max-size', default=0, show_default = True, help='Size of wheelhouse in MiB over which least recently used packages are removed. 0 for no limit')
 @click.option('--api-key', default=None, help='API Key')
 @click.option('--output', default="-", help='Specifies output file. "-" for printing to stdout. NONE for printing nothing')
+@click.option('--format', default="json", type = click.Choice(["json", "ndjson"]), show_default = True, help='Output format. ndjson writes one line per artifact as soon as it is processed')
 @click.option('--noprogress',  default=False, is_flag = True, show_default = True, help='Shows progress bar of action')
 @click.option('--notarizepip', default=False, is_flag = True, show_default = True, help='Notarizing also pip version')
+@click.option('--batchsize', default=1, show_default = True, help='Max artifacts notarized in single ledger transaction')
+@click.option('--batchbytes', default=0, show_default = True, help='Max bytes of single notarization request with --batchsize. 0 for 3 MiB, under default gRPC message limit')
+@click.option('--retries', default=2, show_default = True, help='Retries of CAS reads failed with UNAVAILABLE or DEADLINE_EXCEEDED, with exponential backoff and jitter. 0 disables retrying. Notarization requests are never retried, request which timed out could be already committed')
+@click.option('--retry-backoff', default=0.2, show_default = True, help='Seconds of first backoff between retries, doubled by every next retry')
+@click.option('--rpc-timeout', default=30.0, show_default = True, help='Seconds to wait for single CAS request attempt. 0 for no limit')
+@click.option('--timeout', default=0.0, show_default = True, help='Seconds after which whole command is cancelled and fails. 0 for no limit')
 @asynchronous
-async def unsupport(reqfile, taskchunk, pipnoquiet, nocache, api_key, output, noprogress, notarizepip):
+async def unsupport(reqfile, taskchunk, adaptive, channels, hashworkers, hashprocesses, pipeline, pipjobs, from_hashes, pipnoquiet, nocache, wheelhouse, wheelhouse_max_age, wheelhouse_max_size, api_key, output, format, noprogress, notarizepip, batchsize, batchbytes, retries, retry_backoff, rpc_timeout):
     if(api_key == None):
         api_key = os.environ.get("CAS_API_KEY", None)
         if(api_key == None):
             logger.error("You must provide CAS_API_KEY environment or --api_key argument")
             sys.exit(1)
-    casClient = CASClient(None, api_key)
-    listOf = await markPipBomAs(casClient, reqfile, taskchunk, pipnoquiet, nocache, noprogress, notarizepip, ArtifactStatus.UNSUPPORTED)
-    if(not listOf):
-        sys.exit(1)
-    if(output == "-"):
-        print(listOf.json(indent= 4), flush=True)
-        sys.exit(0)
-    elif(output == "NONE"):
-        pass
-    else:
-        with open(output, "w") as toWrite:
-            toWrite.write(listOf.json(indent= 4))
+    store = openWheelhouse(wheelhouse)
+    with openOutput(output, not noprogress, format) as stream:
+        writer = SbomWriter(stream, indent = 4, format = format, ndjsonField = "artifact") if stream else None
+        async with CASClient(None, api_key, channelPoolSize = channels, hashWorkers = hashworkers, hashProcesses = hashprocesses, retryPolicy = openRetryPolicy(retries, retry_backoff), callTimeout = rpc_timeout if rpc_timeout > 0 else None) as casClient:
+            listOf = await markPipBomAs(casClient, reqfile, taskchunk, adaptive, pipnoquiet, nocache, noprogress, notarizepip, ArtifactStatus.UNSUPPORTED, batchsize = batchsize, pipeline = pipeline, fromHashes = from_hashes, pipjobs = pipjobs, wheelhouse = store, writer = writer, batchbytes = batchbytes)
+            collectWheelhouse(store, wheelhouse_max_age, wheelhouse_max_size)
+            if(not listOf):
+                sys.exit(1)
+        finishOutput(writer, output)
     sys.exit(0)
 
 def main():
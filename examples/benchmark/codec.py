@@ -0,0 +1,39 @@
+from cas_pip.casclient.casclient import Artifact, ArtifactStatus, ArtifactType, artifactCodec
+from cas_pip.casclient import codec
+import sys
+import time
+
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+def makeArtifact(index):
+    return Artifact(
+        signer = "signer@example.com",
+        hash = "%064x" % index,
+        type = ArtifactType.Direct,
+        kind = "file",
+        name = "package-" + str(index) + ".whl",
+        size = 1024 + index,
+        contentType = "application/octet-stream",
+        metadata = {"version": "1.0." + str(index), "pip": True},
+        status = ArtifactStatus.TRUSTED,
+        PublicKey = "key"
+    )
+
+def measure(name, function, items):
+    started = time.perf_counter()
+    for item in items:
+        function(item)
+    elapsed = time.perf_counter() - started
+    print("%-30s %12.0f artifacts/s" % (name, len(items) / elapsed))
+
+
+artifacts = [makeArtifact(index) for index in range(count)]
+encoded = [artifact.json().encode("utf-8") for artifact in artifacts]
+assert encoded == [artifactCodec.encode(artifact) for artifact in artifacts]
+
+print("orjson:", "yes" if codec.orjson else "no, stdlib json")
+measure("encode pydantic json()", lambda artifact: artifact.json().encode("utf-8"), artifacts)
+measure("encode codec", artifactCodec.encode, artifacts)
+measure("decode pydantic parse_raw()", Artifact.parse_raw, encoded)
+measure("decode codec", artifactCodec.decode, encoded)
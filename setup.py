@@ -10,7 +10,7 @@ with open('README.rst') as readme_file:
 with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
-requirements = ['Click>=8.1.3', "grpcio>=1.44.0", "pydantic>=1.9.0", "aiofiles>=0.8.0", "pytz>=2022.1"]
+requirements = ['Click>=8.1.3', "grpcio>=1.44.0", "pydantic>=1.9.0", "pytz>=2022.1"]
 
 test_requirements = [ ]
 
@@ -34,6 +34,9 @@ setup(
         ],
     },
     install_requires=requirements,
+    extras_require={
+        'fast': ['orjson>=3.6'],
+    },
     license="Apache Software License 2.0",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
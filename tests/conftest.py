@@ -0,0 +1,21 @@
+import hashlib
+import os
+import zipfile
+import pytest
+
+
+@pytest.fixture
+def buildWheel():
+    """Returns function writing minimal pure python wheel into directory, which returns (fileName, sha256)"""
+    def build(directory, name, version, requires = ()):
+        fileName = f"{name}-{version}-py3-none-any.whl"
+        path = os.path.join(directory, fileName)
+        distInfo = f"{name}-{version}.dist-info"
+        with zipfile.ZipFile(path, "w") as wheel:
+            wheel.writestr(f"{name}/__init__.py", "")
+            wheel.writestr(f"{distInfo}/METADATA", f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n" + "".join(f"Requires-Dist: {require}\n" for require in requires))
+            wheel.writestr(f"{distInfo}/WHEEL", "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\nTag: py3-none-any\n")
+            wheel.writestr(f"{distInfo}/RECORD", "")
+        with open(path, "rb") as file:
+            return fileName, hashlib.sha256(file.read()).hexdigest()
+    return build
@@ -0,0 +1,108 @@
+"""Tests for local caches of cas_pip."""
+from cas_pip.casclient.caches import HashCache, ResultCache, SqliteResultBackend, OfflineIndex
+import os
+import tempfile
+import time
+
+
+def test_hash_cache():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        cache = HashCache(os.path.join(tmpDir, "hashes.sqlite"))
+        absolute = os.path.join(tmpDir, "test")
+        with open(absolute, "w") as toWrite:
+            toWrite.write("content")
+        old = time.time() - 10
+        os.utime(absolute, (old, old))
+
+        assert cache.get(absolute) == None
+        assert cache.put(absolute, "abc", os.stat(absolute))
+        assert cache.get(absolute) == ("abc", 7)
+
+        # Any stat change makes entry stale
+        os.utime(absolute, (old + 1, old + 1))
+        assert cache.get(absolute) == None
+
+        assert cache.put(absolute, "abc", os.stat(absolute))
+        cache.invalidate(absolute)
+        assert cache.get(absolute) == None
+
+        # Just modified files are not cached
+        with open(absolute, "w") as toWrite:
+            toWrite.write("changed")
+        assert not cache.put(absolute, "def", os.stat(absolute))
+        cache.close()
+
+
+def test_hash_cache_eviction():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        cache = HashCache(os.path.join(tmpDir, "hashes.sqlite"), maxEntries = 2)
+        old = time.time() - 10
+        paths = []
+        for index in range(4):
+            absolute = os.path.join(tmpDir, f"test{index}")
+            with open(absolute, "w") as toWrite:
+                toWrite.write(str(index))
+            os.utime(absolute, (old, old))
+            cache.put(absolute, str(index), os.stat(absolute))
+            paths.append(absolute)
+        cache.get(paths[0])
+        cache.close()
+
+        cache = HashCache(os.path.join(tmpDir, "hashes.sqlite"), maxEntries = 2)
+        assert cache.get(paths[0]) == ("0", 1)
+        assert cache.get(paths[1]) == None
+        assert cache.get(paths[3]) == ("3", 1)
+        cache.close()
+
+
+def test_result_cache():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        backendPath = os.path.join(tmpDir, "results.sqlite")
+        cache = ResultCache(ttl = 60, negativeTtl = 0, maxEntries = 1, backend = SqliteResultBackend(backendPath))
+        assert cache.get("signer", "hash") == (False, None)
+        cache.put("signer", "hash", '{"status": 0}')
+        cache.put("signer", "unknown", None)
+        assert cache.get("signer", "hash") == (True, '{"status": 0}')
+        # negative ttl 0 does not cache not notarized results
+        assert cache.get("signer", "unknown") == (False, None)
+        assert cache.get("other", "hash") == (False, None)
+        cache.close()
+
+        cache = ResultCache(ttl = 60, negativeTtl = 60, backend = SqliteResultBackend(backendPath))
+        assert cache.get("signer", "hash") == (True, '{"status": 0}')
+        cache.put("signer", "unknown", None)
+        assert cache.get("signer", "unknown") == (True, None)
+        cache.invalidate("signer", "hash")
+        assert cache.get("signer", "hash") == (False, None)
+        cache.close()
+
+
+def test_result_cache_expiration():
+    cache = ResultCache(ttl = 0.01, negativeTtl = 0)
+    cache.put("signer", "hash", "value")
+    assert cache.get("signer", "hash") == (True, "value")
+    time.sleep(0.02)
+    assert cache.get("signer", "hash") == (False, None)
+
+
+def test_offline_index():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "index.sqlite")
+        index = OfflineIndex(path)
+        assert index.syncedTx("signer") == 0
+        index.put("signer", [("aa", b"first", 5), ("bb", b"other", 6)])
+        index.put("signer", [("aa", b"older", 3)])
+        assert index.syncCursor("signer") == None
+        index.finishSync("signer", 10, (b"key", 2.0, 0))
+        index.finishSync("signer", 8, (b"older", 1.0, 0))
+        index.finishSync("signer", 10)
+        index.close()
+        index = OfflineIndex(path)
+        assert index.get("signer", "aa") == b"first"
+        assert index.get("other", "aa") == None
+        assert index.syncedTx("signer") == 10
+        assert index.syncCursor("signer") == (b"key", 2.0, 0)
+        assert index._connection.execute("PRAGMA mmap_size").fetchone()[0] == OfflineIndex.mmapSize
+        index.put("signer", [("aa", b"newer", 11)])
+        assert index.get("signer", "aa") == b"newer"
+        index.close()
@@ -145,3 +145,46 @@ async def test_end_to_end_hashes():
     assert what.hash == shaFromDigest
 
 
+
+@pytest.mark.asyncio
+async def test_end_to_end_many():
+    client = CASClient(signerID, apiKey)
+    digests = []
+    artifacts = []
+    for index in range(5):
+        digest = client.getSha256(str(uuid.uuid4()) + str(time.time()))
+        digests.append(digest)
+        artifacts.append(client.buildHashArtifactAs(digest, f"test{index}", ArtifactStatus.TRUSTED))
+
+    notarized = await client.notarizeMany(artifacts, maxBatchSize = 2)
+    assert len(notarized) == 5
+    for index, (name, what, transaction) in enumerate(notarized):
+        assert name == f"test{index}"
+        assert what.hash == digests[index]
+        assert transaction != None
+    # 5 artifacts with batches of 2 goes in 3 transactions
+    assert len(set(item[2].id for item in notarized)) == 3
+
+    for index, digest in enumerate(digests):
+        package, what = await client.authenticateHash(digest, f"test{index}")
+        assert what.status == ArtifactStatus.TRUSTED
+        assert what.hash == digest
+    await client.close()
+
+@pytest.mark.asyncio
+async def test_end_to_end_authenticate_many():
+    client = CASClient(signerID, apiKey)
+    notarizedDigest = client.getSha256(str(uuid.uuid4()) + str(time.time()))
+    unknownDigest = client.getSha256(str(time.time()) + str(uuid.uuid4()))
+    package, what = await client.notarizeHash(notarizedDigest, "test")
+    assert what.status == ArtifactStatus.TRUSTED
+
+    authenticated = await client.authenticateMany([notarizedDigest, unknownDigest], chunkSize = 1)
+    assert authenticated[notarizedDigest].status == ArtifactStatus.TRUSTED
+    assert authenticated[notarizedDigest].hash == notarizedDigest
+    assert authenticated[unknownDigest] == None
+
+    authenticated = await client.authenticateMany([notarizedDigest, unknownDigest])
+    assert authenticated[notarizedDigest].status == ArtifactStatus.TRUSTED
+    assert authenticated[unknownDigest] == None
+    await client.close()
@@ -182,7 +182,89 @@ class TestCas_pip(unittest.TestCase):
             assert jsoned["websockets-8.1.tar.gz"] == 0
             assert jsoned["click-8.1.3-py3-none-any.whl"] == 0
             assert jsoned["starlette-0.17.1-py3-none-any.whl"] == 0
-            
-            
 
 
+def test_authenticate_reuses_cached_hashes(tmp_path, monkeypatch):
+    from cas_pip.casclient.caches import HashCache, OfflineIndex
+    import time
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    reqfile = str(tmp_path / "req.txt")
+    with open(reqfile, "w") as toWrite:
+        toWrite.write("click==8.1.3 --hash=sha256:" + "ab" * 32 + "\n")
+    old = time.time() - 10
+    os.utime(reqfile, (old, old))
+    index = str(tmp_path / "index.sqlite")
+    OfflineIndex(index).close()
+    result = CliRunner().invoke(cli.cli, ["authenticate", "--reqfile", reqfile, "--from-hashes", "--offline-index", index, "--hashcache", "--signerid", signerID, "--noprogress"])
+    assert json.loads(result.output)["statuses"]["~NOTARIZED_REQ_FILE~"] == 2
+    cache = HashCache()
+    assert cache.get(reqfile) == (hashlib.sha256(open(reqfile, "rb").read()).hexdigest(), os.path.getsize(reqfile))
+    cache.close()
+
+
+def test_failed_notarization_writes_no_partial_output(tmp_path, monkeypatch):
+    from cas_pip.casclient import casclient
+    reqfile = str(tmp_path / "req.txt")
+    with open(reqfile, "w") as toWrite:
+        toWrite.write("click==8.1.3 --hash=sha256:" + "ab" * 32 + "\n")
+    async def notarizeArtifact(self, *artifacts):
+        if(any(artifact.name == "~NOTARIZED_REQ_FILE~" for artifact in artifacts)):
+            return False, "unavailable"
+        return True, casclient.TransactionReturn(id = 1, prevAlh = b"", ts = 0, nentries = len(artifacts), eH = b"", blTxId = 0, blRoot = b"", version = 1)
+    monkeypatch.setattr(casclient.GRPCClient, "asyncNotarizeArtifact", notarizeArtifact)
+    output = str(tmp_path / "sbom.json")
+    for format in ("json", "ndjson"):
+        result = CliRunner().invoke(cli.cli, ["notarize", "--reqfile", reqfile, "--from-hashes", "--api-key", "signer.key", "--noprogress", "--taskchunk", "1", "--output", output, "--format", format])
+        assert result.exit_code == 1
+        assert os.listdir(str(tmp_path)) == ["req.txt"]
+    result = CliRunner().invoke(cli.cli, ["notarize", "--reqfile", reqfile, "--from-hashes", "--api-key", "signer.key", "--noprogress", "--taskchunk", "1"])
+    assert result.exit_code == 1
+    assert "{" not in result.stdout
+
+
+def test_notarization_batches_are_scheduled_concurrently(tmp_path, monkeypatch):
+    from cas_pip.casclient import casclient
+    import asyncio
+    reqfile = str(tmp_path / "req.txt")
+    with open(reqfile, "w") as toWrite:
+        toWrite.write("".join(f"pkg{index}==1.0 --hash=sha256:{index:064x}\n" for index in range(7)))
+    batches = []
+    inFlight = [0, 0]
+    async def notarizeArtifact(self, *artifacts):
+        batches.append(len(artifacts))
+        inFlight[0] = inFlight[0] + 1
+        inFlight[1] = max(inFlight)
+        await asyncio.sleep(0.01)
+        inFlight[0] = inFlight[0] - 1
+        return True, casclient.TransactionReturn(id = len(batches), prevAlh = b"", ts = 0, nentries = len(artifacts), eH = b"", blTxId = 0, blRoot = b"", version = 1)
+    monkeypatch.setattr(casclient.GRPCClient, "asyncNotarizeArtifact", notarizeArtifact)
+    result = CliRunner().invoke(cli.cli, ["notarize", "--reqfile", reqfile, "--from-hashes", "--api-key", "signer.key", "--noprogress", "--taskchunk", "3", "--batchsize", "3"])
+    assert result.exit_code == 0
+    assert len(json.loads(result.stdout)["statuses"]) == 8
+    assert batches == [3, 3, 2] and inFlight[1] == 3
+    batches.clear()
+    result = CliRunner().invoke(cli.cli, ["notarize", "--reqfile", reqfile, "--from-hashes", "--api-key", "signer.key", "--noprogress", "--batchsize", "3", "--batchbytes", "1"])
+    assert result.exit_code == 0
+    assert batches == [1] * 8
+
+
+def test_multiget_chunks_are_scheduled_concurrently(tmp_path, monkeypatch):
+    from cas_pip.casclient import casclient
+    import asyncio
+    reqfile = str(tmp_path / "req.txt")
+    with open(reqfile, "w") as toWrite:
+        toWrite.write("".join(f"pkg{index}==1.0 --hash=sha256:{index:064x}\n" for index in range(7)))
+    chunks = []
+    inFlight = [0, 0]
+    async def getArtifactValues(self, *requests):
+        chunks.append(len(requests))
+        inFlight[0] = inFlight[0] + 1
+        inFlight[1] = max(inFlight)
+        await asyncio.sleep(0.01)
+        inFlight[0] = inFlight[0] - 1
+        return True, [None for request in requests]
+    monkeypatch.setattr(casclient.GRPCClient, "asyncGetArtifactValues", getArtifactValues)
+    result = CliRunner().invoke(cli.cli, ["authenticate", "--reqfile", reqfile, "--from-hashes", "--signerid", signerID, "--noprogress", "--taskchunk", "3", "--multiget", "3"])
+    assert result.exit_code == 1
+    assert len(json.loads(result.stdout)["statuses"]) == 8
+    assert chunks == [3, 3, 2] and inFlight[1] == 3
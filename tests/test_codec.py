@@ -0,0 +1,45 @@
+"""Tests for fast Artifact codec."""
+from cas_pip.casclient.casclient import Artifact, ArtifactStatus, ArtifactType, artifactCodec
+import datetime
+import json
+import pytest
+
+
+def makeArtifact(**overrides):
+    values = dict(hash = "ab" * 32, type = ArtifactType.Direct, kind = "file", name = "demo_pkg-1.0-py3-none-any.whl", size = 10,
+        contentType = "application/octet-stream", metadata = {"version": "1.0", "pip": True, "count": 3, "ratio": 0.5},
+        status = ArtifactStatus.TRUSTED, signer = "signer", PublicKey = None)
+    values.update(overrides)
+    return Artifact(**values)
+
+
+@pytest.mark.parametrize("artifact", [
+    makeArtifact(),
+    makeArtifact(type = None, Verbose = True, name = "zażółć \"gęślą\""),
+    makeArtifact(timestamp = datetime.datetime(2022, 6, 1, 10, 0, 0, 123456, tzinfo = datetime.timezone(datetime.timedelta(hours = 2)))),
+    makeArtifact(timestamp = datetime.datetime(2022, 6, 1, 10, 0, 0), metadata = {})
+])
+def test_codec_matches_pydantic(artifact):
+    raw = artifactCodec.encode(artifact)
+    assert raw == artifact.json().encode("utf-8")
+    decoded = artifactCodec.decode(raw)
+    assert decoded == Artifact.parse_raw(raw)
+    assert artifactCodec.encode(decoded) == raw
+
+
+def test_codec_decodes_unusual_values_like_pydantic():
+    document = json.loads(makeArtifact().json())
+    document.update(size = "10", timestamp = 1654077600, unknown = "ignored")
+    del document["PublicKey"]
+    raw = json.dumps(document)
+    decoded = artifactCodec.decode(raw)
+    assert decoded == Artifact.parse_raw(raw)
+    assert decoded.size == 10
+    assert decoded.metadata["pip"] == "True"
+
+
+def test_codec_invalid_artifact_raises():
+    document = json.loads(makeArtifact().json())
+    del document["hash"]
+    with pytest.raises(ValueError):
+        artifactCodec.decode(json.dumps(document))
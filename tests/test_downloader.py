@@ -0,0 +1,101 @@
+"""Tests for streaming download of requirements."""
+from cas_pip.casclient.downloader import StreamingDownload, ShardedPipDownload
+from cas_pip.casclient.hashing import hashFile
+import asyncio
+import hashlib
+import os
+import tempfile
+import pytest
+
+
+async def hashAsync(path):
+    return hashFile(path)
+
+
+@pytest.mark.asyncio
+async def test_streaming_download_yields_files_before_download_ends():
+    contents = {"first.whl": b"first", "second.tar.gz": b"second" * 1000}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        downloadDone = asyncio.Event()
+
+        async def download():
+            for name, content in contents.items():
+                with open(os.path.join(tmpDir, name), "wb") as toWrite:
+                    toWrite.write(content)
+                await asyncio.sleep(0.2)
+            downloadDone.set()
+            return True
+
+        streaming = StreamingDownload(tmpDir, download, hashAsync, pollInterval = 0.02)
+        yielded = dict()
+        beforeEnd = 0
+        async for name, path, hash, size in streaming.files():
+            if(not downloadDone.is_set()):
+                beforeEnd = beforeEnd + 1
+            yielded[name] = (hash, size)
+        assert streaming.succeeded
+        assert beforeEnd > 0
+        for name, content in contents.items():
+            assert yielded[name] == (hashlib.sha256(content).hexdigest(), len(content))
+
+
+@pytest.mark.asyncio
+async def test_streaming_download_failure():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        async def download():
+            return False
+
+        streaming = StreamingDownload(tmpDir, download, hashAsync, pollInterval = 0.02)
+        yielded = [item async for item in streaming.files()]
+        assert yielded == []
+        assert streaming.succeeded == False
+
+
+@pytest.mark.asyncio
+async def test_sharded_pip_download(buildWheel):
+    with tempfile.TemporaryDirectory() as wheelhouse, tempfile.TemporaryDirectory() as tmpDir:
+        expected = dict([buildWheel(wheelhouse, "first_pkg", "1.0"), buildWheel(wheelhouse, "second_pkg", "2.0")])
+        options = ["--no-index", "--find-links " + wheelhouse]
+        sharded = ShardedPipDownload(tmpDir, ["first-pkg==1.0", "second-pkg==2.0"], options, hashAsync, jobs = 2)
+        yielded = {name: hash async for name, path, hash, size in sharded.files()}
+        assert sharded.succeeded
+        assert yielded == expected
+
+        failing = ShardedPipDownload(tmpDir, ["missing-pkg==1.0"], options, hashAsync, jobs = 2)
+        assert [item async for item in failing.files()] == []
+        assert failing.succeeded == False
+
+
+@pytest.mark.asyncio
+async def test_sharded_download_requires_fully_pinned_requirements():
+    from cas_pip.casclient.casclient import CASClient
+    with tempfile.TemporaryDirectory() as tmpDir:
+        reqfile = os.path.join(tmpDir, "requirements.txt")
+        with open(reqfile, "w") as toWrite:
+            toWrite.write("six==1.16.0 --hash=sha256:" + "a" * 64 + "\nclick==8.1.3\n")
+        async with CASClient("signer") as casClient:
+            with pytest.raises(ValueError, match = "click==8.1.3"):
+                casClient.shardPipFiles(tmpDir, reqFile = reqfile)
+
+
+@pytest.mark.asyncio
+async def test_streaming_download_yields_only_complete_files_once():
+    first = b"first" * 1000
+    with tempfile.TemporaryDirectory() as tmpDir:
+        async def download():
+            # Pauses longer than poll interval while file is written must not expose partial file
+            with open(os.path.join(tmpDir, "first.whl"), "wb") as toWrite:
+                toWrite.write(first[:100])
+                toWrite.flush()
+                await asyncio.sleep(0.1)
+                toWrite.write(first[100:])
+            await asyncio.sleep(0.01)
+            with open(os.path.join(tmpDir, "second.whl"), "wb") as toWrite:
+                toWrite.write(b"second")
+            await asyncio.sleep(0.1)
+            return True
+
+        streaming = StreamingDownload(tmpDir, download, hashAsync, pollInterval = 0.02)
+        yielded = [(name, hash) async for name, path, hash, size in streaming.files()]
+        assert streaming.succeeded
+        assert sorted(yielded) == [("first.whl", hashlib.sha256(first).hexdigest()), ("second.whl", hashlib.sha256(b"second").hexdigest())]
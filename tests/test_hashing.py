@@ -0,0 +1,45 @@
+"""Tests for file hashing engine."""
+from cas_pip.casclient.hashing import hashFile
+import hashlib
+import os
+import tempfile
+import pytest
+
+
+@pytest.mark.parametrize("size", [0, 1, 4095, 4096, 4097, 100000, 300000])
+def test_hash_file_strategies(size):
+    content = os.urandom(size)
+    expected = hashlib.sha256(content).hexdigest()
+    with tempfile.TemporaryDirectory() as tmpDir:
+        absolute = os.path.join(tmpDir, "test")
+        with open(absolute, "wb") as toWrite:
+            toWrite.write(content)
+        # direct read, buffered read and mmap
+        assert hashFile(absolute) == (expected, size)
+        assert hashFile(absolute, bufferSize = 4096, mmapThreshold = 0) == (expected, size)
+        assert hashFile(absolute, bufferSize = 4096, mmapThreshold = 8192) == (expected, size)
+
+
+@pytest.mark.asyncio
+async def test_hash_files_cancels_pending_hashing_when_consumer_stops():
+    import asyncio
+    from cas_pip.casclient.casclient import CASClient
+    started = []
+    cancelled = []
+
+    async def generateHashFromFile(absolutePath):
+        started.append(absolutePath)
+        if(absolutePath == "first"):
+            return "a" * 64, 1
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(absolutePath)
+            raise
+
+    async with CASClient("signer") as casClient:
+        casClient.generateHashFromFile = generateHashFromFile
+        hashing = casClient.hashFiles([("first", "first"), ("second", "second"), ("third", "third")])
+        assert await hashing.__anext__() == ("first", "first", "a" * 64, 1)
+        await hashing.aclose()
+    assert sorted(cancelled) == ["second", "third"]
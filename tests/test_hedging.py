@@ -0,0 +1,89 @@
+"""Tests for hedged reads."""
+from cas_pip.casclient.hedging import HedgePolicy, LatencyTracker, hedgedCall
+import asyncio
+import pytest
+
+
+def delayedCalls(delays, started):
+    async def call():
+        index = len(started)
+        started.append(index)
+        await asyncio.sleep(delays[index])
+        if(isinstance(delays[index], float) and delays[index] < 0):
+            raise ValueError("failed")
+        return index
+    return call
+
+
+def test_latency_quantile():
+    tracker = LatencyTracker(window = 100)
+    for latency in range(1, 101):
+        tracker.add(latency / 100)
+    assert tracker.quantile(0.95) == 0.96
+    assert LatencyTracker().quantile(0.95) == None
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_first_response_wins():
+    policy = HedgePolicy(delay = 0.01, maxExtraLoad = 1)
+    started = []
+    assert await hedgedCall(policy, "Get", delayedCalls([1, 0], started)) == 1
+    assert started == [0, 1]
+    assert (policy.calls, policy.hedges, policy.hedgeWins) == (1, 1, 1)
+    started = []
+    assert await hedgedCall(policy, "Get", delayedCalls([0, 0], started)) == 0
+    assert started == [0]
+
+
+@pytest.mark.asyncio
+async def test_hedging_waits_for_samples_and_respects_extra_load():
+    policy = HedgePolicy(maxExtraLoad = 0.25, minSamples = 4)
+    for attempt in range(4):
+        started = []
+        assert await hedgedCall(policy, "Get", delayedCalls([0.001], started)) == 0
+    assert policy.hedges == 0
+    assert policy.hedgeDelay("Get") != None
+    policy = HedgePolicy(delay = 0.01, maxExtraLoad = 0.5)
+    hedged = 0
+    for attempt in range(4):
+        started = []
+        await hedgedCall(policy, "Get", delayedCalls([0.05, 0], started))
+        hedged = hedged + len(started) - 1
+    assert hedged == policy.hedges == 2
+
+
+@pytest.mark.asyncio
+async def test_error_of_one_call_is_covered_by_other():
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise ValueError("failed")
+    calls = []
+    async def call():
+        calls.append(True)
+        if(len(calls) == 1):
+            return await failing()
+        await asyncio.sleep(0.03)
+        return "ok"
+    policy = HedgePolicy(delay = 0.01, maxExtraLoad = 1)
+    assert await hedgedCall(policy, "Get", call) == "ok"
+    with pytest.raises(ValueError):
+        await hedgedCall(HedgePolicy(delay = 0.01, maxExtraLoad = 0), "Get", failing)
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_hedges_reads():
+    from cas_pip.casclient.casclient import GRPCClient, ArtifactAuthorizationRequest
+    client = GRPCClient(api_key = "signer.key", hedgePolicy = HedgePolicy(delay = 0.01, maxExtraLoad = 1))
+    calls = []
+    class Response:
+        class item:
+            class entry:
+                value = b"value"
+    class Stub:
+        async def VerifiableGetExt(self, request, metadata = None, timeout = None):
+            calls.append(True)
+            await asyncio.sleep(1 if len(calls) == 1 else 0)
+            return Response
+    client._getAsyncStub = lambda: Stub()
+    assert await client.asyncGetArtifactValue(ArtifactAuthorizationRequest(hash = "ab" * 32)) == (True, b"value")
+    assert len(calls) == 2
@@ -0,0 +1,91 @@
+"""Tests for resolving requirements from package index metadata."""
+from cas_pip.casclient.index import SimpleIndexClient, IndexFile, resolveRequirements, readInstallReport, missingDependencies
+from cas_pip.casclient.requirements import parseRequirementsFile
+from cas_pip.casclient.casclient import CASClient
+import json
+import os
+import pathlib
+import tempfile
+import pytest
+
+
+def buildIndex(buildWheel, directory, withHashes = True):
+    """Local PEP 503 index with single project, returns (indexUrl, fileName, sha256)"""
+    files = os.path.join(directory, "files")
+    project = os.path.join(directory, "simple", "demo-pkg")
+    os.makedirs(files)
+    os.makedirs(project)
+    fileName, digest = buildWheel(files, "demo_pkg", "1.0")
+    fragment = "#sha256=" + digest if withHashes else ""
+    with open(os.path.join(project, "index.html"), "w") as page:
+        page.write(f'<html><body><a href="../../files/{fileName}{fragment}">{fileName}</a></body></html>')
+    return pathlib.Path(directory, "simple").as_uri(), fileName, digest
+
+
+def test_simple_index_html_fragments(buildWheel):
+    with tempfile.TemporaryDirectory() as tmpDir:
+        indexUrl, fileName, digest = buildIndex(buildWheel, tmpDir)
+        client = SimpleIndexClient(indexUrl)
+        assert client.getFileHash("Demo_Pkg", fileName) == digest
+        assert client.getFileHash("demo-pkg", "missing.whl") == None
+        assert client.getFileHash("other", fileName) == None
+
+
+def test_simple_index_json():
+    client = SimpleIndexClient("https://example.invalid/simple")
+    page = {"files": [{"filename": "demo_pkg-1.0-py3-none-any.whl", "url": "https://example.invalid/demo_pkg-1.0-py3-none-any.whl", "hashes": {"sha256": "AB" * 32}, "size": 10}]}
+    client._fetch = lambda url: ("application/vnd.pypi.simple.v1+json", json.dumps(page).encode("utf-8"))
+    files = client.getProjectFiles("demo-pkg")
+    assert files["demo_pkg-1.0-py3-none-any.whl"].hash == "ab" * 32
+    assert files["demo_pkg-1.0-py3-none-any.whl"].size == 10
+
+
+def test_report_with_directory_is_not_resolved():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        path = os.path.join(tmpDir, "report.json")
+        with open(path, "w") as report:
+            json.dump({"install": [{"download_info": {"url": "file:///src/project", "dir_info": {}}, "metadata": {"name": "project"}}]}, report)
+        assert readInstallReport(path) == None
+
+
+@pytest.mark.asyncio
+async def test_resolve_requirements_from_local_index(buildWheel):
+    with tempfile.TemporaryDirectory() as tmpDir:
+        indexUrl, fileName, digest = buildIndex(buildWheel, tmpDir)
+        reqFile = os.path.join(tmpDir, "requirements.txt")
+        with open(reqFile, "w") as requirements:
+            requirements.write("demo-pkg==1.0\n")
+        files = await resolveRequirements(reqFile, indexUrl = indexUrl)
+        assert [(file.name, file.project, file.hash) for file in files] == [(fileName, "demo-pkg", digest)]
+
+
+@pytest.mark.asyncio
+async def test_hash_index_files_falls_back_to_download(buildWheel):
+    with tempfile.TemporaryDirectory() as tmpDir:
+        indexUrl, fileName, digest = buildIndex(buildWheel, tmpDir, withHashes = False)
+        url = pathlib.Path(tmpDir, "files", fileName).as_uri()
+        files = [
+            IndexFile(name = "known.whl", project = "known", url = "https://example.invalid/known.whl", hash = "00" * 32),
+            IndexFile(name = fileName, project = "demo-pkg", url = url)
+        ]
+        async with CASClient("signer") as casClient:
+            hashed = [item async for item in casClient.hashIndexFiles(files, indexUrl)]
+        assert hashed[0] == ("known.whl", "https://example.invalid/known.whl", "00" * 32, None)
+        assert hashed[1] == (fileName, url, digest, os.path.getsize(url[len("file://"):]))
+
+
+@pytest.mark.asyncio
+async def test_missing_dependencies_of_pinned_requirements(buildWheel):
+    from cas_pip.cli import checkFullyPinned
+    with tempfile.TemporaryDirectory() as tmpDir:
+        appName, appDigest = buildWheel(tmpDir, "demo_app", "1.0", requires = ["demo-dep"])
+        depName, depDigest = buildWheel(tmpDir, "demo_dep", "1.0")
+        reqFile = os.path.join(tmpDir, "requirements.txt")
+        with open(reqFile, "w") as requirements:
+            requirements.write(f"--no-index\n--find-links .\ndemo-app==1.0 --hash=sha256:{appDigest}\n")
+        options = []
+        assert await missingDependencies(parseRequirementsFile(reqFile, options = options), options) == ["demo-dep"]
+        assert not await checkFullyPinned(reqFile, True, True)
+        with open(reqFile, "a") as requirements:
+            requirements.write(f"demo-dep==1.0 --hash=sha256:{depDigest}\n")
+        assert await checkFullyPinned(reqFile, True, True)
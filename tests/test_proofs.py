@@ -0,0 +1,233 @@
+"""Tests for client-side verification of ledger proofs."""
+from cas_pip.casclient.proofs import TrustedState, TrustedStateStore, ProofVerifier, ProofVerificationError, entryDigest, leafFor, txAlh, txInnerHash, verifyEntry, verifyConsistency, setKeyPrefix, plainValuePrefix
+from cas_pip.models import schema_pb2
+import asyncio
+import grpc
+import hashlib
+import pytest
+
+
+def node(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+class Ledger:
+    """Transactions with two entries each, proofs built the way immudb builds them"""
+    def __init__(self):
+        self.headers = dict()
+        self.entries = dict()
+
+    def add(self, entries, blTxId = 0, blRoot = bytes(32)):
+        txId = len(self.headers) + 1
+        digests = [entryDigest(1, setKeyPrefix + key, plainValuePrefix + value) for key, value in entries]
+        header = schema_pb2.TxHeader(id = txId, prevAlh = txAlh(self.headers[txId - 1]) if txId > 1 else bytes(32), ts = 1650000000 + txId,
+            nentries = len(entries), eH = node(leafFor(digests[0]), leafFor(digests[1])), blTxId = blTxId, blRoot = blRoot, version = 1)
+        self.headers[txId] = header
+        self.entries[txId] = (entries, digests)
+        return header
+
+    def verifiableEntry(self, txId, index, sinceTx, value = None):
+        entries, digests = self.entries[txId]
+        key, stored = entries[index]
+        proof = schema_pb2.InclusionProof(leaf = index, width = 2, terms = [leafFor(digests[1 - index])])
+        sourceId, targetId = sorted((sinceTx or txId, txId))
+        source, target = self.headers[sourceId], self.headers[targetId]
+        dual = schema_pb2.DualProof(sourceTxHeader = source, targetTxHeader = target)
+        linearFrom = sourceId
+        if(target.blTxId > 0):
+            dual.lastInclusionProof.extend([leafFor(txAlh(self.headers[1]))])
+            dual.targetBlTxAlh = txAlh(self.headers[target.blTxId])
+        if(sourceId < target.blTxId):
+            dual.inclusionProof.extend([leafFor(txAlh(self.headers[2]))])
+            linearFrom = target.blTxId
+        terms = [txAlh(self.headers[linearFrom])] + [txInnerHash(self.headers[tx]) for tx in range(linearFrom + 1, targetId + 1)]
+        dual.linearProof.CopyFrom(schema_pb2.LinearProof(sourceTxId = linearFrom, TargetTxId = targetId, terms = terms))
+        entry = schema_pb2.Entry(tx = txId, key = key, value = value if value != None else stored)
+        return schema_pb2.VerifiableEntry(entry = entry, verifiableTx = schema_pb2.VerifiableTx(tx = schema_pb2.Tx(header = self.headers[txId]), dualProof = dual), inclusionProof = proof)
+
+
+def buildLedger():
+    ledger = Ledger()
+    ledger.add([(b"vcn.a.1", b"one"), (b"vcn.a.2", b"two")])
+    ledger.add([(b"vcn.a.3", b"three"), (b"vcn.a.4", b"four")])
+    blRoot = node(leafFor(txAlh(ledger.headers[1])), leafFor(txAlh(ledger.headers[2])))
+    ledger.add([(b"vcn.a.5", b"five"), (b"vcn.a.6", b"six")], blTxId = 2, blRoot = blRoot)
+    return ledger
+
+
+def test_first_entry_is_trusted_and_later_entries_are_proven():
+    ledger = buildLedger()
+    state = verifyEntry(ledger.verifiableEntry(1, 1, 0), b"vcn.a.2", TrustedState())
+    assert (state.txId, state.txHash) == (1, txAlh(ledger.headers[1]))
+    newer = verifyEntry(ledger.verifiableEntry(3, 0, 1), b"vcn.a.5", state)
+    assert (newer.txId, newer.txHash) == (3, txAlh(ledger.headers[3]))
+    older = verifyEntry(ledger.verifiableEntry(2, 0, 3), b"vcn.a.3", newer)
+    assert older.txId == 3
+
+
+def test_tampered_responses_are_rejected():
+    ledger = buildLedger()
+    state = verifyEntry(ledger.verifiableEntry(1, 0, 0), b"vcn.a.1", TrustedState())
+    with pytest.raises(ProofVerificationError):
+        verifyEntry(ledger.verifiableEntry(3, 0, 1, value = b"forged"), b"vcn.a.5", state)
+    with pytest.raises(ProofVerificationError):
+        verifyEntry(ledger.verifiableEntry(3, 0, 1), b"vcn.a.6", state)
+    forkedState = TrustedState(db = "ledger", txId = 1, txHash = bytes(32))
+    with pytest.raises(ProofVerificationError):
+        verifyEntry(ledger.verifiableEntry(3, 0, 1), b"vcn.a.5", forkedState)
+
+
+def test_consistency_of_append_only_tree():
+    leaves = [leafFor(bytes([index]) * 32) for index in range(3)]
+    assert verifyConsistency([leaves[0], leaves[1]], 1, 2, leaves[0], node(leaves[0], leaves[1]))
+    assert not verifyConsistency([leaves[0], leaves[2]], 1, 2, leaves[0], node(leaves[0], leaves[1]))
+
+
+def test_verifier_only_moves_state_forward():
+    ledger = buildLedger()
+    class Item:
+        def __init__(self, item):
+            self.item = item
+            self.ledgerName = "ledger"
+    verifier = ProofVerifier()
+    first = verifier.state
+    verifier.verify(Item(ledger.verifiableEntry(3, 0, 0)), b"vcn.a.5", first)
+    verifier.verify(Item(ledger.verifiableEntry(1, 0, 0)), b"vcn.a.1", first)
+    assert verifier.state.txId == 3
+    assert verifier.verified == 2
+
+
+def test_proven_transactions_are_not_proven_again():
+    ledger = buildLedger()
+    class Item:
+        def __init__(self, item):
+            self.item = item
+            self.ledgerName = "ledger"
+    first = TrustedState(db = "ledger", txId = 1, txHash = txAlh(ledger.headers[1]))
+    verifier = ProofVerifier(first)
+    verifier.verify(Item(ledger.verifiableEntry(3, 0, 1)), b"vcn.a.5", first)
+    assert sorted(verifier.knownAlhs) == [1, 2, 3]
+    # Transaction 2 was chained by linear proof of transaction 3, its own dual proof isn't needed
+    chained = ledger.verifiableEntry(2, 0, 1)
+    chained.verifiableTx.dualProof.ClearField("linearProof")
+    with pytest.raises(ProofVerificationError):
+        verifyEntry(chained, b"vcn.a.3", first)
+    verifier.verify(Item(chained), b"vcn.a.3", first)
+    forged = ledger.verifiableEntry(2, 0, 1)
+    forged.verifiableTx.dualProof.targetTxHeader.ts = 1
+    with pytest.raises(ProofVerificationError):
+        verifier.verify(Item(forged), b"vcn.a.3", first)
+
+
+def test_store_keeps_newest_state(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = TrustedStateStore(path)
+    assert store.load("cas", "ledger") == None
+    assert store.save("cas", TrustedState(db = "ledger", txId = 5, txHash = b"5" * 32))
+    assert not store.save("cas", TrustedState(db = "ledger", txId = 3, txHash = b"3" * 32))
+    assert store.save("cas", TrustedState(db = "other", txId = 2, txHash = b"2" * 32))
+    store.close()
+    verifier = ProofVerifier(store = TrustedStateStore(path))
+    verifier.load("cas", "ledger")
+    assert (verifier.state.txId, verifier.state.txHash) == (5, b"5" * 32)
+    verifier.trust(TrustedState(db = "ledger", txId = 9, txHash = b"9" * 32))
+    assert verifier.state.txId == 5
+    verifier.close()
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_reads_current_state_once(tmp_path):
+    from cas_pip.casclient.casclient import GRPCClient, ArtifactAuthorizationRequest
+    from cas_pip.models import lc_pb2_grpc
+    ledger = buildLedger()
+    verifier = ProofVerifier(store = TrustedStateStore(str(tmp_path / "state.sqlite")))
+    client = GRPCClient(api_key = "signer.key", proofVerifier = verifier)
+    client._getKeyForArtifact = lambda artifact: b"vcn.a.5"
+    calls = []
+    class Stub:
+        async def CurrentState(self, request, metadata = None, timeout = None):
+            calls.append(True)
+            await asyncio.sleep(0.01)
+            return schema_pb2.ImmutableState(db = "ledger", txId = 1, txHash = txAlh(ledger.headers[1]))
+        async def VerifiableGetExt(self, request, metadata = None, timeout = None):
+            assert request.proveSinceTx in (1, 3)
+            # Ledger name of response isn't database name of CurrentState
+            return lc_pb2_grpc.lc__pb2.VerifiableItemExt(item = ledger.verifiableEntry(3, 0, request.proveSinceTx), ledgerName = "signer ledger")
+    client._getAsyncStub = lambda: Stub()
+    results = await asyncio.gather(*[client.asyncGetArtifactValue(ArtifactAuthorizationRequest(hash = "ab" * 32)) for _ in range(3)])
+    assert results == [(True, b"five")] * 3
+    assert len(calls) == 1
+    verifier.close()
+    stored = TrustedStateStore(str(tmp_path / "state.sqlite"))
+    assert stored.load(client.path, "ledger").txId == 3
+    assert stored.load(client.path, "signer ledger") == None
+    stored.close()
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_trusts_first_response_when_current_state_fails():
+    from cas_pip.casclient.casclient import GRPCClient, ArtifactAuthorizationRequest
+    from cas_pip.models import lc_pb2_grpc
+    ledger = buildLedger()
+    verifier = ProofVerifier()
+    client = GRPCClient(api_key = "signer.key", proofVerifier = verifier)
+    client._getKeyForArtifact = lambda artifact: b"vcn.a.5"
+    class Error(grpc.RpcError):
+        def code(self):
+            return grpc.StatusCode.PERMISSION_DENIED
+        def details(self):
+            return "denied"
+    class Stub:
+        async def CurrentState(self, request, metadata = None, timeout = None):
+            raise Error()
+        async def VerifiableGetExt(self, request, metadata = None, timeout = None):
+            assert request.proveSinceTx == 0
+            return lc_pb2_grpc.lc__pb2.VerifiableItemExt(item = ledger.verifiableEntry(3, 0, 0), ledgerName = "ledger")
+    client._getAsyncStub = lambda: Stub()
+    assert await client.asyncGetArtifactValue(ArtifactAuthorizationRequest(hash = "ab" * 32)) == (True, b"five")
+    assert verifier.state.txId == 3
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_rejects_entries_that_werent_requested():
+    from cas_pip.casclient.casclient import GRPCClient, ArtifactAuthorizationRequest
+    from cas_pip.models import lc_pb2_grpc
+    ledger = buildLedger()
+    client = GRPCClient(api_key = "signer.key", proofVerifier = ProofVerifier())
+    client._getKeyForArtifact = lambda artifact: b"vcn.a." + artifact.hash.encode("utf-8")
+    responses = []
+    class Stub:
+        async def CurrentState(self, request, metadata = None, timeout = None):
+            return schema_pb2.ImmutableState(db = "ledger", txId = 1, txHash = txAlh(ledger.headers[1]))
+        async def VerifiableGetExtMulti(self, request, metadata = None, timeout = None):
+            items = [lc_pb2_grpc.lc__pb2.VerifiableItemExt(item = ledger.verifiableEntry(txId, index, 1), ledgerName = "ledger") for txId, index in responses]
+            return lc_pb2_grpc.lc__pb2.VerifiableGetExtMultiResponse(items = items)
+    client._getAsyncStub = lambda: Stub()
+    # Responses are matched to requests regardless of their order
+    responses.extend([(3, 1), (3, 0)])
+    assert await client.asyncGetArtifactValues(ArtifactAuthorizationRequest(hash = "5"), ArtifactAuthorizationRequest(hash = "6"), ArtifactAuthorizationRequest(hash = "7")) == (True, [b"five", b"six", None])
+    # Validly proven entry of other key isn't accepted as requested artifact
+    responses[:] = [(3, 1)]
+    status, details = await client.asyncGetArtifactValues(ArtifactAuthorizationRequest(hash = "5"))
+    assert not status and "vcn.a.6" in details
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_fails_multi_get_with_errors_other_than_not_found():
+    from cas_pip.casclient.casclient import GRPCClient, ArtifactAuthorizationRequest
+    from cas_pip.models import lc_pb2_grpc
+    ledger = buildLedger()
+    client = GRPCClient(api_key = "signer.key")
+    client._getKeyForArtifact = lambda artifact: b"vcn.a." + artifact.hash.encode("utf-8")
+    errors = []
+    class Stub:
+        async def VerifiableGetExtMulti(self, request, metadata = None, timeout = None):
+            items = [lc_pb2_grpc.lc__pb2.VerifiableItemExt(item = ledger.verifiableEntry(3, 0, 0), ledgerName = "ledger"), lc_pb2_grpc.lc__pb2.VerifiableItemExt(), lc_pb2_grpc.lc__pb2.VerifiableItemExt()]
+            return lc_pb2_grpc.lc__pb2.VerifiableGetExtMultiResponse(items = items, errors = errors)
+    client._getAsyncStub = lambda: Stub()
+    requests = [ArtifactAuthorizationRequest(hash = hash) for hash in ("5", "7", "8")]
+    errors.extend(["", "key not found", "key not found"])
+    assert await client.asyncGetArtifactValues(*requests) == (True, [b"five", None, None])
+    errors[2] = "tbtree: internal failure"
+    status, details = await client.asyncGetArtifactValues(*requests)
+    assert not status and "vcn.a.8: tbtree: internal failure" in details
@@ -0,0 +1,55 @@
+"""Tests for parsing of requirements files with pinned hashes."""
+from cas_pip.casclient.requirements import parseRequirementsFile
+import os
+import tempfile
+
+firstHash = "a" * 64
+secondHash = "b" * 64
+thirdHash = "C" * 64
+
+
+def test_parse_pinned_requirements():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        with open(os.path.join(tmpDir, "nested.txt"), "w") as toWrite:
+            toWrite.write(f"six==1.16.0 --hash=sha256:{thirdHash} ; python_version >= '3'\n")
+        reqfile = os.path.join(tmpDir, "requirements.txt")
+        with open(reqfile, "w") as toWrite:
+            toWrite.write(f"""# pip-compile output
+--index-url https://pypi.org/simple
+click==8.1.3 \\
+    --hash=sha256:{firstHash} \\
+    --hash=sha256:{secondHash}
+    # via -r requirements.in
+-r nested.txt
+unpinned>=1.0  # comment
+""")
+        requirements = parseRequirementsFile(reqfile)
+        assert [requirement.specifier for requirement in requirements] == ["click==8.1.3", "six==1.16.0", "unpinned>=1.0"]
+        assert requirements[0].name == "click"
+        assert requirements[0].hashes == [firstHash, secondHash]
+        assert requirements[0].artifactName(firstHash) == f"click==8.1.3#sha256={firstHash}"
+        assert requirements[1].hashes == [thirdHash.lower()]
+        assert requirements[2].hashes == []
+
+
+def test_parse_requirement_options():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        reqfile = os.path.join(tmpDir, "requirements.txt")
+        with open(reqfile, "w") as toWrite:
+            toWrite.write(f"--index-url https://pypi.org/simple\n-c constraints.txt\nsix==1.16.0 --hash=sha256:{firstHash} ; python_version >= '3'\n")
+        options = []
+        requirements = parseRequirementsFile(reqfile, options = options)
+        assert options == ["--index-url https://pypi.org/simple"]
+        assert requirements[0].line == f"six==1.16.0 --hash=sha256:{firstHash} ; python_version >= '3'"
+
+
+def test_relative_find_links_are_resolved_against_requirements_file():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        os.makedirs(os.path.join(tmpDir, "nested"))
+        reqfile = os.path.join(tmpDir, "nested", "requirements.txt")
+        with open(reqfile, "w") as toWrite:
+            toWrite.write(f"--find-links ../wheels\n-f https://example.com/wheels\n--find-links=/absolute\nsix==1.16.0 --hash=sha256:{firstHash}\nclick>=8\n")
+        options = []
+        requirements = parseRequirementsFile(reqfile, options = options)
+        assert options == ["--find-links " + os.path.join(tmpDir, "wheels"), "-f https://example.com/wheels", "--find-links=/absolute"]
+        assert [requirement.isFullyPinned() for requirement in requirements] == [True, False]
@@ -0,0 +1,111 @@
+"""Tests for retrying failed CAS requests."""
+from cas_pip.casclient.retry import RetryPolicy, RetryBudget, RetryMetrics, asyncCallWithRetry
+from cas_pip.casclient.casclient import GRPCClient, ArtifactAuthorizationRequest
+import grpc
+import pytest
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code, details = "failed"):
+        self._code = code
+        self._details = details
+
+    def code(self):
+        return self._code
+
+    def details(self):
+        return self._details
+
+
+def failingCall(codes, response = "ok"):
+    calls = []
+    async def call():
+        calls.append(len(calls))
+        if(len(calls) <= len(codes)):
+            raise FakeRpcError(codes[len(calls) - 1])
+        return response
+    return call, calls
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors():
+    policy = RetryPolicy(maxAttempts = 3, initialBackoff = 0.001)
+    metrics = RetryMetrics()
+    call, calls = failingCall([grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED])
+    assert await asyncCallWithRetry(policy, metrics, "Get", call) == "ok"
+    assert len(calls) == 3
+    snapshot = metrics.snapshot()
+    assert snapshot["retries"] == 2
+    assert snapshot["attempts"] == {"Get UNAVAILABLE": 1, "Get DEADLINE_EXCEEDED": 1, "Get OK": 1}
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_other_errors_and_gives_up():
+    policy = RetryPolicy(maxAttempts = 2, initialBackoff = 0.001)
+    metrics = RetryMetrics()
+    call, calls = failingCall([grpc.StatusCode.PERMISSION_DENIED])
+    with pytest.raises(grpc.RpcError):
+        await asyncCallWithRetry(policy, metrics, "Get", call)
+    assert len(calls) == 1
+    call, calls = failingCall([grpc.StatusCode.UNAVAILABLE] * 5)
+    with pytest.raises(grpc.RpcError):
+        await asyncCallWithRetry(policy, metrics, "Get", call)
+    assert len(calls) == 2
+    assert metrics.snapshot()["exhausted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_budget_stops_retries():
+    policy = RetryPolicy(maxAttempts = 10, initialBackoff = 0.001, budget = RetryBudget(maxTokens = 4, tokenRatio = 1))
+    metrics = RetryMetrics()
+    call, calls = failingCall([grpc.StatusCode.UNAVAILABLE] * 10)
+    with pytest.raises(grpc.RpcError):
+        await asyncCallWithRetry(policy, metrics, "Get", call)
+    assert len(calls) == 2
+    assert metrics.snapshot()["throttled"] == 1
+    policy.budget.succeeded()
+    policy.budget.succeeded()
+    call, calls = failingCall([grpc.StatusCode.UNAVAILABLE])
+    assert await asyncCallWithRetry(policy, metrics, "Get", call) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_retries_on_next_stub():
+    client = GRPCClient(api_key = "signer.key", poolSize = 2, retryPolicy = RetryPolicy(initialBackoff = 0.001), callTimeout = 5)
+    used = []
+    class Entry:
+        value = b"value"
+    class Response:
+        class item:
+            entry = Entry
+    class Stub:
+        def __init__(self, index):
+            self.index = index
+        async def VerifiableGetExt(self, request, metadata = None, timeout = None):
+            assert timeout == 5
+            used.append(self.index)
+            if(len(used) == 1):
+                raise FakeRpcError(grpc.StatusCode.UNAVAILABLE)
+            return Response
+    stubs = iter([Stub(0), Stub(1)])
+    client._getAsyncStub = lambda: next(stubs)
+    assert await client.asyncGetArtifactValue(ArtifactAuthorizationRequest(hash = "ab" * 32)) == (True, b"value")
+    assert used == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_grpc_client_does_not_retry_writes():
+    from cas_pip.casclient.casclient import Artifact, ArtifactStatus
+    client = GRPCClient(api_key = "signer.key", retryPolicy = RetryPolicy(initialBackoff = 0.001))
+    calls = []
+    class Stub:
+        async def VCNSetArtifacts(self, request, metadata = None, timeout = None):
+            calls.append(request)
+            raise FakeRpcError(grpc.StatusCode.DEADLINE_EXCEEDED, "deadline exceeded")
+    client._getAsyncStub = lambda: Stub()
+    artifact = Artifact(hash = "ab" * 32, kind = "file", name = "demo.whl", size = 1, contentType = "application/octet-stream", metadata = {}, status = ArtifactStatus.TRUSTED)
+    assert await client.asyncNotarizeArtifact(artifact) == (False, "deadline exceeded")
+    assert len(calls) == 1
+    client.retryWrites = True
+    await client.asyncNotarizeArtifact(artifact)
+    assert len(calls) == 4
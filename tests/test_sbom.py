@@ -0,0 +1,45 @@
+"""Tests for incremental SBOM writer."""
+from cas_pip.casclient.sbom import SbomWriter
+from cas_pip.casclient.casclient import Artifact, ArtifactList, ArtifactStatus, ArtifactStatusList, ArtifactType
+import io
+import json
+import pytest
+
+
+def buildArtifacts(count):
+    artifacts = dict()
+    for number in range(count):
+        artifacts["pąckage-" + str(number) + ".whl"] = Artifact(
+            signer = "signer", hash = str(number) * 64, type = ArtifactType.Direct, kind = "file", name = "package\n" + str(number),
+            size = number, contentType = "application/zip", metadata = {"key": "value", "number": number}, status = ArtifactStatus.TRUSTED, PublicKey = None
+        )
+    return artifacts
+
+
+@pytest.mark.parametrize("count", [0, 1, 3])
+def test_json_is_identical_with_models(count):
+    artifacts = buildArtifacts(count)
+    stream = io.StringIO()
+    writer = SbomWriter(stream, indent = 4)
+    for name, artifact in artifacts.items():
+        writer.write(name, artifact)
+    writer.finish()
+    assert stream.getvalue() == ArtifactList(statuses = artifacts).json(indent = 4)
+
+    statuses = dict((name, ArtifactStatus(number % 3)) for number, name in enumerate(artifacts))
+    stream = io.StringIO()
+    writer = SbomWriter(stream)
+    for name, status in statuses.items():
+        writer.write(name, status)
+    writer.finish()
+    assert stream.getvalue() == ArtifactStatusList(statuses = statuses).json()
+
+
+def test_ndjson_records():
+    stream = io.StringIO()
+    writer = SbomWriter(stream, format = "ndjson", ndjsonField = "status")
+    writer.write("first", ArtifactStatus.TRUSTED)
+    writer.write("second", ArtifactStatus.UNKNOWN)
+    writer.finish()
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == [{"name": "first", "status": 0}, {"name": "second", "status": 2}]
@@ -0,0 +1,101 @@
+"""Tests for bounded concurrency scheduler."""
+from cas_pip.casclient.scheduler import TaskScheduler, AdaptiveConcurrency
+import asyncio
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_keeps_limit_in_flight_and_order():
+    inFlight = [0]
+    maxInFlight = [0]
+    done = []
+
+    async def job(number):
+        inFlight[0] = inFlight[0] + 1
+        maxInFlight[0] = max(maxInFlight[0], inFlight[0])
+        await asyncio.sleep(0.001 * (number % 4))
+        inFlight[0] = inFlight[0] - 1
+        return number
+
+    scheduler = TaskScheduler(3, onDone = done.append)
+    results = await scheduler.run([job(number) for number in range(20)])
+    assert results == list(range(20))
+    assert maxInFlight[0] == 3
+    assert sorted(done) == list(range(20))
+
+
+@pytest.mark.asyncio
+async def test_async_source():
+    async def job(number):
+        return number * 2
+
+    async def source():
+        for number in range(5):
+            await asyncio.sleep(0)
+            yield job(number)
+
+    results = await TaskScheduler(2).run(source())
+    assert results == [0, 2, 4, 6, 8]
+
+
+@pytest.mark.asyncio
+async def test_exception_propagates():
+    async def job(number):
+        if(number == 2):
+            raise ValueError("bad")
+        await asyncio.sleep(0.01)
+        return number
+
+    with pytest.raises(ValueError):
+        await TaskScheduler(2).run([job(number) for number in range(10)])
+
+
+def test_adaptive_backs_off_on_overload():
+    controller = AdaptiveConcurrency(8, maximum = 16)
+    for _ in range(8):
+        controller.onCompleted(0.01)
+    assert controller.current == 9
+    assert controller.onCompleted(0.01, overloaded = True) == 4
+    controller.onCompleted(1.0)
+    assert controller.current == 3
+
+
+@pytest.mark.asyncio
+async def test_ordered_results_are_reported_early():
+    ordered = []
+    seenWhenLastStarted = []
+
+    async def job(number):
+        if(number == 5):
+            seenWhenLastStarted.append(list(ordered))
+        await asyncio.sleep(0.001 * ((7 - number) % 3))
+        return number
+
+    results = await TaskScheduler(2, onOrdered = ordered.append).run([job(number) for number in range(6)])
+    assert ordered == results == list(range(6))
+    assert len(seenWhenLastStarted[0]) > 0
+
+
+@pytest.mark.asyncio
+async def test_cancellation_reaches_tasks_and_source():
+    cancelled = []
+    closed = []
+
+    async def job(number):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(number)
+            raise
+
+    async def source():
+        try:
+            for number in range(10):
+                yield job(number)
+        finally:
+            closed.append(True)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(TaskScheduler(3).run(source()), 0.05)
+    assert sorted(cancelled) == [0, 1, 2]
+    assert closed == [True]
@@ -0,0 +1,150 @@
+"""Tests for compact authentication results."""
+from cas_pip.casclient.casclient import CASClient, Artifact, ArtifactStatus, VerificationResult, ArtifactListingError
+from cas_pip.models import schema_pb2
+import asyncio
+from cas_pip.casclient.caches import ResultCache, OfflineIndex
+from cas_pip.casclient.proofs import TrustedState
+import pytest
+
+
+def makeArtifact(hash, status = ArtifactStatus.TRUSTED):
+    return Artifact(signer = "signer", hash = hash, kind = "file", name = "demo_pkg-1.0-py3-none-any.whl", size = 10,
+        contentType = "application/octet-stream", metadata = {"version": "1.0"}, status = status)
+
+
+def test_verification_result_from_value():
+    artifact = makeArtifact("ab" * 32, ArtifactStatus.UNTRUSTED)
+    result = VerificationResult.fromValue(artifact.json().encode("utf-8"))
+    assert (result.hash, result.name, result.status, result.signer, result.timestamp) == (artifact.hash, artifact.name, artifact.status, artifact.signer, artifact.timestamp)
+    assert result.artifact == artifact
+    assert not hasattr(result, "__dict__")
+
+
+def test_verification_result_unusual_value_is_decoded_whole():
+    artifact = makeArtifact("ab" * 32)
+    value = artifact.json().replace('"timestamp": "' + artifact.timestamp.isoformat() + '"', '"timestamp": 1654077600')
+    result = VerificationResult.fromValue(value)
+    assert result.timestamp == Artifact.parse_raw(value).timestamp
+    assert result.artifact == Artifact.parse_raw(value)
+
+
+@pytest.mark.asyncio
+async def test_verify_many_uses_result_cache():
+    ledger = {"aa" * 32: makeArtifact("aa" * 32).json().encode("utf-8")}
+    requested = []
+    async with CASClient("signer", resultCache = ResultCache(ttl = 60, negativeTtl = 60)) as casClient:
+        async def getValues(*requests):
+            requested.extend(request.hash for request in requests)
+            return True, [ledger.get(request.hash, None) for request in requests]
+        casClient.grpcClient.asyncGetArtifactValues = getValues
+        for attempt in range(2):
+            verified = await casClient.verifyMany(["aa" * 32, "bb" * 32])
+            assert verified["aa" * 32].status == ArtifactStatus.TRUSTED
+            assert verified["bb" * 32] == None
+        authenticated = await casClient.authenticateMany(["aa" * 32])
+        assert authenticated["aa" * 32] == verified["aa" * 32].artifact
+    assert requested == ["aa" * 32, "bb" * 32]
+
+
+@pytest.mark.asyncio
+async def test_verify_many_caches_only_confirmed_not_found():
+    from cas_pip.models import lc_pb2_grpc
+    artifact = makeArtifact("aa" * 32)
+    errors = ["", "key not found", "tbtree: internal failure"]
+    async with CASClient("signer", resultCache = ResultCache(ttl = 60, negativeTtl = 60)) as casClient:
+        class Stub:
+            async def VerifiableGetExtMulti(self, request, metadata = None, timeout = None):
+                entries = [schema_pb2.VerifiableEntry(entry = schema_pb2.Entry(key = request.requests[0].keyRequest.key, value = artifact.json().encode("utf-8")))]
+                items = [lc_pb2_grpc.lc__pb2.VerifiableItemExt(item = entry) for entry in entries]
+                return lc_pb2_grpc.lc__pb2.VerifiableGetExtMultiResponse(items = items, errors = errors[:len(request.requests)])
+        casClient.grpcClient._getAsyncStub = lambda: Stub()
+        hashes = ["aa" * 32, "bb" * 32, "cc" * 32]
+        verified = await casClient.verifyMany(hashes)
+        assert list(verified.values()) == [None, None, None]
+        assert [casClient._getCachedValue(hash)[0] for hash in hashes] == [False, False, False]
+        verified = await casClient.verifyMany(hashes[:2])
+        assert verified["aa" * 32].status == ArtifactStatus.TRUSTED and verified["bb" * 32] == None
+        assert [casClient._getCachedValue(hash)[0] for hash in hashes] == [True, True, False]
+
+
+@pytest.mark.asyncio
+async def test_iter_artifacts_pages_with_prefetch():
+    hashes = sorted("%02x" % index * 32 for index in range(5))
+    requested = []
+    async with CASClient("signer") as casClient:
+        keyPrefix = ("vcn." + casClient.grpcClient.signerId + ".").encode("utf-8")
+        entries = [schema_pb2.Entry(key = keyPrefix + hash.encode("utf-8"), tx = index + 1, value = makeArtifact(hash).json().encode("utf-8")) for index, hash in enumerate(hashes)]
+        entries = sorted(entries + [schema_pb2.Entry(key = keyPrefix + b"notartifact", tx = 9, value = b"{}")], key = lambda entry: entry.key)
+        async def scan(requestedPrefix, seekKey, limit, indexedTx = 0):
+            requested.append(seekKey)
+            assert requestedPrefix == keyPrefix
+            page = [entry for entry in entries if entry.key > seekKey][:limit]
+            return True, page
+        casClient.grpcClient.asyncScanArtifacts = scan
+        listed = []
+        async for result in casClient.iterArtifacts(since = 1, pageSize = 2):
+            # Next page is already requested while first one is consumed
+            await asyncio.sleep(0)
+            assert len(requested) >= 2
+            listed.append((result.hash, result.txId))
+        assert listed == [(hash, index + 1) for index, hash in enumerate(hashes)][1:]
+        assert len(requested) == 4
+
+        async def failing(keyPrefix, seekKey, limit, indexedTx = 0):
+            return False, "unavailable"
+        casClient.grpcClient.asyncScanArtifacts = failing
+        with pytest.raises(ArtifactListingError):
+            async for result in casClient.iterArtifacts():
+                pass
+
+
+@pytest.mark.asyncio
+async def test_sync_index_is_incremental_and_authenticates_offline(tmp_path):
+    index = OfflineIndex(str(tmp_path / "index.sqlite"))
+    ledger = {"aa" * 32: (3, makeArtifact("aa" * 32)), "bb" * 32: (5, makeArtifact("bb" * 32, ArtifactStatus.UNTRUSTED))}
+    scans = []
+    transferred = []
+    async with CASClient("signer") as casClient:
+        keyPrefix = ("vcn." + casClient.grpcClient.signerId + ".").encode("utf-8")
+        insertions = [(float(tx), keyPrefix + hash.encode("utf-8")) for hash, (tx, artifact) in ledger.items()]
+        def entryFor(key):
+            tx, artifact = ledger[key[len(keyPrefix):].decode("utf-8")]
+            return schema_pb2.Entry(key = key, tx = tx, value = artifact.json().encode("utf-8"))
+        async def currentState():
+            return True, TrustedState(db = "ledger", txId = max(tx for tx, artifact in ledger.values()))
+        async def scan(requestedPrefix, seekKey, limit, indexedTx = 0):
+            scans.append(indexedTx)
+            entries = [entryFor(keyPrefix + hash.encode("utf-8")) for hash in sorted(ledger)]
+            return True, [entry for entry in entries if entry.key > seekKey][:limit]
+        async def scanSortedSet(setName, seek = None, limit = 1000, desc = False, indexedTx = 0):
+            assert setName == b"_INDEX.ITEM.INSERTION-DATE." + casClient.grpcClient.signerId.encode("utf-8")
+            members = sorted(insertions, reverse = desc)
+            if(seek != None):
+                members = [(score, key) for score, key in members if (score, key) > (seek[1], seek[0])]
+            page = [schema_pb2.ZEntry(set = setName, key = key, score = score, entry = entryFor(key)) for score, key in members[:limit]]
+            if(not desc):
+                transferred.append(len(page))
+            return True, page
+        casClient.grpcClient.asyncCurrentState = currentState
+        casClient.grpcClient.asyncScanArtifacts = scan
+        casClient.grpcClient.asyncScanSortedSet = scanSortedSet
+        assert await casClient.syncIndex(index) == (True, 2)
+        assert index.syncCursor(casClient.grpcClient.signerId) == (keyPrefix + b"bb" * 32, 5.0, 0)
+        assert scans == [5, 5]
+        ledger["aa" * 32] = (7, makeArtifact("aa" * 32, ArtifactStatus.REVOKED))
+        insertions.append((7.0, keyPrefix + b"aa" * 32))
+        assert await casClient.syncIndex(index, pageSize = 1) == (True, 1)
+        assert index.syncedTx(casClient.grpcClient.signerId) == 7
+        # Only first sync lists artifacts by key, unchanged ledger transfers nothing
+        transferred.clear()
+        assert await casClient.syncIndex(index) == (True, 0)
+        assert scans == [5, 5] and transferred == [0]
+        assert index.syncCursor(casClient.grpcClient.signerId) == (keyPrefix + b"aa" * 32, 7.0, 0)
+    async with CASClient("signer", offlineIndex = index) as casClient:
+        async def unreachable(*requests):
+            raise AssertionError("ledger must not be read")
+        casClient.grpcClient.asyncGetArtifactValue = unreachable
+        casClient.grpcClient.asyncGetArtifactValues = unreachable
+        verified = await casClient.verifyMany(["aa" * 32, "bb" * 32, "cc" * 32])
+        assert (verified["aa" * 32].status, verified["bb" * 32].status, verified["cc" * 32]) == (ArtifactStatus.REVOKED, ArtifactStatus.UNTRUSTED, None)
+        assert (await casClient.verifyHash("bb" * 32, "package"))[1].status == ArtifactStatus.UNTRUSTED
@@ -0,0 +1,62 @@
+"""Tests for persistent package store."""
+from cas_pip.casclient.wheelhouse import Wheelhouse, WheelhouseDownload
+from cas_pip.casclient.hashing import hashFile
+import hashlib
+import os
+import pathlib
+import tempfile
+import time
+import pytest
+
+
+async def hashAsync(path):
+    return hashFile(path)
+
+
+def writeFile(directory, name, content):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as toWrite:
+        toWrite.write(content)
+    return path, hashlib.sha256(content).hexdigest()
+
+
+def test_add_get_and_collect():
+    with tempfile.TemporaryDirectory() as tmpDir:
+        wheelhouse = Wheelhouse(os.path.join(tmpDir, "wheelhouse"))
+        oldPath, oldHash = writeFile(tmpDir, "old-1.0.tar.gz", b"old" * 100)
+        newPath, newHash = writeFile(tmpDir, "new-1.0.tar.gz", b"new" * 100)
+        stored = wheelhouse.add(oldPath, oldHash)
+        assert wheelhouse.get(oldHash) == stored
+        assert os.path.basename(stored) == "old-1.0.tar.gz"
+        assert wheelhouse.get(newHash) == None
+        wheelhouse.add(newPath, newHash)
+        assert wheelhouse.size() == 600
+
+        past = time.time() - 3600
+        os.utime(os.path.dirname(stored), (past, past))
+        assert wheelhouse.collect(maxSize = 400) == 1
+        assert wheelhouse.get(oldHash) == None
+        assert wheelhouse.get(newHash) != None
+        assert wheelhouse.collect(maxAge = 600) == 0
+
+
+@pytest.mark.asyncio
+async def test_second_download_reuses_stored_packages(buildWheel):
+    with tempfile.TemporaryDirectory() as tmpDir:
+        links = os.path.join(tmpDir, "links")
+        os.makedirs(links)
+        fileName, digest = buildWheel(links, "demo_pkg", "1.0")
+        reqFile = os.path.join(tmpDir, "requirements.txt")
+        with open(reqFile, "w") as requirements:
+            requirements.write("demo-pkg==1.0\n")
+        wheelhouse = Wheelhouse(os.path.join(tmpDir, "wheelhouse"))
+        pipArgs = ["--no-index", "--find-links", pathlib.Path(links).as_uri()]
+
+        for expectedReused in (0, 1):
+            with wheelhouse.temporaryDirectory() as downloadDir:
+                download = WheelhouseDownload(wheelhouse, downloadDir, reqFile, hashAsync, additionalPipArgs = pipArgs)
+                yielded = [(name, hash) async for name, path, hash, size in download.files()]
+                assert download.succeeded
+                assert download.reused == expectedReused
+                assert yielded == [(fileName, digest)]
+                assert os.listdir(downloadDir) == ([fileName] if expectedReused == 0 else [])